@@ -0,0 +1,45 @@
+import logging
+from langgraph.constants import TAG_NOSTREAM
+from utils.AgentState import AgentState, COMPACTION_ROLE
+from utils.deadline import DEADLINE_LLM_RESERVE, DeadlineExceeded, has_budget
+from utils.history import HISTORY_KEEP_MESSAGES, format_messages, history_tokens, needs_compaction
+from utils.llm_calls import invoke_llm
+
+def compaction_agent(llm, state: AgentState):
+    """
+    Compaction agent function that keeps the session history within the token window: once it is exceeded,
+    the older messages are summarized, together with the previous summary, and dropped from the history.
+    Compaction is deferred to a later turn when the request budget is short.
+
+    Args:
+        llm: The language model used to write the summary.
+        state (AgentState): The current conversation state, including the new user message.
+
+    Returns:
+        dict: The compaction marker and the new summary, or no update when the history fits the window.
+    """
+    if not needs_compaction(state) or not has_budget(state.deadline, DEADLINE_LLM_RESERVE, "compaction"):
+        return {}
+
+    older = state.messages[:-HISTORY_KEEP_MESSAGES]
+    logging.info(f"Compacting {len(older)} messages (~{history_tokens(state)} history tokens) into the session summary")
+
+    summary_prompt = f"""
+        Summarize the following conversation between a user and an assistant in a few sentences.
+        Keep the facts, names, preferences and open questions the assistant may need to answer follow-up messages.
+
+        Previous summary: {state.summary or "None"}
+
+        Conversation:
+        {format_messages(older)}
+    """
+    try:
+        summary_response = invoke_llm(llm, summary_prompt, config={"tags": [TAG_NOSTREAM]}, deadline=state.deadline, name="summary")
+    except DeadlineExceeded:
+        logging.warning("The history summary ran out of the request budget; compaction deferred to a later turn")
+        return {}
+
+    return {
+        "messages": [{"role": COMPACTION_ROLE, "content": str(len(older))}],
+        "summary": summary_response.content.strip(),
+    }
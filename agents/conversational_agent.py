@@ -1,15 +1,155 @@
+import json
 import logging
+import os
+import re
 from utils.AgentState import AgentState
 from langgraph.graph import END
+from langgraph.constants import TAG_NOSTREAM
+from agents.search_agent import search_timeout
+from utils.search_prefetch import search_prefetcher, request_id_of
+from utils.context_packing import CONTEXT_PACKING, pack_context
+from utils.deadline import DEADLINE_LLM_RESERVE, DEADLINE_SEARCH_RESERVE, DeadlineExceeded, has_budget
+from utils.history import conversation_context
+from utils.llm_calls import invoke_llm
+from utils.logging_config import VERBOSE
+from utils.response_cache import response_cache
 
-def conversational_agent(llm, state: AgentState):
+# "combined" drafts the answer and judges whether it needs a web search in a single structured call;
+# "separate" asks the evaluator in a second call. Streamed turns always draft separately: the combined
+# output is JSON, which cannot be streamed to the client token by token.
+DRAFT_MODE = os.getenv("CONVERSATIONAL_DRAFT_MODE", "combined").lower()
+
+# How the drafts were judged: in the combined call, or by the separate evaluator after a malformed output
+draft_stats = {"combined": 0, "fallback": 0}
+
+
+def assess_uncertainty(llm, user_query: str, answer: str, deadline: float = 0.0) -> bool:
+    """
+    Asks the evaluator whether the answer failed to address the user's query.
+    The check is optional: without enough of the request budget left, the answer is kept as certain.
+    """
+    if not has_budget(deadline, DEADLINE_LLM_RESERVE, "uncertainty_check"):
+        return False
+
+    uncertainty_prompt = f"""
+            You are an evaluator that determines if a given response from a large language model (LLM) failed to answer the user's query.
+
+            User Query: {user_query}
+            LLM Response: {answer}
+
+            - If the response does not provide a meaningful, informative, or relevant answer to the user's query, return "true".
+            - If the response is a refusal due to moderation policies, return "true".
+            - If the response explicitly states the model's limitations **without offering a useful alternative or explanation**, return "true".
+            - If the response correctly answers the user's query or provides a reasonable alternative (such as directing the user to another source), return "false".
+
+            Output Format:
+            true or false
+        """
+
+    # The evaluation is internal: keep its tokens out of the streamed answer
+    try:
+        uncertainty_response = invoke_llm(llm, uncertainty_prompt, config={"tags": [TAG_NOSTREAM]}, deadline=deadline, name="uncertainty_check")
+    except DeadlineExceeded:
+        logging.warning("The uncertainty check ran out of the request budget; keeping the draft answer")
+        return False
+    return uncertainty_response.content.strip().lower() == "true"
+
+
+def parse_draft_response(text: str):
+    """
+    Parses the combined draft output: a JSON object with a non-empty "answer" string and a boolean
+    "needs_search" flag, possibly wrapped in a code fence or surrounded by text.
+
+    Returns:
+        tuple: (answer, needs_search), or None when the output is malformed.
+    """
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return None
+
+    try:
+        # strict=False accepts raw newlines inside the answer string
+        data = json.loads(match.group(0), strict=False)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    answer = data.get("answer")
+    needs_search = data.get("needs_search")
+    if isinstance(needs_search, str) and needs_search.strip().lower() in ("true", "false"):
+        needs_search = needs_search.strip().lower() == "true"
+    if not isinstance(answer, str) or not answer.strip() or not isinstance(needs_search, bool):
+        return None
+
+    return answer.strip(), needs_search
+
+
+def with_context(context: str) -> str:
+    """Prompt preamble with the earlier turns of the session, if any."""
+    return f"\n            Conversation so far:\n{context}\n" if context else ""
+
+
+def draft_answer(llm, user_query: str, context: str = "", deadline: float = 0.0, stream: bool = False):
+    """
+    Drafts the answer to the user and judges whether it needs a web search.
+
+    In "combined" mode both come back from a single call returning JSON; a malformed output is used
+    as the draft as is and judged by the separate evaluator, so it costs the second call only then.
+    A streamed draft is always written as plain text and judged separately, so its tokens reach the client.
+
+    Args:
+        llm: The language model used to generate responses.
+        user_query (str): The user's message.
+        context (str): The earlier turns of the session, if any.
+        deadline (float): The request deadline (epoch seconds), 0 for none.
+        stream (bool): Whether the answer tokens are streamed to the client.
+
+    Returns:
+        tuple: (answer, uncertain)
+
+    Raises:
+        DeadlineExceeded: When the draft is not written before the deadline.
+    """
+    if DRAFT_MODE != "combined" or stream:
+        answer = invoke_llm(llm, f"{with_context(context)}Answer the user: {user_query}", deadline=deadline, name="draft").content
+        return answer, assess_uncertainty(llm, user_query, answer, deadline)
+
+    draft_prompt = f"""{with_context(context)}
+            Answer the user: {user_query}
+
+            Then judge your own answer. It needs a web search if it does not provide a meaningful, informative, or relevant answer to the user's query,
+            if it is a refusal due to moderation policies, or if it states your limitations **without offering a useful alternative or explanation**.
+            It does not need a web search if it answers the query or provides a reasonable alternative (such as directing the user to another source).
+
+            Respond only with a JSON object, with no text before or after it:
+            {{"answer": "<your answer to the user>", "needs_search": true or false}}
+        """
+
+    # The raw JSON is not streamed; the parsed answer is delivered with the final response
+    draft_response = invoke_llm(llm, draft_prompt, config={"tags": [TAG_NOSTREAM]}, deadline=deadline, name="draft")
+    parsed = parse_draft_response(draft_response.content)
+    if parsed is not None:
+        draft_stats["combined"] += 1
+        return parsed
+
+    logging.warning(f"Malformed draft output, falling back to the separate evaluator: {draft_response.content}")
+    draft_stats["fallback"] += 1
+    answer = draft_response.content.strip()
+    return answer, assess_uncertainty(llm, user_query, answer, deadline)
+
+
+def conversational_agent(llm, state: AgentState, config: dict = None):
     """
     Conversational agent function that processes user queries, determines whether web search is needed,
-    and generates responses using a language model (LLM).
+    and generates responses using a language model (LLM). The uncertainty check, the search and the answer
+    from the snippets are skipped when too little of the request budget is left. First-turn questions are
+    answered from the semantic response cache when a similar question was answered recently.
 
     Args:
         llm: The language model used to generate responses.
         state (AgentState): The current state of the conversation, including messages and search status.
+        config (dict): The graph run configuration, whose thread id keys the speculative search prefetch.
 
     Returns:
         dict: Updated state with messages, response flags, and next action.
@@ -17,30 +157,55 @@ def conversational_agent(llm, state: AgentState):
     user_query = state.messages[-1]["content"]
     logging.info(f"Processing user query: {user_query}")
     
-    updated_messages = state.messages.copy()
+    # Messages added by this step; the history reducer appends them to the session
+    new_messages = []
+
+    # Earlier turns of the session (summary and recent messages), empty on the first turn
+    context = conversation_context(state)
+
+    # Only answers that do not depend on earlier turns are cached, unless the request bypasses the cache
+    first_turn_cache = response_cache if not context else None
+    cacheable = first_turn_cache is not None and state.use_response_cache
     
-    # If web snippets are available, use them to enhance the response
-    if state.web_snippets:
+    # If web snippets are available, use them to enhance the response, unless the request is out of budget:
+    # the draft answer, which is the last message, is then the final one
+    if state.web_snippets and has_budget(state.deadline, DEADLINE_LLM_RESERVE, "snippet_answer"):
         logging.info("Web snippets detected. Generating response based on them.")
+
+        # The last message is the draft answer; the question is the last user message
+        question = next((msg["content"] for msg in reversed(state.messages) if msg["role"] == "user"), user_query)
+
+        # Deduplicated, ranked passages within the token budget, each citing its source
+        if CONTEXT_PACKING:
+            web_context = pack_context(question, state.web_snippets)["context"]
+        else:
+            web_context = [snippet["content"] for snippet in state.web_snippets]
         
-        snippet_prompt = f"""
-            Using the provided web snippets: {state.web_snippets}, attempt to answer the user's question: {user_query}.
+        snippet_prompt = f"""{with_context(context)}
+            Web snippets:
+            {web_context}
+
+            Using the provided web snippets, attempt to answer the user's question: {question}.
 
             If the snippets contain relevant information, craft a well-structured response using them and explicitly list them as sources.
 
             If the snippets are not relevant or do not sufficiently answer the question, state that you were unable to provide a complete answer despite reviewing them, but still mention them as sources.
         """
 
-        response_with_snippets = llm.invoke(snippet_prompt)
-        updated_messages.append({
-            "role": "assistant",
-            "content": response_with_snippets.content
-        })
-        
-        logging.info(f"Generated response using web snippets: {response_with_snippets.content}")
+        try:
+            response_with_snippets = invoke_llm(llm, snippet_prompt, deadline=state.deadline, name="snippet_answer")
+            new_messages.append({
+                "role": "assistant",
+                "content": response_with_snippets.content
+            })
+            logging.info("Generated response using web snippets: %s", response_with_snippets.content, extra=VERBOSE)
+            if cacheable:
+                response_cache.store(question, response_with_snippets.content)
+        except DeadlineExceeded:
+            logging.warning("The answer from the web snippets ran out of the request budget; keeping the draft answer")
         
         return {
-            "messages": updated_messages,
+            "messages": new_messages,
             "response_generated": True,
             "search_needed": False,
             "search_attempted": False,
@@ -53,7 +218,7 @@ def conversational_agent(llm, state: AgentState):
     if state.response_generated:
         logging.info("Response already generated. Skipping additional processing.")
         return {
-            "messages": updated_messages,
+            "messages": new_messages,
             "response_generated": True,
             "search_needed": False,
             "search_attempted": False,
@@ -64,39 +229,55 @@ def conversational_agent(llm, state: AgentState):
     
     # If search was not yet attempted, generate an initial response
     if not state.search_attempted:
-        llm_response = llm.invoke(f"Answer the user: {user_query}")
-        updated_messages.append({
-            "role": "assistant",
-            "content": llm_response.content
-        })
-        
-        # Evaluate response uncertainty
-        uncertainty_prompt = f"""
-            You are an evaluator that determines if a given response from a large language model (LLM) failed to answer the user's query.
+        cached = None
+        if first_turn_cache is not None:
+            cached = first_turn_cache.lookup(user_query, bypass=not state.use_response_cache)
+        if cached is not None:
+            new_messages.append({
+                "role": "assistant",
+                "content": cached[0]
+            })
+            logging.info("Answered from the response cache. Sending to moderation.")
+            return {
+                "messages": new_messages,
+                "response_generated": True,
+                "search_needed": False,
+                "search_attempted": False,
+                "web_snippets": [],
+                "allowed": True,
+                "next": "moderation"
+            }
 
-            User Query: {user_query}
-            LLM Response: {llm_response.content}
+        # Optionally start the web search while the draft is written, in case the draft turns out uncertain,
+        # within the budget the search agent would give it
+        request_id = request_id_of(config)
+        if search_prefetcher is not None:
+            search_prefetcher.start(request_id, user_query, search_timeout(state))
 
-            - If the response does not provide a meaningful, informative, or relevant answer to the user's query, return "true".
-            - If the response is a refusal due to moderation policies, return "true".
-            - If the response explicitly states the model's limitations **without offering a useful alternative or explanation**, return "true".
-            - If the response correctly answers the user's query or provides a reasonable alternative (such as directing the user to another source), return "false".
+        answer, uncertainty = draft_answer(llm, user_query, context, state.deadline, state.stream_answer)
 
-            Output Format:
-            true or false
-        """
-        
-        logging.info(f"Messages updated: {updated_messages}")
+        # The search is optional: an uncertain draft is kept when too little of the request budget is left
+        search_skipped = uncertainty and not has_budget(state.deadline, DEADLINE_SEARCH_RESERVE, "search")
+        if search_skipped:
+            uncertainty = False
+        # A draft kept for lack of budget is not cached, a later request may have the time to search
+        if cacheable and not uncertainty and not search_skipped:
+            response_cache.store(user_query, answer)
+        if search_prefetcher is not None and not uncertainty:
+            search_prefetcher.discard(request_id)
+        new_messages.append({
+            "role": "assistant",
+            "content": answer
+        })
         
-        uncertainty_response = llm.invoke(uncertainty_prompt)
-        uncertainty = uncertainty_response.content.strip().lower() == "true"
+        logging.info("Messages added: %s", new_messages, extra=VERBOSE)
         logging.info(f"Uncertainty detected: {uncertainty}")
         
         # If the response is uncertain and no search has been attempted, trigger a web search
         if uncertainty and not state.web_snippets and not state.search_attempted:
             logging.info("Triggering web search due to uncertainty and lack of snippets.")
             return {
-                "messages": updated_messages,
+                "messages": new_messages,
                 "response_generated": False,
                 "search_needed": True,
                 "search_attempted": False,
@@ -107,7 +288,7 @@ def conversational_agent(llm, state: AgentState):
     
     logging.info("Response finalized. Sending to moderation.")
     return {
-        "messages": updated_messages,
+        "messages": new_messages,
         "response_generated": True,
         "search_needed": False,
         "search_attempted": False,
@@ -1,51 +1,75 @@
 import logging
+import os
+import threading
+import time
+import uuid
+from botocore.config import Config
 from langgraph.graph import StateGraph, START, END
 from langchain_aws import ChatBedrock
-from agents.conversational_agent import conversational_agent
+from agents.conversational_agent import conversational_agent, draft_stats
 from agents.search_agent import web_search_agent
 from agents.moderation_agent import moderation_agent
+from agents.compaction_agent import compaction_agent
 from utils.AgentState import AgentState
+from utils import llm_calls, metrics
+from utils.context_packing import packing_stats
+from utils.deadline import REQUEST_TIMEOUT, deadline_stats
+from utils.logging_config import configure_logging
+from utils.moderation import verdict_cache
+from utils.response_cache import response_cache
 from utils.routings import moderation_routing, conversational_routing
-from langgraph.checkpoint.memory import MemorySaver
+from utils.search_prefetch import search_prefetcher
+from utils.session_store import create_checkpointer
+from utils.stubs import StubChatModel
+from utils.topic_classifier import stats as topic_stats
+from utils.web_search import search_service
 
-def run_graph(user_input: str):
+# Bedrock model used by every agent in the workflow
+BEDROCK_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+# Chat model provider: "bedrock", or "stub" for offline runs (simulated Bedrock latency, no credentials)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "bedrock").lower()
+# Bedrock socket read timeout, in seconds; a call past the request deadline is given up on, so it need not wait longer
+BEDROCK_READ_TIMEOUT = float(os.getenv("BEDROCK_READ_TIMEOUT", str(REQUEST_TIMEOUT or 60)))
+
+# Process-level graph runtime, built once and shared by every request: requests without a session
+# run without any checkpointing, sessions on the bounded session checkpointer
+llm = None
+checkpointer = None
+graph_executor = None
+session_executor = None
+
+_runtime_lock = threading.Lock()
+
+
+def build_workflow(llm, compaction: bool = False) -> StateGraph:
     """
-    Executes the agent workflow, processing user input through moderation, conversational, and web search agents.
-    
+    Defines the agent workflow graph: moderation, conversational and web search agents.
+
     Args:
-        user_input (str): The user's input message.
-    
+        llm: The language model shared by the moderation and conversational agents.
+        compaction (bool): Whether each turn starts by compacting the session history.
+
     Returns:
-        str: The final response message generated by the workflow.
+        StateGraph: The uncompiled workflow.
     """
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler("agent.log"),
-            logging.StreamHandler()
-        ]
-    )
-    
-    agentState = AgentState()
-    
-    # Initialize the language model
-    llm = ChatBedrock(model_id="anthropic.claude-3-haiku-20240307-v1:0", model_kwargs={"temperature": 0.9})
-    
-    # Define the agent workflow graph
     workflow = StateGraph(AgentState)
-    
-    workflow.add_node("conversational", lambda state: conversational_agent(llm, state))
-    workflow.add_node("web_search", web_search_agent)
-    workflow.add_node("moderation", lambda state: moderation_agent(llm, state))
-    
+
+    # Every node is timed and counted as a step of the request trace
+    workflow.add_node("conversational", metrics.instrument_node("conversational", lambda state, config: conversational_agent(llm, state, config)))
+    workflow.add_node("web_search", metrics.instrument_node("web_search", web_search_agent))
+    workflow.add_node("moderation", metrics.instrument_node("moderation", lambda state, config: moderation_agent(llm, state)))
+
     # Define workflow transitions
-    workflow.add_edge(START, "moderation")
+    if compaction:
+        workflow.add_node("compaction", metrics.instrument_node("compaction", lambda state, config: compaction_agent(llm, state)))
+        workflow.add_edge(START, "compaction")
+        workflow.add_edge("compaction", "moderation")
+    else:
+        workflow.add_edge(START, "moderation")
     workflow.add_conditional_edges(
         "moderation",
         moderation_routing,
-        {"conversational": "conversational", END: END} 
+        {"conversational": "conversational", END: END}
     )
     workflow.add_conditional_edges(
         "conversational",
@@ -57,21 +81,176 @@ def run_graph(user_input: str):
         lambda state: "conversational",
         {"conversational": "conversational"}
     )
+
+    return workflow
+
+
+def build_graph_runtime():
+    """
+    Builds the language model client, the session checkpointer and the compiled workflows once per process.
+    Safe to call from concurrent requests; only the first call does any work.
+
+    Returns:
+        CompiledStateGraph: The shared graph executor of requests without a session.
+    """
+    global llm, checkpointer, graph_executor, session_executor
+    if graph_executor is not None:
+        return graph_executor
+
+    with _runtime_lock:
+        if graph_executor is None:
+            configure_logging()
+            logging.info("Building the agent graph runtime")
+
+            llm = create_llm()
+            checkpointer = create_checkpointer()
+            register_component_stats()
+            session_executor = build_workflow(llm, compaction=True).compile(checkpointer=checkpointer)
+            graph_executor = build_workflow(llm).compile()
+
+    return graph_executor
+
+
+def create_llm():
+    """Builds the chat model of the configured provider, reporting its calls to the metrics."""
+    if LLM_PROVIDER == "stub":
+        logging.info("Using the Bedrock stand-in (LLM_PROVIDER=stub)")
+        return StubChatModel(callbacks=[metrics.bedrock_metrics])
+    return ChatBedrock(
+        model_id=BEDROCK_MODEL_ID,
+        model_kwargs={"temperature": 0.9},
+        config=Config(read_timeout=BEDROCK_READ_TIMEOUT),
+        callbacks=[metrics.bedrock_metrics],
+    )
+
+
+def register_component_stats():
+    """Exports the counters kept by the caches, the prefetcher, the session store and the deadlines on /metrics."""
+    metrics.register_stats("agent_draft", lambda: dict(draft_stats))
+    metrics.register_stats("agent_deadline", lambda: dict(deadline_stats))
+    metrics.register_stats("agent_llm_hedging", llm_calls.report)
+    metrics.register_stats("agent_topic_classifier", lambda: dict(topic_stats))
+    metrics.register_stats("agent_context_packing", lambda: dict(packing_stats))
+    metrics.register_stats("agent_search", search_service.stats)
+    metrics.register_stats("agent_session_store", checkpointer.stats)
+    if verdict_cache is not None:
+        metrics.register_stats("agent_moderation_cache", verdict_cache.stats)
+    if search_prefetcher is not None:
+        metrics.register_stats("agent_search_prefetch", search_prefetcher.report)
+    if response_cache is not None:
+        metrics.register_stats("agent_response_cache", response_cache.stats)
+
+
+def new_turn(user_input: str, deadline: float = 0.0, use_response_cache: bool = True, stream_answer: bool = False) -> dict:
+    """Graph input of a request: the user message, appended to the session history, the request deadline, the cache and streaming flags and reset per-turn flags."""
+    return {
+        "messages": [{"role": "user", "content": user_input}],
+        "web_snippets": [],
+        "search_needed": False,
+        "search_attempted": False,
+        "response_generated": False,
+        "allowed": True,
+        "deadline": deadline,
+        "use_response_cache": use_response_cache,
+        "stream_answer": stream_answer,
+    }
+
+
+def _run_config(thread_id: str) -> dict:
+    """Run configuration of a request: its checkpoint thread, and its own id, which keys per-request state such as prefetches."""
+    return {"configurable": {"thread_id": thread_id, "request_id": uuid.uuid4().hex}}
+
+
+def _release_request(config: dict):
+    """Drops any unused search prefetch of a finished request."""
+    if search_prefetcher is not None:
+        search_prefetcher.discard(config["configurable"]["request_id"])
+
+
+def run_graph(user_input: str, session_id: str = None, deadline: float = 0.0, use_response_cache: bool = True):
+    """
+    Executes the agent workflow, processing user input through moderation, conversational, and web search agents.
     
-    # Set up checkpointing
-    checkpointer = MemorySaver()
-    graph_executor = workflow.compile(checkpointer=checkpointer)
-    
-    # Initialize the conversation state
-    messages = [{"role": "user", "content": user_input}]
-    initial_state = AgentState(messages=messages, web_snippets=[], search_needed=False, search_attempted=False)
-    
-    logging.info("Starting the agent execution")
+    Args:
+        user_input (str): The user's input message.
+        session_id (str): Optional session whose history the message continues. Without it, the request is stateless.
+        deadline (float): Deadline of the request (epoch seconds), 0 for none. Optional steps are skipped as it nears.
+        use_response_cache (bool): Whether a first-turn question may be answered from the semantic response cache.
     
+    Returns:
+        str: The final response message generated by the workflow.
+
+    Raises:
+        DeadlineExceeded: When the request ran out of its budget before an answer was drafted.
+    """
+    executor = build_graph_runtime()
+    if session_id:
+        executor = session_executor
+
+    # Sessions continue on their own checkpoint thread
+    thread_id = session_id or uuid.uuid4().hex
+    config = _run_config(thread_id)
+    logging.info(f"Starting the agent execution (thread_id={thread_id})")
+
     # Execute the workflow
-    final_output = graph_executor.invoke(initial_state, config={"configurable": {"thread_id": 3}})
+    try:
+        with metrics.observe_run("invoke"):
+            final_output = executor.invoke(new_turn(user_input, deadline, use_response_cache), config=config)
+    finally:
+        _release_request(config)
     
     # Retrieve and return the final response
     state = dict(final_output)
     
     return state["messages"][-1]["content"]
+
+
+async def astream_graph(user_input: str, session_id: str = None, deadline: float = 0.0, use_response_cache: bool = True):
+    """
+    Async counterpart of run_graph that reports progress while the workflow runs.
+    The agents are invoked with the LangGraph streaming callbacks, so answer tokens are
+    yielded as the language model produces them.
+
+    Args:
+        user_input (str): The user's input message.
+        session_id (str): Optional session whose history the message continues.
+        deadline (float): Deadline of the request (epoch seconds), 0 for none.
+        use_response_cache (bool): Whether a first-turn question may be answered from the semantic response cache.
+
+    Yields:
+        tuple: (event, data) pairs. `node` when a graph node finishes (with the node name and the elapsed
+            time), `token` for each answer token and `answer` with the final response.
+    """
+    executor = build_graph_runtime()
+    if session_id:
+        executor = session_executor
+
+    thread_id = session_id or uuid.uuid4().hex
+    config = _run_config(thread_id)
+    logging.info(f"Starting the streamed agent execution (thread_id={thread_id})")
+
+    start = time.perf_counter()
+    final_state = None
+    try:
+        with metrics.observe_run("stream"):
+            async for mode, chunk in executor.astream(new_turn(user_input, deadline, use_response_cache, stream_answer=True), config=config, stream_mode=["updates", "messages", "values"]):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+
+                if mode == "messages":
+                    message, metadata = chunk
+                    if message.content:
+                        yield "token", {"node": metadata.get("langgraph_node"), "content": message.content}
+                    continue
+
+                for node, update in chunk.items():
+                    event = {"node": node, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+                    # A draft answer followed by a search is replaced by the answer built from the snippets
+                    if node == "conversational":
+                        event["search_needed"] = bool((update or {}).get("search_needed"))
+                    yield "node", event
+    finally:
+        _release_request(config)
+
+    yield "answer", {"response": final_state["messages"][-1]["content"]}
@@ -1,12 +1,26 @@
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from utils.moderation import llamaguard_moderation
 from langgraph.graph import END
 from utils.AgentState import AgentState
+from utils.deadline import check_deadline
+from utils.logging_config import VERBOSE
+
+# Runs the Llama Guard verdict and the civil engineering check of each request concurrently
+MODERATION_CONCURRENT_CHECKS = os.getenv("MODERATION_CONCURRENT_CHECKS", "true").lower() == "true"
+MODERATION_WORKERS = int(os.getenv("MODERATION_WORKERS", "16"))
+
+moderation_executor = ThreadPoolExecutor(
+    max_workers=MODERATION_WORKERS,
+    thread_name_prefix="moderation",
+) if MODERATION_CONCURRENT_CHECKS else None
 
 def moderation_agent(llm, state: AgentState):
     """
     Moderation agent function that evaluates user messages for safety violations using llamaguard_moderation.
     If the content is deemed unsafe, it returns a flagged response; otherwise, it proceeds to the next step.
+    Moderation is required, so a request whose deadline passes before it has a verdict fails.
 
     Args:
         llm: The language model used for moderation evaluation.
@@ -14,6 +28,9 @@ def moderation_agent(llm, state: AgentState):
 
     Returns:
         dict: Updated state with moderation results and the next action.
+
+    Raises:
+        DeadlineExceeded: When the request ran out of its budget before the verdict.
     """
     if not state.messages:
         logging.error("No messages found in state.")
@@ -24,17 +41,18 @@ def moderation_agent(llm, state: AgentState):
 
     # Handle user messages
     if last_message["role"] == "user":
-        guardrails_eval = llamaguard_moderation(llm, last_message["content"])
-        logging.info(f"Moderation Result: {guardrails_eval}")
+        check_deadline(state.deadline, "moderation")
+        guardrails_eval = llamaguard_moderation(llm, last_message["content"], executor=moderation_executor, deadline=state.deadline)
+        logging.info("Moderation Result: %s", guardrails_eval, extra=VERBOSE)
 
         if guardrails_eval.get("allowed") == "UNSAFE":
             logging.info("Content flagged as unsafe.")
-            updated_messages = state.messages + [{
+            refusal = {
                 "role": "assistant",
                 "content": f"The content is not allowed based on our safety policy: {guardrails_eval.get('flagged_categories')}"
-            }]
+            }
             return {
-                "messages": updated_messages,
+                "messages": [refusal],
                 "web_snippets": state.web_snippets,
                 "search_needed": state.search_needed,
                 "search_attempted": state.search_attempted,
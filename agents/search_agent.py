@@ -1,18 +1,25 @@
 import logging
-import os
-import json
 from utils.AgentState import AgentState
-from langchain_community.tools.tavily_search import TavilySearchResults
+from utils.deadline import DEADLINE_LLM_RESERVE, remaining
+from utils.web_search import search_web
+from utils.search_prefetch import search_prefetcher, request_id_of
 
-# Load API key from environment variable
-TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+def search_timeout(state: AgentState):
+    """Seconds the search may take within the request budget (0 when none is left), or None without a deadline."""
+    if not state.deadline:
+        return None
+    return max(0.0, remaining(state.deadline) - DEADLINE_LLM_RESERVE)
 
-def web_search_agent(state: AgentState):
+
+def web_search_agent(state: AgentState, config: dict = None):
     """
-    Web search agent function that performs a web search using TavilySearchResults and retrieves relevant snippets.
+    Web search agent function that performs a web search through the shared search service (Tavily) and retrieves relevant snippets.
+    Results prefetched while the draft answer was written are used instead of searching again.
+    The search waits no longer than the request budget, less the time kept for the answer from its snippets.
     
     Args:
         state (AgentState): The current state of the conversation, including search status and messages.
+        config (dict): The graph run configuration, whose thread id keys the prefetched search.
     
     Returns:
         dict: Updated state including search results and next action.
@@ -24,39 +31,32 @@ def web_search_agent(state: AgentState):
         logging.info("Web search already performed. Returning to conversational.")
         return {"next": "conversational"}
     
-    # Extract user query
-    user_query = next((msg["content"] for msg in state.messages if msg["role"] == "user"), None)
+    # Extract user query (the latest one in a multi-turn session)
+    user_query = next((msg["content"] for msg in reversed(state.messages) if msg["role"] == "user"), None)
     if not user_query:
         logging.error("No valid user query found.")
         return {"next": "conversational"}
     
     logging.info(f"Performing web search for: {user_query}")
     
-    # Perform web search
-    web_search_tool = TavilySearchResults(max_results=10, api_key=TAVILY_API_KEY)
-    search_results = web_search_tool.invoke({"query": user_query})
-    
-    logging.info(f"Raw Search Results: {search_results}")
-    
-    # Ensure search results are in the expected format
-    if isinstance(search_results, str):
-        try:
-            search_results = json.loads(search_results)
-        except json.JSONDecodeError:
-            logging.error("Failed to parse JSON response from web search.")
-            return {"next": "conversational"}
-    
-    if not isinstance(search_results, list):
-        logging.error(f"Unexpected search results format: {type(search_results)}")
-        return {"next": "conversational"}
+    # Perform web search, unless it was already prefetched. Without results (failure or no budget left)
+    # the search is not retried: the conversational agent keeps the draft answer.
+    search_results = None
+    if search_prefetcher is not None:
+        search_results = search_prefetcher.take(request_id_of(config), user_query, search_timeout(state))
+    if search_results is None:
+        timeout = search_timeout(state)
+        if timeout != 0:
+            search_results = search_web(user_query, timeout)
+    if search_results is None:
+        return {"search_needed": False, "search_attempted": True, "next": "conversational"}
     
-    # Extract relevant snippets
-    snippets = [result.get("content", "") for result in search_results]
+    # Extract relevant snippets, keeping their source for attribution
+    snippets = [{"url": result.get("url", ""), "content": result.get("content", "")} for result in search_results]
     
     logging.info("Web search complete. Returning to conversational agent.")
     
     return {
-        "messages": state.messages, 
         "web_snippets": snippets,
         "search_needed": False,
         "search_attempted": True,
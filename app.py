@@ -1,18 +1,64 @@
 import os
 import logging
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, Response, request, jsonify, make_response
 from agents.graph import run_graph
 from dotenv import load_dotenv
-from utils.model_loader import model, tokenizer 
+from utils import metrics, startup
+from utils.concurrency_limit import RETRY_AFTER_SECONDS, concurrency_limiter
+from utils.deadline import DeadlineExceeded, request_deadline
+from utils.logging_config import configure_logging, is_debug_request, request_logging
+from utils.response_cache import cache_bypassed
+from utils.session_store import valid_session_id
 
 app = Flask(__name__)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
+if concurrency_limiter is not None:
+    metrics.register_stats("agent_concurrency", concurrency_limiter.stats)
+
+# Load the model, the classifiers and the graph runtime in the background; /ready reports progress.
+# Under the pre-fork server only the weights are loaded here, the workers finish startup after forking.
+if startup.PREFORK:
+    startup.preload()
+else:
+    startup.start_background_startup()
 
 @app.route("/chat", methods=["POST"])
 def chat():
+    # Requests over the adaptive concurrency limit are shed; behind the ASGI entry point this was already done before queuing
+    limiter = None if request.environ.get("asgi.scope", {}).get("agent.admitted") else concurrency_limiter
+    if limiter is not None and not limiter.try_acquire():
+        response = make_response(jsonify({"error": "Server is overloaded. Please retry shortly."}), 503)
+        response.headers["Retry-After"] = RETRY_AFTER_SECONDS
+        return response
+
+    start = time.perf_counter()
+    response = None
+    try:
+        response = _traced_chat()
+    finally:
+        if limiter is not None:
+            limiter.release(time.perf_counter() - start, deadline_exceeded=response is not None and response.status_code == 504)
+    return response
+
+def _traced_chat():
+    # The timings of the request are logged under its trace id, taken from X-Trace-Id when the caller sends one
+    trace_id = request.headers.get("X-Trace-Id")
+    debug = is_debug_request(request.headers.get("X-Debug-Log"))
+    with metrics.trace_request(trace_id if metrics.valid_trace_id(trace_id) else None) as trace, request_logging(debug):
+        response = make_response(_chat())
+    response.headers["X-Trace-Id"] = trace.id
+    return response
+
+def _chat():
+    # The latency budget of the request starts when it is accepted
+    deadline = request_deadline()
     try:
+        if not startup.status["ready"]:
+            return jsonify({"error": "Service is starting up. Please retry shortly."}), 503
+
         if not request.is_json:
             return jsonify({"error": "Invalid request format. Expected JSON."}), 400
         
@@ -20,17 +66,42 @@ def chat():
         if "user_input" not in data or not isinstance(data["user_input"], str) or not data["user_input"].strip():
             return jsonify({"error": "Invalid input. 'user_input' must be a non-empty string."}), 400
         
+        session_id = data.get("session_id")
+        if session_id is not None and not valid_session_id(session_id):
+            return jsonify({"error": "Invalid input. 'session_id' must be 1-128 letters, digits or '_.:-'."}), 400
+
         user_input = data["user_input"].strip()
-        result = run_graph(user_input)
-        return jsonify({"response": result})
+        # "Cache-Control: no-cache" asks for a fresh answer instead of a cached answer to a similar question
+        use_response_cache = not cache_bypassed(request.headers.get("Cache-Control"))
+        result = run_graph(user_input, session_id, deadline, use_response_cache)
+        response = {"response": result}
+        if session_id is not None:
+            response["session_id"] = session_id
+        return jsonify(response)
     
+    except DeadlineExceeded as e:
+        logging.warning(f"Request ran out of its latency budget: {e}")
+        return jsonify({"error": "The request could not be completed in time. Please try again later."}), 504
+
     except Exception as e:
         logging.error(f"Unexpected error: {str(e)}", exc_info=True)
         return jsonify({"error": "Internal server error. Please try again later."}), 500
 
 @app.route('/health', methods=['GET'])
 def health():
+    # Still loading is alive (readiness covers it); a failed startup never recovers, so liveness fails to get the pod restarted
+    if startup.status["phase"] == "failed":
+        return jsonify({"status": "unhealthy", "error": startup.status["error"]}), 500
     return jsonify({"status": "healthy"})
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    report = startup.readiness()
+    return jsonify(report), 200 if report["ready"] else 503
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=int(os.getenv("FLASK_RUN_PORT", 5000)), debug=True, use_reloader=False)
@@ -0,0 +1,153 @@
+"""
+ASGI entry point: the async streaming endpoint served next to the Flask API.
+
+`POST /chat/stream` runs the agent workflow on the event loop and answers with server-sent events
+(progress per graph node, answer tokens, then the final response). Every other route, including
+/chat, /health and /ready, is the Flask app mounted as WSGI. Both chat endpoints are behind the adaptive
+concurrency limit, applied here before a request can queue for a thread.
+
+    gunicorn -c gunicorn.conf.py asgi:app
+    uvicorn asgi:app --port 5000
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+from agents.graph import astream_graph
+from app import app as flask_app
+from utils import metrics, startup
+from utils.concurrency_limit import RETRY_AFTER_SECONDS, AdaptiveConcurrencyLimiter, concurrency_limiter
+from utils.deadline import DeadlineExceeded, request_deadline
+from utils.logging_config import is_debug_request, request_logging
+from utils.response_cache import cache_bypassed
+from utils.session_store import valid_session_id
+
+# Threads running the graph nodes of streamed conversations. A conversation only holds one while
+# a node runs, most of which is spent waiting on Bedrock or the search API.
+ASGI_EXECUTOR_THREADS = int(os.getenv("ASGI_EXECUTOR_THREADS", "64"))
+# Threads serving the synchronous Flask routes
+WSGI_THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+# Routes whose requests count against the concurrency limit
+LIMITED_PATHS = {"/chat", "/chat/stream"}
+
+
+class LoadSheddingMiddleware:
+    """
+    Rejects chat requests over the adaptive concurrency limit with 503 before they wait for a thread, and
+    feeds the limiter the latency of the others. Streamed requests are held until their last event is sent.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: AdaptiveConcurrencyLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] not in LIMITED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if not self.limiter.try_acquire():
+            response = JSONResponse({"error": "Server is overloaded. Please retry shortly."}, status_code=503,
+                                    headers={"Retry-After": RETRY_AFTER_SECONDS})
+            await response(scope, receive, send)
+            return
+
+        # Tells the Flask /chat route that the request was already admitted
+        scope["agent.admitted"] = True
+        start = time.perf_counter()
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.limiter.release(time.perf_counter() - start, deadline_exceeded=status == 504 or scope.get("agent.deadline_exceeded", False))
+
+
+def format_event(event: str, data: dict) -> str:
+    """Encodes one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_events(user_input: str, session_id: str = None, trace_id: str = None, debug: bool = False,
+                        deadline: float = 0.0, scope: Scope = None, use_response_cache: bool = True):
+    """Streams the workflow events, reporting failures as an `error` event since the response has already started."""
+    with metrics.trace_request(trace_id), request_logging(debug):
+        try:
+            async for event, data in astream_graph(user_input, session_id, deadline, use_response_cache):
+                yield format_event(event, data)
+        except DeadlineExceeded as e:
+            logging.warning(f"Streamed request ran out of its latency budget: {e}")
+            # The status is already sent; the load shedding middleware learns of the overload from the scope
+            if scope is not None:
+                scope["agent.deadline_exceeded"] = True
+            yield format_event("error", {"error": "The request could not be completed in time. Please try again later."})
+        except Exception as e:
+            logging.error(f"Unexpected error while streaming: {str(e)}", exc_info=True)
+            yield format_event("error", {"error": "Internal server error. Please try again later."})
+    yield format_event("done", {})
+
+
+async def chat_stream(request: Request):
+    # The latency budget of the request starts when it is accepted
+    deadline = request_deadline()
+    if not startup.status["ready"]:
+        return JSONResponse({"error": "Service is starting up. Please retry shortly."}, status_code=503)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Invalid request format. Expected JSON."}, status_code=400)
+
+    if not isinstance(data, dict) or not isinstance(data.get("user_input"), str) or not data["user_input"].strip():
+        return JSONResponse({"error": "Invalid input. 'user_input' must be a non-empty string."}, status_code=400)
+
+    session_id = data.get("session_id")
+    if session_id is not None and not valid_session_id(session_id):
+        return JSONResponse({"error": "Invalid input. 'session_id' must be 1-128 letters, digits or '_.:-'."}, status_code=400)
+
+    trace_id = request.headers.get("X-Trace-Id")
+    if not metrics.valid_trace_id(trace_id):
+        trace_id = uuid.uuid4().hex
+
+    return StreamingResponse(
+        stream_events(data["user_input"].strip(), session_id, trace_id, is_debug_request(request.headers.get("X-Debug-Log")),
+                      deadline, request.scope, not cache_bypassed(request.headers.get("Cache-Control"))),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Trace-Id": trace_id},
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Sync graph nodes run on the loop's default executor; size it for many in-flight conversations
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_THREADS, thread_name_prefix="graph")
+    )
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Mount("/", app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+    ],
+    middleware=[Middleware(LoadSheddingMiddleware, limiter=concurrency_limiter)] if concurrency_limiter is not None else [],
+    lifespan=lifespan,
+)
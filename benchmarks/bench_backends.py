@@ -0,0 +1,58 @@
+"""
+Parity and latency harness for the moderation inference backends.
+
+Loads the model once per backend in a fresh process (see benchmarks/moderation_profile.py), moderates
+the fixed prompt set, and reports load time, memory, per-verdict latency and verdict agreement with
+the eager PyTorch backend. Exits with a non-zero status when a backend falls below --min-agreement.
+
+Usage:
+    python -m benchmarks.bench_backends
+    python -m benchmarks.bench_backends --backends eager compile onnx --scoring logits
+"""
+import argparse
+import statistics
+import sys
+
+from benchmarks.moderation_profile import compare_verdicts, run_profile
+
+BACKENDS = ["eager", "compile", "onnx"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--quantization", default="none", choices=["none", "int8"])
+    parser.add_argument("--scoring", default="generate", choices=["generate", "logits"])
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    args = parser.parse_args()
+
+    backends = ["eager"] + [name for name in args.backends if name != "eager"]
+    reports = {}
+    for name in backends:
+        env = {"MODEL_BACKEND": name, "MODEL_QUANTIZATION": args.quantization, "MODERATION_SCORING": args.scoring}
+        try:
+            reports[name] = run_profile(env)
+        except RuntimeError as e:
+            print(f"{name}: skipped ({str(e).splitlines()[-1]})")
+
+    if "eager" not in reports:
+        sys.exit("The eager reference backend failed to load.")
+
+    failed = False
+    print(f"{'backend':<8} {'load s':>7} {'model MB':>9} {'p50 ms':>8} {'p95 ms':>8} {'agreement':>10}")
+    for name, report in reports.items():
+        latencies = sorted(report["latencies_ms"])
+        agreement = compare_verdicts(reports["eager"], report)
+        failed |= agreement < args.min_agreement
+        print(f"{name:<8} {report['load_seconds']:>7.1f} {report['model_memory_mb']:>9.0f} "
+              f"{statistics.median(latencies):>8.1f} {latencies[int(len(latencies) * 0.95) - 1]:>8.1f} {agreement:>10.3f}")
+
+    fastest = min(reports, key=lambda name: statistics.median(reports[name]["latencies_ms"]))
+    print(f"\nfastest backend: {fastest}")
+    if failed:
+        print(f"FAIL: a backend agrees with eager on fewer than {args.min_agreement:.0%} of the prompts")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
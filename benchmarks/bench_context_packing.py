@@ -0,0 +1,55 @@
+"""
+Input tokens saved by the context packing of web search results.
+
+Searches every query (Tavily by default, SEARCH_PROVIDER=stub for an offline run) and compares the
+snippet list pasted as is into the answer prompt with the packed context: estimated tokens before and
+after, duplicate passages dropped, chunks kept and packing time. Needs TAVILY_API_KEY unless stubbed.
+
+Usage:
+    python -m benchmarks.bench_context_packing --budget 1200
+"""
+import argparse
+import statistics
+import time
+
+from utils.context_packing import pack_context
+from utils.web_search import search_web
+
+QUERIES = [
+    "What was the closing price of the S&P 500 yesterday?",
+    "Who won the most recent Formula 1 Grand Prix?",
+    "What is the weather forecast for Lisbon this weekend?",
+    "What are today's top headlines in technology news?",
+    "What is the latest stable release of Python?",
+    "When is the next total solar eclipse visible in Europe?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=1200)
+    args = parser.parse_args()
+
+    print(f"{'tokens before':>13} {'after':>6} {'saved':>6} {'dups':>5} {'chunks':>9} {'pack ms':>8}  query")
+    saved = []
+    for query in QUERIES:
+        results = search_web(query)
+        if not results:
+            print(f"{'-':>13} {'-':>6} {'-':>6} {'-':>5} {'-':>9} {'-':>8}  {query} (search failed)")
+            continue
+
+        snippets = [{"url": result.get("url", ""), "content": result.get("content", "")} for result in results]
+        start = time.perf_counter()
+        packed = pack_context(query, snippets, token_budget=args.budget)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        saved.append(packed["tokens_before"] - packed["tokens_after"])
+        print(f"{packed['tokens_before']:>13} {packed['tokens_after']:>6} {saved[-1]:>6} {packed['duplicates']:>5} "
+              f"{packed['chunks_used']:>4}/{packed['chunks_total']:<4} {elapsed:>8.2f}  {query}")
+
+    if saved:
+        print(f"\nMean input tokens saved per request: {statistics.mean(saved):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Latency, token spend and search-decision agreement of the draft answer modes.
+
+Runs the draft step of the conversational agent on every prompt with CONVERSATIONAL_DRAFT_MODE=separate
+(answer, then the uncertainty evaluator) and =combined (one JSON call), and reports Bedrock latency, input
+and output tokens per draft, how often the two modes agree on triggering a web search and how often the
+combined output had to fall back to the evaluator. Needs AWS credentials with Bedrock access.
+
+Usage:
+    python -m benchmarks.bench_draft_modes --rounds 2
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from langchain_aws import ChatBedrock
+from agents import conversational_agent
+from agents.graph import BEDROCK_MODEL_ID
+
+# Answerable from the model's knowledge, and questions that need fresh information
+PROMPTS = [
+    "What is the capital of Australia?",
+    "Explain how vaccines train the immune system.",
+    "Give me three tips to improve my sleep schedule.",
+    "Who wrote Pride and Prejudice?",
+    "Recommend three science fiction novels for a long flight.",
+    "What is the difference between a virus and a bacterium?",
+    "What was the closing price of the S&P 500 yesterday?",
+    "Who won the most recent Formula 1 Grand Prix?",
+    "What is the weather forecast for Lisbon this weekend?",
+    "What are today's top headlines in technology news?",
+]
+
+
+class UsageRecorder:
+    """Wraps the chat model to count calls and tokens."""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def invoke(self, prompt, config=None):
+        response = self.llm.invoke(prompt, config=config)
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.calls += 1
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+        return response
+
+
+def run_mode(llm, mode: str, rounds: int) -> dict:
+    conversational_agent.DRAFT_MODE = mode
+    recorder = UsageRecorder(llm)
+    latencies, decisions = [], []
+    for _ in range(rounds):
+        for prompt in PROMPTS:
+            start = time.perf_counter()
+            _, uncertain = conversational_agent.draft_answer(recorder, prompt)
+            latencies.append((time.perf_counter() - start) * 1000)
+            decisions.append(uncertain)
+
+    drafts = len(latencies)
+    return {
+        "p50": statistics.median(latencies),
+        "mean": statistics.mean(latencies),
+        "calls": recorder.calls / drafts,
+        "input_tokens": recorder.input_tokens / drafts,
+        "output_tokens": recorder.output_tokens / drafts,
+        "decisions": decisions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+
+    llm = ChatBedrock(model_id=BEDROCK_MODEL_ID, model_kwargs={"temperature": 0.9})
+    results = {mode: run_mode(llm, mode, args.rounds) for mode in ("separate", "combined")}
+
+    print(f"{'mode':<9} {'p50 ms':>8} {'mean ms':>8} {'calls':>6} {'in tok':>7} {'out tok':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<9} {r['p50']:>8.0f} {r['mean']:>8.0f} {r['calls']:>6.2f} {r['input_tokens']:>7.0f} {r['output_tokens']:>8.0f}")
+
+    pairs = list(zip(results["separate"]["decisions"], results["combined"]["decisions"]))
+    agreement = sum(a == b for a, b in pairs) / len(pairs)
+    stats = conversational_agent.draft_stats
+    print(f"\nSearch decision agreement: {agreement:.1%}")
+    print(f"Combined outputs parsed: {stats['combined']}, fell back to the evaluator: {stats['fallback']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the per-request graph setup overhead, measured on what a request pays end to end.
+
+Runs the corpus through run_graph on the offline stand-ins (LLM_PROVIDER=stub, SEARCH_PROVIDER=stub,
+MODEL_BACKEND=stub, as benchmarks.harness does), first rebuilding the Bedrock client, the workflow and
+the checkpointer on every request (the previous behaviour of run_graph) and then on the shared
+process-level runtime. The stand-in latencies are fixed, so the difference between the runs is the
+setup; the rebuilt Bedrock client is only constructed, the model calls go to the stand-in.
+Reports the request latency of both and the time the per-request setup adds to a request.
+
+Usage:
+    python -m benchmarks.bench_graph_runtime --requests 200
+"""
+import argparse
+import os
+import random
+import statistics
+
+from benchmarks.harness import DEFAULT_CORPUS, NO_CACHES, STAND_INS, drive, load_corpus, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The stand-ins read their configuration at import time
+    os.environ.update({**STAND_INS, **NO_CACHES, "STUB_LATENCY_JITTER": "0"})
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from botocore.config import Config
+    from langchain_aws import ChatBedrock
+    from langgraph.checkpoint.memory import MemorySaver
+    from agents import graph
+    from utils.deadline import request_deadline
+
+    shared_runtime = graph.build_graph_runtime
+
+    def per_request_runtime():
+        """Builds everything from scratch, as run_graph used to do on every call."""
+        ChatBedrock(model_id=graph.BEDROCK_MODEL_ID, model_kwargs={"temperature": 0.9},
+                    config=Config(read_timeout=graph.BEDROCK_READ_TIMEOUT))
+        return graph.build_workflow(graph.create_llm()).compile(checkpointer=MemorySaver())
+
+    prompts = load_corpus(args.corpus)
+    random.Random(args.seed).shuffle(prompts)
+
+    def send(prompt):
+        graph.run_graph(prompt, deadline=request_deadline())
+
+    # Builds the shared runtime and warms up the imports and the stand-ins before either run is measured
+    shared_runtime()
+    drive(send, prompts, args.concurrency, 10)
+
+    print(f"{args.requests} requests at concurrency {args.concurrency}\n")
+    print(f"{'runtime':<14} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    means = {}
+    for name, runtime in (("per-request", per_request_runtime), ("shared", shared_runtime)):
+        graph.build_graph_runtime = runtime
+        latencies, errors, _ = drive(send, prompts, args.concurrency, args.requests)
+        means[name] = statistics.mean(latencies)
+        print(f"{name:<14} {means[name]:>8.1f} {percentile(latencies, 0.5):>8.1f} "
+              f"{percentile(latencies, 0.95):>8.1f} {errors:>7}")
+    graph.build_graph_runtime = shared_runtime
+
+    added = means["per-request"] - means["shared"]
+    print(f"\nper-request setup adds {added:.1f} ms to a request ({added / means['per-request']:.1%} of its latency)")
+
+
+if __name__ == "__main__":
+    main()
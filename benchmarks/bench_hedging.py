@@ -0,0 +1,71 @@
+"""
+Tail latency of the agent workflow with and without hedged model calls.
+
+Runs the corpus through run_graph on the offline stand-ins (as benchmarks.harness does), first without
+hedging and then with it, on the same warmed-up latency windows. The stand-in time to first token is
+log-normal with a wide --jitter, so a few calls are much slower than the rest, like Bedrock under load.
+Reports p50/p95/p99 per mode and the share of model calls that were hedged and won by the hedge.
+
+Usage:
+    python -m benchmarks.bench_hedging --concurrency 8 --requests 400 --jitter 1.0 --min-delay-ms 500
+"""
+import argparse
+import os
+import random
+import time
+
+from benchmarks.harness import DEFAULT_CORPUS, NO_CACHES, STAND_INS, drive, load_corpus, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--jitter", type=float, default=1.0)
+    parser.add_argument("--percentile", type=float, default=0.95, help="latency percentile past which a call is hedged")
+    parser.add_argument("--max-rate", type=float, default=0.1, help="cap on the share of hedged calls")
+    parser.add_argument("--min-delay-ms", type=float, default=1000, help="minimum wait before a hedge")
+    parser.add_argument("--output-tokens", type=int, default=60, help="length of the stand-in answers")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The stand-ins read their configuration at import time
+    os.environ.update({**STAND_INS, **NO_CACHES, "STUB_LATENCY_JITTER": str(args.jitter), "STUB_LLM_SEARCH_RATE": "0",
+                       "STUB_LLM_OUTPUT_TOKENS": str(args.output_tokens)})
+    os.environ.update({"LLM_HEDGE_PERCENTILE": str(args.percentile), "LLM_HEDGE_MAX_RATE": str(args.max_rate),
+                       "LLM_HEDGE_MIN_DELAY_MS": str(args.min_delay_ms)})
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from agents.graph import run_graph
+    from utils import llm_calls
+    from utils.deadline import request_deadline
+
+    prompts = load_corpus(args.corpus)
+    random.Random(args.seed).shuffle(prompts)
+
+    def send(prompt):
+        run_graph(prompt, deadline=request_deadline())
+
+    # Fills the latency windows, so the hedge delays are known from the first measured request
+    drive(send, prompts, args.concurrency, llm_calls.LLM_HEDGE_MIN_SAMPLES * 2)
+
+    print(f"{args.requests} requests at concurrency {args.concurrency}, jitter {args.jitter}\n")
+    print(f"{'hedging':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'hedged':>7} {'won':>7} {'errors':>7}")
+    for hedging in (False, True):
+        llm_calls.LLM_HEDGING = hedging
+        for name in llm_calls.hedge_stats:
+            llm_calls.hedge_stats[name] = 0
+        latencies, errors, _ = drive(send, prompts, args.concurrency, args.requests)
+        stats = llm_calls.hedge_stats
+        hedged = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+        won = stats["hedge_wins"] / stats["hedged"] if stats["hedged"] else 0.0
+        print(f"{'on' if hedging else 'off':<8} {percentile(latencies, 0.50):>8.0f} {percentile(latencies, 0.95):>8.0f} "
+              f"{percentile(latencies, 0.99):>8.0f} {hedged:>7.1%} {won:>7.1%} {errors:>7}")
+        # Lets the calls given up on finish before the next mode is measured
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
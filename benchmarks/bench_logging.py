@@ -0,0 +1,77 @@
+"""
+Time spent in the request threads by the logging of the hot path.
+
+Logs the events of a search request (prompts, message lists, the raw search results...) from --threads
+threads, once with the former synchronous setup (formatting and writing to a file and stderr in the
+request thread) and once through the queue pipeline (payload caps, sampling of the verbose events,
+background writer). Both write to a temporary directory; stderr is redirected to /dev/null.
+
+Usage:
+    python -m benchmarks.bench_logging --requests 2000 --threads 8
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import logging_config, metrics
+
+SEARCH_RESULTS = [{"url": f"https://example.com/page/{i}", "content": "Lorem ipsum dolor sit amet. " * 60} for i in range(10)]
+MESSAGES = [{"role": "user", "content": "What is the weather forecast for Lisbon this weekend?"},
+            {"role": "assistant", "content": "I do not have access to real-time weather data. " * 5}]
+
+
+def log_request(verbose: dict):
+    with metrics.trace_request():
+        logging.info(f"Processing user query: {MESSAGES[0]['content']}")
+        logging.info("Moderation Result: %s", {"allowed": "SAFE", "flagged_categories": []}, extra=verbose)
+        logging.info("Messages added: %s", MESSAGES, extra=verbose)
+        logging.info("Raw Search Results: %s", SEARCH_RESULTS, extra=verbose)
+        logging.info("Generated response using web snippets: %s", MESSAGES[1]["content"], extra=verbose)
+        logging.info("Response finalized. Sending to moderation.")
+
+
+def run(requests: int, threads: int, verbose: dict) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: log_request(verbose), range(requests)))
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    sys.stderr = open(os.devnull, "w")
+    with tempfile.TemporaryDirectory() as directory:
+        root = logging.getLogger()
+        handlers = [logging.FileHandler(os.path.join(directory, "sync.log")), logging.StreamHandler()]
+        for handler in handlers:
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+            root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        sync_us = run(args.requests, args.threads, {})
+        sync_bytes = os.path.getsize(os.path.join(directory, "sync.log"))
+        for handler in handlers:
+            root.removeHandler(handler)
+            handler.close()
+
+        logging_config.LOG_FILE = os.path.join(directory, "queued.log")
+        logging_config.configure_logging()
+        queued_us = run(args.requests, args.threads, logging_config.VERBOSE)
+        logging_config._stop_listener()
+        queued_bytes = os.path.getsize(logging_config.LOG_FILE)
+
+    print(f"{'setup':<10} {'us per request':>15} {'log bytes per request':>22}")
+    print(f"{'sync':<10} {sync_us:>15.1f} {sync_bytes / args.requests:>22.0f}")
+    print(f"{'queued':<10} {queued_us:>15.1f} {queued_bytes / args.requests:>22.0f}")
+    print(f"\nQueued pipeline stats: {logging_config.log_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Overhead of the latency, token and trace instrumentation.
+
+Times the instrumentation primitives (a traced span, a Bedrock callback with token counting, a /metrics
+render), then runs a workflow shaped like the agent graph (moderation, conversational, web search,
+conversational, moderation) whose nodes wait --node-ms each, as the external calls do, with and without
+the instrumented nodes, and reports the overhead per request. No model or API calls are made.
+
+Usage:
+    python -m benchmarks.bench_metrics_overhead --requests 200 --node-ms 5
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langgraph.graph import END, START, StateGraph
+
+from utils import metrics
+from utils.AgentState import AgentState
+
+
+def build_graph(node_seconds: float, instrumented: bool):
+    def node(update):
+        def run(state, config=None):
+            time.sleep(node_seconds)
+            return update(state)
+        return metrics.instrument_node("node", run) if instrumented else run
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("moderation", node(lambda state: {}))
+    workflow.add_node("conversational", node(lambda state: {"search_needed": not state.search_attempted, "response_generated": state.search_attempted}))
+    workflow.add_node("web_search", node(lambda state: {"search_attempted": True}))
+    workflow.add_edge(START, "moderation")
+    workflow.add_conditional_edges("moderation", lambda state: END if state.response_generated else "conversational")
+    workflow.add_conditional_edges("conversational", lambda state: "web_search" if state.search_needed else "moderation")
+    workflow.add_edge("web_search", "conversational")
+    return workflow.compile()
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def traced_span():
+    with metrics.external_call("bench"):
+        pass
+
+
+def bedrock_callback():
+    run_id = uuid.uuid4()
+    metrics.bedrock_metrics.on_chat_model_start({}, [], run_id=run_id, metadata={"langgraph_node": "bench"})
+    message = AIMessage(content="", usage_metadata={"input_tokens": 300, "output_tokens": 50, "total_tokens": 350})
+    metrics.bedrock_metrics.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+
+
+def run_requests(graph, requests: int, instrumented: bool) -> list:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        if instrumented:
+            with metrics.observe_run("bench"):
+                graph.invoke({"messages": [{"role": "user", "content": "hello"}]})
+        else:
+            graph.invoke({"messages": [{"role": "user", "content": "hello"}]})
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--node-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with metrics.trace_request("bench") as trace:
+        print(f"traced span:      {per_call_us(traced_span, 100000):8.2f} us")
+        print(f"bedrock callback: {per_call_us(bedrock_callback, 20000):8.2f} us")
+        trace.spans.clear()
+    print(f"/metrics render:  {per_call_us(metrics.render, 200):8.2f} us\n")
+
+    results = {}
+    for instrumented in (False, True, False, True):
+        graph = build_graph(args.node_ms / 1000, instrumented)
+        results.setdefault(instrumented, []).extend(run_requests(graph, args.requests, instrumented))
+
+    bare, measured = statistics.median(results[False]), statistics.median(results[True])
+    print(f"{'workflow':<14} {'p50 ms':>8} {'mean ms':>8}")
+    print(f"{'bare':<14} {bare:>8.2f} {statistics.mean(results[False]):>8.2f}")
+    print(f"{'instrumented':<14} {measured:>8.2f} {statistics.mean(results[True]):>8.2f}")
+    print(f"\nOverhead per request: {measured - bare:.3f} ms ({(measured - bare) / bare * 100:.2f}% at {args.node_ms} ms per node)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Throughput benchmark of Llama Guard moderation with and without dynamic micro-batching.
+
+Drives llamaguard_verdict from a pool of client threads at several concurrency levels and reports
+verdicts per second and latency percentiles. Only the local model is exercised (no Bedrock calls).
+
+Usage:
+    python -m benchmarks.bench_moderation_batching --requests 64 --concurrency 1 2 4 8 16
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import moderation
+from utils.batching import MicroBatcher
+
+PROMPTS = [
+    "How do I bake sourdough bread at home?",
+    "Write a poem about the ocean at night.",
+    "What is the capital of Australia?",
+    "Explain how vaccines train the immune system.",
+    "How can I hurt someone without leaving marks?",
+    "Summarise the plot of Hamlet in three sentences.",
+    "Give me tips to improve my sleep schedule.",
+    "Who should I vote for in the next election?",
+]
+
+
+def run(concurrency: int, requests: int, verdict_fn):
+    latencies = []
+
+    def call(i):
+        start = time.perf_counter()
+        verdict_fn(PROMPTS[i % len(PROMPTS)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return requests / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--window-ms", type=float, default=moderation.MODERATION_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch-size", type=int, default=moderation.MODERATION_MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    batcher = MicroBatcher(moderation.moderate_batch, max_batch_size=args.max_batch_size, window_ms=args.window_ms)
+    modes = {
+        "unbatched": lambda text: moderation.moderate_batch([text])[0],
+        "batched": batcher,
+    }
+
+    # Warm up the model (and torch.compile) before measuring
+    modes["unbatched"](PROMPTS[0])
+
+    print(f"{'mode':<10} {'concurrency':>11} {'verdicts/s':>11} {'p50 ms':>9} {'p95 ms':>9}")
+    for concurrency in args.concurrency:
+        for name, verdict_fn in modes.items():
+            throughput, p50, p95 = run(concurrency, args.requests, verdict_fn)
+            print(f"{name:<10} {concurrency:>11} {throughput:>11.2f} {p50:>9.1f} {p95:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
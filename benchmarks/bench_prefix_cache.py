@@ -0,0 +1,69 @@
+"""
+Time-to-verdict benchmark of the cached moderation prompt prefix.
+
+Runs the same Llama Guard generate with the full prompt encoded on every call, and with only the
+per-request suffix encoded on top of the prefix key/value cache built at model load.
+
+Usage:
+    python -m benchmarks.bench_prefix_cache --iterations 20
+"""
+import argparse
+import os
+import statistics
+import time
+
+# The prefix cache requires the input-last prompt layout, enable it before the model loads
+os.environ["MODERATION_PREFIX_CACHE"] = "true"
+
+import torch
+from utils import model_loader
+from utils.moderation import expand_prefix_cache
+
+PROMPTS = [
+    "How do I bake sourdough bread at home?",
+    "Explain how vaccines train the immune system.",
+    "How can I hurt someone without leaving marks?",
+    "Who should I vote for in the next election?",
+]
+
+
+def time_generate(input_ids, use_prefix_cache: bool):
+    start = time.perf_counter()
+    with torch.inference_mode():
+        model_loader.backend.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=expand_prefix_cache(1) if use_prefix_cache else None,
+            max_new_tokens=10,
+            pad_token_id=0,
+        )
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    model_loader.ensure_model_loaded()
+    tokenizer = model_loader.tokenizer
+    prefix = model_loader.prefix_ids[0].tolist()
+    inputs = [
+        torch.tensor([prefix + tokenizer(text + model_loader.prompt_suffix, add_special_tokens=False).input_ids])
+        for text in PROMPTS
+    ]
+    print(f"prefix tokens: {len(prefix)}, mean suffix tokens: "
+          f"{statistics.mean(ids.shape[1] - len(prefix) for ids in inputs):.1f}")
+
+    for use_prefix_cache in (False, True):
+        time_generate(inputs[0], use_prefix_cache)  # Warm up
+        latencies = sorted(
+            time_generate(inputs[i % len(inputs)], use_prefix_cache) for i in range(args.iterations)
+        )
+        name = "prefix cache" if use_prefix_cache else "full prompt"
+        print(f"{name:<13} p50={statistics.median(latencies):8.1f} ms  "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1]:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Parity and performance check of the int8 dynamic-quantized Llama Guard against float32.
+
+Each configuration is loaded in its own process. The script reports load time, memory and
+per-verdict latency, and checks that the quantized verdicts agree with the float32 ones on the
+fixed prompt set in benchmarks/data/moderation_prompts.jsonl. It exits with a non-zero status when
+agreement falls below --min-agreement, so it can gate a rollout.
+
+Usage:
+    python -m benchmarks.bench_quantization --min-agreement 0.95
+"""
+import argparse
+import statistics
+import sys
+
+from benchmarks.moderation_profile import compare_verdicts, load_prompts, run_profile
+
+VARIANTS = {
+    "float32": {"MODEL_QUANTIZATION": "none"},
+    "int8": {"MODEL_QUANTIZATION": "int8"},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    args = parser.parse_args()
+
+    reports = {name: run_profile(env) for name, env in VARIANTS.items()}
+
+    print(f"{'variant':<8} {'load s':>7} {'model MB':>9} {'peak RSS MB':>12} {'p50 ms':>8} {'mean ms':>8}")
+    for name, report in reports.items():
+        latencies = report["latencies_ms"]
+        print(f"{name:<8} {report['load_seconds']:>7.1f} {report['model_memory_mb']:>9.0f} "
+              f"{report['peak_rss_mb']:>12.0f} {statistics.median(latencies):>8.1f} {statistics.mean(latencies):>8.1f}")
+
+    agreement = compare_verdicts(reports["float32"], reports["int8"])
+    print(f"\nverdict agreement with float32: {agreement:.3f} on {len(load_prompts())} prompts")
+    for prompt, reference, candidate in zip(load_prompts(), reports["float32"]["verdicts"], reports["int8"]["verdicts"]):
+        if reference["allowed"] != candidate["allowed"]:
+            print(f"  mismatch: float32={reference['allowed']} int8={candidate['allowed']}  {prompt['text']}")
+
+    if agreement < args.min_agreement:
+        print(f"FAIL: agreement below {args.min_agreement}")
+        sys.exit(1)
+    print("PASS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Hit rate, precision and lookup latency of the semantic response cache by similarity threshold.
+
+The corpus holds groups of paraphrases ("group" and "text" fields), including look-alike questions
+with different answers in separate groups (Australia / Austria, Celsius to Fahrenheit / the reverse).
+The questions are sent once in a shuffled order: a miss stores the answer of its group, a hit is
+correct when the cached question is from the same group and false otherwise. Recall is the share of
+the questions whose group was already cached that hit it. The recommended threshold is the lowest one
+(so the highest hit rate) whose precision reaches --min-precision; RESPONSE_CACHE_THRESHOLD should be
+validated this way on the production embedding model, ideally with a corpus of real questions.
+
+--graph also runs the corpus through run_graph on the offline stand-ins with the cache on (at the first
+--threshold) and reports the mean latency of hits and misses.
+
+Usage:
+    python -m benchmarks.bench_response_cache --embedder transformers --thresholds 0.85 0.9 0.92 0.95 0.97
+    python -m benchmarks.bench_response_cache --embedder hashing --thresholds 0.6 0.7 0.8 --graph
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from benchmarks.harness import STAND_INS, percentile
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "data", "paraphrases.jsonl")
+
+
+def load_corpus(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(cache, questions: list, threshold: float):
+    cache.clear()
+    cache.threshold = threshold
+
+    cached_groups, hits, false_hits, repeats, latencies = set(), 0, 0, 0, []
+    for question in questions:
+        repeats += question["group"] in cached_groups
+        start = time.perf_counter()
+        cached = cache.lookup(question["text"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        if cached is None:
+            cache.store(question["text"], str(question["group"]))
+            cached_groups.add(question["group"])
+        elif cached[0] == str(question["group"]):
+            hits += 1
+        else:
+            false_hits += 1
+
+    lookups = hits + false_hits
+    precision = hits / lookups if lookups else 1.0
+    print(f"{threshold:>9.2f} {(hits + false_hits) / len(questions):>8.1%} {precision:>10.1%} "
+          f"{hits / repeats if repeats else 0.0:>7.1%} {false_hits:>11} {percentile(latencies, 0.5):>12.2f} {percentile(latencies, 0.95):>12.2f}")
+    # A threshold without any hit has nothing to measure the precision on
+    return precision if lookups else 0.0
+
+
+def run_graph_corpus(questions: list):
+    from agents.graph import run_graph
+    from utils.response_cache import response_cache
+
+    latencies = {True: [], False: []}
+    for question in questions:
+        hits = response_cache.counts["hits"]
+        start = time.perf_counter()
+        run_graph(question["text"])
+        latencies[response_cache.counts["hits"] > hits].append((time.perf_counter() - start) * 1000)
+
+    print(f"\nrun_graph: {len(latencies[True])} hits, mean {statistics.mean(latencies[True] or [0]):.0f} ms; "
+          f"{len(latencies[False])} misses, mean {statistics.mean(latencies[False] or [0]):.0f} ms")
+    print(f"stats: {response_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--embedder", choices=["transformers", "hashing"], default="transformers")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.85, 0.9, 0.92, 0.95, 0.97])
+    parser.add_argument("--min-precision", type=float, default=0.99, help="share of the hits that must be correct")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--graph", action="store_true", help="also run the corpus through run_graph on the stand-ins")
+    args = parser.parse_args()
+
+    # The cache and the stand-ins read their configuration at import time
+    os.environ.update({"RESPONSE_CACHE": "true", "RESPONSE_CACHE_EMBEDDER": args.embedder,
+                       "RESPONSE_CACHE_THRESHOLD": str(args.thresholds[0])})
+    if args.graph:
+        os.environ.update(STAND_INS)
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from utils.response_cache import SemanticResponseCache
+
+    questions = load_corpus(args.corpus)
+    random.Random(args.seed).shuffle(questions)
+
+    cache = SemanticResponseCache(args.embedder)
+    start = time.perf_counter()
+    cache.load()
+    print(f"{args.embedder} embedder loaded in {time.perf_counter() - start:.2f}s, "
+          f"{len(questions)} questions in {len({q['group'] for q in questions})} groups\n")
+
+    print(f"{'threshold':>9} {'hit rate':>8} {'precision':>10} {'recall':>7} {'false hits':>11} {'p50 lookup ms':>12} {'p95 lookup ms':>12}")
+    precise = [threshold for threshold in args.thresholds if evaluate(cache, questions, threshold) >= args.min_precision]
+    if precise:
+        print(f"\nrecommended threshold: {min(precise):.2f} (the lowest with a precision of at least {args.min_precision:.0%})")
+    else:
+        print(f"\nno threshold with hits reaches a precision of {args.min_precision:.0%}")
+
+    if args.graph:
+        run_graph_corpus(questions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Offline benchmark of the search layer: result cache and request coalescing.
+
+Sends --requests searches from --concurrency threads to the stub search provider (simulated network
+latency, no API key needed), drawing queries from a skewed mix where a few queries are frequent
+and spelled with varying case and spacing, as real traffic tends to be. Reports latency, provider calls,
+cache hit rate and coalesced requests with the cache and coalescing disabled vs enabled.
+
+Usage:
+    python -m benchmarks.bench_search_cache --requests 500 --concurrency 16 --latency-ms 300
+"""
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.cache import TTLCache
+from utils.web_search import SearchService, StubSearchClient
+
+TOPICS = [
+    "weather in lisbon this weekend",
+    "latest python release",
+    "who won the champions league final",
+    "s&p 500 closing price yesterday",
+    "best hiking trails near denver",
+    "symptoms of seasonal flu",
+    "how to renew a passport",
+    "electric car tax credits",
+]
+
+
+class UncoalescedService(SearchService):
+    """Baseline: every request goes to the provider."""
+
+    def search(self, query: str):
+        with self.lock:
+            self.provider_calls += 1
+        return self.client.search(query)
+
+
+def make_queries(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(TOPICS))]
+    queries = []
+    for topic in rng.choices(TOPICS, weights=weights, k=count):
+        variant = topic.title() if rng.random() < 0.3 else topic
+        queries.append(variant.replace(" ", "  ", 1) if rng.random() < 0.2 else variant)
+    return queries
+
+
+def run(service, queries: list, concurrency: int) -> dict:
+    def timed(query):
+        start = time.perf_counter()
+        service.search(query)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50": statistics.median(latencies),
+        "p95": statistics.quantiles(latencies, n=100)[94],
+        "rps": len(queries) / elapsed,
+        **service.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    queries = make_queries(args.requests, args.seed)
+    services = {
+        "none": UncoalescedService(StubSearchClient(args.latency_ms)),
+        "coalescing": SearchService(StubSearchClient(args.latency_ms)),
+        "cache": SearchService(StubSearchClient(args.latency_ms), TTLCache(max_entries=1000, ttl_seconds=900)),
+    }
+
+    print(f"{'layer':<11} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8} {'provider calls':>15} {'hit rate':>9} {'coalesced':>10}")
+    for name, service in services.items():
+        r = run(service, queries, args.concurrency)
+        lookups = r.get("cache_hits", 0) + r.get("cache_misses", 0)
+        hit_rate = r.get("cache_hits", 0) / lookups if lookups else 0.0
+        print(f"{name:<11} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['rps']:>8.1f} {r['provider_calls']:>15} "
+              f"{hit_rate:>9.1%} {r['coalesced']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+End-to-end latency of the agent workflow with and without the speculative web search prefetch.
+
+Runs every prompt through run_graph with SEARCH_PREFETCH=off and with the selected --mode, and reports
+the median latency of each, the prefetch hit rate (searches served from a prefetch), the precision
+(prefetches that were used), the wasted searches and the latency saved per request.
+Needs AWS credentials with Bedrock access and TAVILY_API_KEY.
+
+Usage:
+    python -m benchmarks.bench_search_prefetch --mode heuristic --rounds 2
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+# The prefetcher is only created when enabled at import; each run then switches the mode
+os.environ["SEARCH_PREFETCH"] = "heuristic"
+
+from agents.graph import run_graph
+from utils import search_prefetch
+
+# Answerable from the model's knowledge, and questions that need fresh information
+PROMPTS = [
+    "What is the capital of Australia?",
+    "Explain how vaccines train the immune system.",
+    "Recommend three science fiction novels for a long flight.",
+    "What was the closing price of the S&P 500 yesterday?",
+    "Who won the most recent Formula 1 Grand Prix?",
+    "What is the weather forecast for Lisbon this weekend?",
+    "What are today's top headlines in technology news?",
+    "What is the latest stable release of Python?",
+]
+
+
+def run_mode(mode: str, rounds: int) -> dict:
+    search_prefetch.SEARCH_PREFETCH = mode
+    prefetcher = search_prefetch.search_prefetcher
+    before = prefetcher.report()
+
+    latencies = []
+    for _ in range(rounds):
+        for prompt in PROMPTS:
+            start = time.perf_counter()
+            run_graph(prompt)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    after = prefetcher.report()
+    delta = {key: after[key] - before[key] for key in ("started", "hits", "wasted", "misses", "latency_saved_ms")}
+    needed = delta["hits"] + delta["misses"]
+    return {
+        "p50": statistics.median(latencies),
+        "mean": statistics.mean(latencies),
+        "hit_rate": delta["hits"] / needed if needed else 0.0,
+        "precision": delta["hits"] / delta["started"] if delta["started"] else 0.0,
+        "wasted": delta["wasted"],
+        "saved_per_request": delta["latency_saved_ms"] / len(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["heuristic", "always"], default="heuristic")
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'p50 ms':>8} {'mean ms':>8} {'hit rate':>9} {'precision':>10} {'wasted':>7} {'saved ms/req':>13}")
+    for mode in ("off", args.mode):
+        r = run_mode(mode, args.rounds)
+        print(f"{mode:<10} {r['p50']:>8.0f} {r['mean']:>8.0f} {r['hit_rate']:>9.1%} {r['precision']:>10.1%} "
+              f"{r['wasted']:>7} {r['saved_per_request']:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
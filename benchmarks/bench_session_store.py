@@ -0,0 +1,75 @@
+"""
+Stored bytes and checkpoint latency of the chat sessions by conversation length.
+
+Runs --sessions conversations of --turns turns through a minimal LangGraph workflow on the session
+state (no model calls), and compares the unbounded LangGraph MemorySaver, which keeps every checkpoint
+of every step, with the bounded `memory` session store and the `sqlite` store. Reports the bytes held
+after the run and the mean latency of a turn at the start and at the end of the conversations.
+
+Usage:
+    python -m benchmarks.bench_session_store --sessions 200 --turns 20
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from utils.AgentState import AgentState
+from utils.session_store import BoundedMemorySaver, SqliteSaver
+
+ANSWER = "Here is a detailed answer to your question, with a few sentences of explanation. " * 4
+
+
+def build_graph(checkpointer):
+    workflow = StateGraph(AgentState)
+    workflow.add_node("conversational", lambda state: {"messages": [{"role": "assistant", "content": ANSWER}], "response_generated": True})
+    workflow.add_edge(START, "conversational")
+    workflow.add_edge("conversational", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def memory_bytes(saver: MemorySaver) -> int:
+    stored = sum(len(checkpoint[1]) + len(metadata[1])
+                 for namespaces in saver.storage.values()
+                 for checkpoints in namespaces.values()
+                 for checkpoint, metadata, _ in checkpoints.values())
+    return stored + sum(len(write[2][1]) for writes in saver.writes.values() for write in writes.values())
+
+
+def run(name: str, checkpointer, sessions: int, turns: int, stored_bytes):
+    graph = build_graph(checkpointer)
+    latencies = [[] for _ in range(turns)]
+    for turn in range(turns):
+        for session in range(sessions):
+            config = {"configurable": {"thread_id": f"session-{session}"}}
+            start = time.perf_counter()
+            graph.invoke({"messages": [{"role": "user", "content": f"Question number {turn}?"}]}, config=config)
+            latencies[turn].append((time.perf_counter() - start) * 1000)
+
+    first = statistics.mean(latencies[0])
+    last = statistics.mean(latencies[-1])
+    print(f"{name:<12} {stored_bytes(checkpointer) / 1024 / 1024:>10.2f} {first:>14.2f} {last:>13.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.turns} turns\n")
+    print(f"{'store':<12} {'stored MB':>10} {'first turn ms':>14} {'last turn ms':>13}")
+    run("MemorySaver", MemorySaver(), args.sessions, args.turns, memory_bytes)
+    run("memory", BoundedMemorySaver(args.sessions, ttl_seconds=3600, max_bytes=1 << 40), args.sessions, args.turns,
+        lambda saver: saver.stats()["bytes"])
+    with tempfile.TemporaryDirectory() as directory:
+        run("sqlite", SqliteSaver(os.path.join(directory, "sessions.db"), args.sessions, ttl_seconds=3600),
+            args.sessions, args.turns, lambda saver: saver.stats()["bytes"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Time to first byte of /chat vs /chat/stream against a running server, by client concurrency.
+
+/chat only answers once the whole workflow has finished, so its first byte is its full latency.
+For /chat/stream the first byte (response headers and the first event), the first answer token and
+the final `answer` event are timed separately. Start the server first (`gunicorn -c gunicorn.conf.py asgi:app`).
+
+Usage:
+    python -m benchmarks.bench_streaming --url http://127.0.0.1:5000 --concurrency 1 8 32 --requests 64
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PROMPTS = [
+    "What is the capital of Australia?",
+    "Give me tips to improve my sleep schedule.",
+    "Explain how vaccines train the immune system.",
+    "Recommend three science fiction novels for a long flight.",
+]
+
+
+def time_chat(base_url: str, prompt: str) -> dict:
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/chat", json={"user_input": prompt}, timeout=300)
+    response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return {"first_byte": elapsed, "first_token": elapsed, "total": elapsed}
+
+
+def time_chat_stream(base_url: str, prompt: str) -> dict:
+    start = time.perf_counter()
+    timings = {}
+    with requests.post(f"{base_url}/chat/stream", json={"user_input": prompt}, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            timings.setdefault("first_byte", time.perf_counter() - start)
+            if line == "event: token":
+                timings.setdefault("first_token", time.perf_counter() - start)
+            elif line == "event: answer":
+                timings["total"] = time.perf_counter() - start
+    if "total" not in timings:
+        raise RuntimeError(f"Stream ended without an answer for: {prompt}")
+    # Blocked inputs stream no tokens: the answer is the first content
+    timings.setdefault("first_token", timings["total"])
+    return timings
+
+
+def percentile(values: list, q: float) -> float:
+    return statistics.quantiles(values, n=100)[int(q) - 1] if len(values) > 1 else values[0]
+
+
+def run(fn, base_url: str, concurrency: int, total_requests: int) -> dict:
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(total_requests)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda prompt: fn(base_url, prompt), prompts))
+    return {
+        key: {q: percentile([r[key] * 1000 for r in results], q) for q in (50, 95)}
+        for key in ("first_byte", "first_token", "total")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<13} {'conc':>5} {'TTFB p50':>9} {'TTFB p95':>9} {'token p50':>10} {'total p50':>10} {'total p95':>10}")
+    for concurrency in args.concurrency:
+        for name, fn in (("/chat", time_chat), ("/chat/stream", time_chat_stream)):
+            r = run(fn, args.url, concurrency, args.requests)
+            print(f"{name:<13} {concurrency:>5} {r['first_byte'][50]:>9.0f} {r['first_byte'][95]:>9.0f} "
+                  f"{r['first_token'][50]:>10.0f} {r['total'][50]:>10.0f} {r['total'][95]:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Evaluates the local civil engineering topic classifier on the held-out test file.
+
+Reports the accuracy of the local model alone, and for several confidence thresholds the share of
+inputs that would fall back to the LLM and the accuracy of the inputs answered locally. With --llm,
+low-confidence inputs are sent to Bedrock and the end-to-end accuracy is reported as well.
+
+Usage:
+    python -m benchmarks.eval_topic_classifier
+    python -m benchmarks.eval_topic_classifier --llm
+"""
+import argparse
+import time
+
+from utils import topic_classifier
+from utils.topic_classifier import TEST_PATH, load_examples, load_topic_classifier, predict_civil_engineering
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm", action="store_true", help="Send low-confidence inputs to Bedrock")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    load_topic_classifier()
+    print(f"training time: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    texts, labels = load_examples(TEST_PATH)
+    start = time.perf_counter()
+    predictions = [predict_civil_engineering(text) for text in texts]
+    latency = (time.perf_counter() - start) * 1000 / len(texts)
+
+    correct = [int(prediction) == label for (prediction, _), label in zip(predictions, labels)]
+    print(f"test examples: {len(texts)}, local accuracy: {sum(correct) / len(texts):.3f}, "
+          f"latency: {latency:.2f} ms/input\n")
+
+    print(f"{'threshold':>9} {'fallback rate':>13} {'local accuracy':>14}")
+    for threshold in THRESHOLDS:
+        confident = [ok for (_, confidence), ok in zip(predictions, correct) if confidence >= threshold]
+        fallback_rate = 1 - len(confident) / len(texts)
+        accuracy = sum(confident) / len(confident) if confident else float("nan")
+        marker = "  <- TOPIC_CONFIDENCE_THRESHOLD" if threshold == topic_classifier.TOPIC_CONFIDENCE_THRESHOLD else ""
+        print(f"{threshold:>9.2f} {fallback_rate:>13.3f} {accuracy:>14.3f}{marker}")
+
+    if args.llm:
+        from agents.graph import build_graph_runtime
+        from agents import graph
+
+        build_graph_runtime()
+        results = [topic_classifier.is_civil_engineering(graph.llm, text) for text in texts]
+        accuracy = sum(int(result) == label for result, label in zip(results, labels)) / len(texts)
+        total = topic_classifier.stats["local"] + topic_classifier.stats["fallback"]
+        print(f"\nwith LLM fallback: accuracy {accuracy:.3f}, "
+              f"fallback rate {topic_classifier.stats['fallback'] / total:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Fits MODERATION_LOGIT_TEMPERATURE, the temperature of the "logits" verdict scoring, on labelled prompts.
+
+Scores every prompt once at temperature 1 to get its unsafe-vs-safe logit margin, then finds the
+temperature that minimizes the negative log-likelihood of the expected verdicts (temperature scaling).
+Reports the log-loss and Brier score before and after; the verdicts at MODERATION_UNSAFE_THRESHOLD=0.5
+do not change, only how confident the unsafe probabilities are. The default prompt set is small, fit on
+a larger labelled sample of real traffic ("text" and "expected": "safe" or "unsafe") before relying on it.
+
+Usage:
+    python -m benchmarks.fit_logit_temperature
+    python -m benchmarks.fit_logit_temperature --prompts labelled.jsonl
+"""
+import argparse
+import json
+import math
+
+from benchmarks.moderation_profile import PROMPTS_PATH
+
+# Probabilities are clipped so a saturated softmax keeps a finite margin
+EPSILON = 1e-7
+
+
+def load_labelled(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sigmoid(x: float) -> float:
+    return 1 / (1 + math.exp(-x)) if x >= 0 else math.exp(x) / (1 + math.exp(x))
+
+
+def log_loss(margins: list, labels: list, temperature: float) -> float:
+    total = 0.0
+    for margin, label in zip(margins, labels):
+        p = min(max(sigmoid(margin / temperature), EPSILON), 1 - EPSILON)
+        total -= math.log(p) if label else math.log(1 - p)
+    return total / len(margins)
+
+
+def brier(margins: list, labels: list, temperature: float) -> float:
+    return sum((sigmoid(m / temperature) - label) ** 2 for m, label in zip(margins, labels)) / len(margins)
+
+
+def fit_temperature(margins: list, labels: list, low: float = 0.05, high: float = 20.0) -> float:
+    """Temperature minimizing the log-loss: golden-section search on log(temperature), where the loss is unimodal."""
+    a, b = math.log(low), math.log(high)
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(100):
+        c, d = b - ratio * (b - a), a + ratio * (b - a)
+        if log_loss(margins, labels, math.exp(c)) <= log_loss(margins, labels, math.exp(d)):
+            b = d
+        else:
+            a = c
+    return math.exp((a + b) / 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", default=str(PROMPTS_PATH))
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    from utils import moderation
+
+    prompts = load_labelled(args.prompts)
+    labels = [prompt["expected"] == "unsafe" for prompt in prompts]
+
+    # Margins at temperature 1, whatever the environment sets
+    moderation.MODERATION_LOGIT_TEMPERATURE = 1.0
+    margins = []
+    for i in range(0, len(prompts), args.batch_size):
+        for verdict in moderation.score_verdicts([prompt["text"] for prompt in prompts[i:i + args.batch_size]]):
+            p = min(max(verdict["unsafe_probability"], EPSILON), 1 - EPSILON)
+            margins.append(math.log(p / (1 - p)))
+
+    temperature = fit_temperature(margins, labels)
+    print(f"{len(prompts)} prompts, {sum(labels)} expected unsafe\n")
+    print(f"{'temperature':>11} {'log-loss':>9} {'brier':>7}")
+    for name, value in (("1.0", 1.0), (f"{temperature:.3f}", temperature)):
+        print(f"{name:>11} {log_loss(margins, labels, value):>9.4f} {brier(margins, labels, value):>7.4f}")
+    print(f"\nMODERATION_LOGIT_TEMPERATURE={temperature:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Offline load test and benchmark harness for the agent workflow.
+
+Bedrock, the search API and Llama Guard are replaced by local stand-ins (LLM_PROVIDER=stub,
+SEARCH_PROVIDER=stub, MODEL_BACKEND=stub) with configurable latency distributions, so no credentials,
+network or model weights are needed; --real keeps the configured providers instead. Prompts are drawn
+from a JSONL corpus ("user_input" or "text" field) and sent at each --concurrency level either:
+
+  - to run_graph in this process (--target graph), under the REQUEST_TIMEOUT deadline like /chat, with
+    the per-node and per-call breakdown taken from the request traces, or
+  - to POST /chat (--target http) of a server started here under gunicorn (or --url), with the
+    breakdown taken from the /metrics of the worker answering the scrape.
+
+Reports p50/p95/p99 latency, requests per second, errors and the mean time per node and external call.
+The corpus is replayed many times, so the verdict, search and response caches are disabled unless --keep-caches.
+--save writes the results as a JSON baseline; --compare checks them against one and exits non-zero
+when latency or throughput regress by more than --tolerance.
+
+Usage:
+    python -m benchmarks.harness --target graph --concurrency 1 8 32 --requests 200 --save baseline.json
+    python -m benchmarks.harness --target http --workers 2 --concurrency 16 --requests 400 --compare baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.load_test import wait_ready
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "data", "chat_prompts.jsonl")
+
+STAND_INS = {"LLM_PROVIDER": "stub", "SEARCH_PROVIDER": "stub", "MODEL_BACKEND": "stub"}
+# The corpus is replayed many times, so the verdict, search and response caches are off unless --keep-caches
+NO_CACHES = {"MODERATION_CACHE": "false", "SEARCH_CACHE": "false", "RESPONSE_CACHE": "false"}
+
+# Stand-in options and the environment variables they set
+LATENCY_OPTIONS = {
+    "llm_first_token_ms": "STUB_LLM_FIRST_TOKEN_MS",
+    "llm_tokens_per_second": "STUB_LLM_TOKENS_PER_SECOND",
+    "llm_output_tokens": "STUB_LLM_OUTPUT_TOKENS",
+    "search_rate": "STUB_LLM_SEARCH_RATE",
+    "search_latency_ms": "SEARCH_STUB_LATENCY_MS",
+    "moderation_latency_ms": "STUB_MODERATION_LATENCY_MS",
+    "jitter": "STUB_LATENCY_JITTER",
+}
+
+METRIC_PATTERN = re.compile(r'^agent_(node|external_call)_duration_seconds_(sum|count)\{(?:node|service)="([^"]+)"\} (\S+)$')
+
+
+def load_corpus(path: str) -> list:
+    prompts = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                prompts.append(record.get("user_input") or record["text"])
+    return prompts
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] if ordered else float("nan")
+
+
+def summarize(latencies: list, errors: int, elapsed: float, concurrency: int, breakdown: dict) -> dict:
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(statistics.mean(latencies), 1) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "breakdown": breakdown,
+    }
+
+
+def drive(send, prompts: list, concurrency: int, total: int):
+    """Sends `total` prompts from `concurrency` threads; returns the latencies in ms, the errors and the elapsed time."""
+    latencies, errors = [], 0
+
+    def call(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            send(prompts[i % len(prompts)])
+            latencies.append((time.perf_counter() - start) * 1000)
+        except Exception:
+            errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(total)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_graph_target(args, prompts: list) -> list:
+    from agents.graph import run_graph
+    from utils import metrics
+    from utils.deadline import request_deadline
+
+    results = []
+    for concurrency in args.concurrency:
+        spans = defaultdict(list)
+
+        def send(prompt):
+            with metrics.trace_request() as trace:
+                try:
+                    run_graph(prompt, deadline=request_deadline())
+                finally:
+                    for name, seconds in list(trace.spans):
+                        spans[name].append(seconds * 1000)
+
+        drive(send, prompts, concurrency, args.warmup)
+        spans.clear()
+        latencies, errors, elapsed = drive(send, prompts, concurrency, args.requests)
+        breakdown = {
+            name: {
+                "calls_per_request": round(len(values) / args.requests, 2),
+                "mean_ms": round(statistics.mean(values), 1),
+                "p95_ms": round(percentile(values, 0.95), 1),
+            }
+            for name, values in sorted(spans.items())
+        }
+        results.append(summarize(latencies, errors, elapsed, concurrency, breakdown))
+        print_result(results[-1])
+    return results
+
+
+def scrape_durations(base_url: str) -> dict:
+    """Sum and count of the node and external call durations on /metrics, keyed by name."""
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for line in requests.get(f"{base_url}/metrics", timeout=10).text.splitlines():
+        match = METRIC_PATTERN.match(line)
+        if match:
+            _, field, name, value = match.groups()
+            totals[name][0 if field == "sum" else 1] += float(value)
+    return totals
+
+
+def run_http_target(args, prompts: list) -> list:
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max(args.concurrency)))
+
+    def send(prompt):
+        response = session.post(f"{args.url}/chat", json={"user_input": prompt}, timeout=300)
+        response.raise_for_status()
+
+    results = []
+    for concurrency in args.concurrency:
+        drive(send, prompts, concurrency, args.warmup)
+        before = scrape_durations(args.url)
+        latencies, errors, elapsed = drive(send, prompts, concurrency, args.requests)
+        after = scrape_durations(args.url)
+
+        breakdown = {}
+        for name, (total, count) in sorted(after.items()):
+            calls = count - before[name][1]
+            if calls > 0:
+                breakdown[name] = {"calls": int(calls), "mean_ms": round((total - before[name][0]) / calls * 1000, 1)}
+        results.append(summarize(latencies, errors, elapsed, concurrency, breakdown))
+        print_result(results[-1])
+    return results
+
+
+def start_server(args, env: dict) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "asgi:app"],
+        env={**env, "WEB_CONCURRENCY": str(args.workers), "FLASK_RUN_PORT": str(args.port)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(args.url, args.workers, args.ready_timeout)
+    except Exception:
+        stop_server(server)
+        raise
+    return server
+
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=60)
+
+
+def print_result(result: dict):
+    print(f"\nconcurrency {result['concurrency']}: {result['rps']:.2f} req/s, p50 {result['p50_ms']:.0f} ms, "
+          f"p95 {result['p95_ms']:.0f} ms, p99 {result['p99_ms']:.0f} ms, {result['errors']} errors")
+    for name, stats in result["breakdown"].items():
+        calls = stats.get("calls_per_request", stats.get("calls"))
+        p95 = f"  p95 {stats['p95_ms']:>8.1f} ms" if "p95_ms" in stats else ""
+        print(f"  {name:<16} {calls:>8} calls  mean {stats['mean_ms']:>8.1f} ms{p95}")
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Regressions of the results against a saved baseline, matched by concurrency."""
+    with open(baseline_path) as f:
+        baseline = {result["concurrency"]: result for result in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\n{'concurrency':>11} {'metric':>7} {'baseline':>10} {'current':>10} {'change':>8}")
+    for result in results:
+        base = baseline.get(result["concurrency"])
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            change = (result[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+            worse = change < -tolerance if metric == "rps" else change > tolerance
+            flag = "  REGRESSION" if worse else ""
+            print(f"{result['concurrency']:>11} {metric:>7} {base[metric]:>10.1f} {result[metric]:>10.1f} {change:>+7.1%}{flag}")
+            if worse:
+                regressions.append((result["concurrency"], metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["graph", "http"], default="graph")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real", action="store_true", help="use the configured providers instead of the stand-ins")
+    parser.add_argument("--keep-caches", action="store_true", help="keep the moderation verdict, search and response caches as configured")
+    parser.add_argument("--url", help="server to load (http target); by default one is started under gunicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--ready-timeout", type=float, default=120)
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare the results with this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    for option in LATENCY_OPTIONS:
+        parser.add_argument(f"--{option.replace('_', '-')}", type=float)
+    args = parser.parse_args()
+
+    # The stand-ins and the logging read their configuration at import time, so the environment is set first
+    if not args.real:
+        os.environ.update(STAND_INS)
+    if not args.keep_caches:
+        os.environ.update(NO_CACHES)
+    for option, variable in LATENCY_OPTIONS.items():
+        if getattr(args, option) is not None:
+            os.environ[variable] = str(getattr(args, option))
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    prompts = load_corpus(args.corpus)
+    random.Random(args.seed).shuffle(prompts)
+
+    server = None
+    if args.target == "http" and not args.url:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args, dict(os.environ))
+    try:
+        results = run_graph_target(args, prompts) if args.target == "graph" else run_http_target(args, prompts)
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    config = {
+        "target": args.target,
+        "workers": args.workers if args.target == "http" else None,
+        "corpus": os.path.basename(args.corpus),
+        "requests": args.requests,
+        "stand_ins": not args.real,
+        "caches": args.keep_caches,
+        "stand_in_env": {variable: os.environ[variable] for variable in LATENCY_OPTIONS.values() if variable in os.environ},
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config, "results": results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        print(f"\nRegression beyond {args.tolerance:.0%} against {args.compare}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
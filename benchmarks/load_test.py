@@ -0,0 +1,118 @@
+"""
+HTTP load test of the /chat endpoint under the pre-fork server, by worker count.
+
+For each worker count, starts `gunicorn -c gunicorn.conf.py asgi:app` on a local port, waits for
+/ready, sends --requests POST /chat calls from --concurrency client threads and reports requests per
+second and latency percentiles, plus the resident memory of the whole server (master and workers).
+Needs the same credentials as the service, unless --offline runs the server on the local stand-ins of
+Bedrock, the search API and Llama Guard (see benchmarks/harness.py for latency percentiles per node).
+
+Usage:
+    python -m benchmarks.load_test --workers 1 2 4 --concurrency 16 --requests 200
+    python -m benchmarks.load_test --offline --workers 1 2 4 --concurrency 16 --requests 200
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+import requests
+
+PROMPTS = [
+    "What is the capital of Australia?",
+    "Give me tips to improve my sleep schedule.",
+    "Explain how vaccines train the immune system.",
+    "Recommend three science fiction novels for a long flight.",
+]
+
+
+def wait_ready(base_url: str, workers: int, timeout: float):
+    """Waits until enough consecutive /ready probes succeed that every worker is likely ready."""
+    deadline = time.monotonic() + timeout
+    successes = 0
+    while time.monotonic() < deadline:
+        try:
+            successes = successes + 1 if requests.get(f"{base_url}/ready", timeout=2).ok else 0
+        except requests.RequestException:
+            successes = 0
+        if successes >= 3 * workers:
+            return
+        time.sleep(0.5)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+
+def server_rss_mb(pid: int) -> float:
+    process = psutil.Process(pid)
+    processes = [process] + process.children(recursive=True)
+    # Unique set size: memory that would be freed if the process exited, so shared weights count once
+    return sum(p.memory_full_info().uss for p in processes) / 2 ** 20
+
+
+def run_load(base_url: str, concurrency: int, total: int):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    latencies, errors = [], 0
+
+    def call(i):
+        nonlocal errors
+        start = time.perf_counter()
+        response = session.post(f"{base_url}/chat", json={"user_input": PROMPTS[i % len(PROMPTS)]}, timeout=300)
+        if response.ok:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else float("nan"),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--ready-timeout", type=float, default=600)
+    parser.add_argument("--offline", action="store_true", help="serve with the Bedrock, search and Llama Guard stand-ins")
+    args = parser.parse_args()
+
+    stand_ins = {"LLM_PROVIDER": "stub", "SEARCH_PROVIDER": "stub", "MODEL_BACKEND": "stub"} if args.offline else {}
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7} {'server MB':>10}")
+    for workers in args.workers:
+        env = {**os.environ, **stand_ins, "WEB_CONCURRENCY": str(workers), "FLASK_RUN_PORT": str(args.port)}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "asgi:app"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(base_url, workers, args.ready_timeout)
+            result = run_load(base_url, args.concurrency, args.requests)
+            memory = server_rss_mb(server.pid)
+            print(f"{workers:>7} {result['rps']:>8.2f} {result['p50']:>9.0f} {result['p95']:>9.0f} "
+                  f"{result['errors']:>7} {memory:>10.0f}")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Loads the moderation model with the configuration found in the environment, moderates the fixed
+prompt set and prints one JSON report: load time, resident and peak memory, per-verdict latency and verdicts.
+
+Run in a fresh process per configuration by the comparison benchmarks, e.g.:
+    MODEL_QUANTIZATION=int8 python -m benchmarks.moderation_profile
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROMPTS_PATH = Path(__file__).resolve().parent / "data" / "moderation_prompts.jsonl"
+
+
+def load_prompts():
+    with open(PROMPTS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far (ru_maxrss is in KiB on Linux, in bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def profile():
+    # Measure single, uncached verdicts
+    os.environ["MODERATION_BATCHING"] = "false"
+    os.environ["MODERATION_CACHE"] = "false"
+
+    import psutil
+    import torch  # noqa: F401  Library imports are not part of the model load time
+    import transformers  # noqa: F401
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    from utils import model_loader
+
+    start = time.perf_counter()
+    model_loader.ensure_model_loaded()
+    load_seconds = time.perf_counter() - start
+    rss_after = process.memory_info().rss
+
+    from utils.moderation import llamaguard_verdict
+
+    prompts = load_prompts()
+    llamaguard_verdict(prompts[0]["text"])  # Warm up
+
+    latencies, verdicts = [], []
+    for prompt in prompts:
+        start = time.perf_counter()
+        verdict = llamaguard_verdict(prompt["text"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        verdicts.append({"allowed": verdict["allowed"], "flagged_categories": verdict["flagged_categories"]})
+
+    return {
+        "load_seconds": load_seconds,
+        "model_memory_mb": (rss_after - rss_before) / 2 ** 20,
+        "peak_rss_mb": peak_rss_mb(),
+        "latencies_ms": latencies,
+        "verdicts": verdicts,
+        "device": model_loader.device,
+    }
+
+
+def run_profile(env: dict):
+    """Runs the profile in a child process with extra environment variables and returns its report."""
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.moderation_profile"],
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Profile with {env} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare_verdicts(reference, candidate):
+    """Returns the share of prompts where the candidate verdict matches the reference verdict."""
+    matches = sum(ref["allowed"] == cand["allowed"] for ref, cand in zip(reference["verdicts"], candidate["verdicts"]))
+    return matches / len(reference["verdicts"])
+
+
+if __name__ == "__main__":
+    print(json.dumps(profile()))
@@ -0,0 +1,54 @@
+"""
+Production server configuration: a pre-forking gunicorn master with async (uvicorn) workers.
+
+The app is imported in the master (preload_app), which loads the Llama Guard weights once;
+the forked workers share those pages copy-on-write instead of holding N copies. Each worker then
+sets its torch thread count, builds its own clients and runs the warmup before reporting ready; /ready
+passes once every worker has, as recorded in the worker state directory shared by the workers.
+
+    gunicorn -c gunicorn.conf.py asgi:app
+
+The Flask app alone (without /chat/stream) runs on threaded workers:
+
+    GUNICORN_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+import tempfile
+
+# Tells app.py to only preload the weights in the master
+os.environ.setdefault("SERVER_MODE", "prefork")
+# Where the workers leave their readiness markers and metrics (utils/worker_state.py); a fresh directory per server by default
+if not os.getenv("WORKER_STATE_DIR"):
+    os.environ["WORKER_STATE_DIR"] = tempfile.mkdtemp(prefix="agent-workers-")
+
+bind = f"0.0.0.0:{os.getenv('FLASK_RUN_PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+# Concurrent synchronous requests per worker; they share the worker's model through the moderation micro-batcher
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    from utils import worker_state
+
+    worker_state.reset()
+
+
+def post_fork(server, worker):
+    from utils import metrics, startup, worker_state
+
+    worker_state.expected_workers = server.num_workers
+    metrics.start_snapshots()
+    startup.configure_worker_threads(workers)
+    startup.start_background_startup()
+
+
+def child_exit(server, worker):
+    from utils import metrics, worker_state
+
+    worker_state.forget_worker(worker.pid)
+    metrics.retire_worker(worker.pid)
@@ -1,10 +1,29 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import Annotated, List, Dict
+
+# Role of the marker a node returns to drop the oldest messages once they are summarized.
+# Its content is the number of messages to drop; it is never stored in the history.
+COMPACTION_ROLE = "compaction"
+
+def append_messages(existing: List[Dict[str, str]], new: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Reducer of the message history: nodes return only the messages they add, which are appended."""
+    for message in new:
+        if message["role"] == COMPACTION_ROLE:
+            existing = existing[int(message["content"]):]
+    return existing + [message for message in new if message["role"] != COMPACTION_ROLE]
 
 class AgentState(BaseModel):
-    messages: List[Dict[str, str]] = Field(default_factory=list)
-    web_snippets: List[str] = Field(default_factory=list)
+    messages: Annotated[List[Dict[str, str]], append_messages] = Field(default_factory=list)
+    # Summary of the older turns of the session that were compacted out of `messages`
+    summary: str = ""
+    web_snippets: List[Dict[str, str]] = Field(default_factory=list)
     search_needed: bool = False
     search_attempted: bool = False
     response_generated: bool = False
-    allowed: bool = True
\ No newline at end of file
+    allowed: bool = True
+    # Deadline of the current request (epoch seconds), 0 for none; set on every turn
+    deadline: float = 0.0
+    # Whether the turn may be answered from, and stored in, the semantic response cache
+    use_response_cache: bool = True
+    # Whether the answer tokens of the turn are streamed to the client (/chat/stream)
+    stream_answer: bool = False
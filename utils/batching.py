@@ -0,0 +1,90 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from concurrent callers and processes them together.
+
+    A batch is closed when it reaches `max_batch_size` items or when `window_ms` has elapsed
+    since its first item arrived, whichever comes first. While a batch is being processed,
+    new items keep queueing up, so the batch size adapts to the offered load.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 window_ms: float = 10.0, name: str = "micro-batcher"):
+        """
+        Args:
+            process_batch: Function mapping a list of items to a list of results of the same length and order.
+            max_batch_size (int): Upper bound on the number of items processed together.
+            window_ms (float): How long to wait for more items after the first one of a batch arrives.
+            name (str): Name of the background worker thread.
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def submit(self, item: Any) -> Future:
+        """Queues an item and returns a future resolved with its own result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any, timeout: float = None) -> Any:
+        """Submits an item and blocks until its result is available, at most `timeout` seconds (None for no limit)."""
+        return self.submit(item).result(timeout)
+
+    def _ensure_worker(self):
+        # The worker is started lazily, and restarted in forked processes where it does not exist
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            pending = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            items = [item for item, _ in pending]
+            futures = [future for _, future in pending]
+
+            try:
+                results = list(self.process_batch(items))
+                if len(results) != len(futures):
+                    raise RuntimeError(f"process_batch returned {len(results)} results for {len(futures)} items")
+            except Exception as e:
+                logging.error(f"{self.name}: batch of {len(items)} failed: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
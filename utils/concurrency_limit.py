@@ -0,0 +1,72 @@
+import logging
+import os
+import threading
+from utils.deadline import REQUEST_TIMEOUT
+
+# Adaptive limit on the chat requests in flight per worker process. Requests over the limit are rejected
+# with 503 right away instead of waiting in a queue. The limit grows by one for each request that completes
+# while at least half of it is in use, and shrinks by CONCURRENCY_BACKOFF for each request slower than
+# CONCURRENCY_LATENCY_THRESHOLD seconds or past its deadline (additive increase, multiplicative decrease).
+CONCURRENCY_LIMIT = os.getenv("CONCURRENCY_LIMIT", "true").lower() == "true"
+CONCURRENCY_LIMIT_INITIAL = int(os.getenv("CONCURRENCY_LIMIT_INITIAL", "32"))
+CONCURRENCY_LIMIT_MIN = int(os.getenv("CONCURRENCY_LIMIT_MIN", "4"))
+CONCURRENCY_LIMIT_MAX = int(os.getenv("CONCURRENCY_LIMIT_MAX", "256"))
+CONCURRENCY_BACKOFF = float(os.getenv("CONCURRENCY_BACKOFF", "0.9"))
+CONCURRENCY_LATENCY_THRESHOLD = float(os.getenv("CONCURRENCY_LATENCY_THRESHOLD", str(REQUEST_TIMEOUT / 2 or 15)))
+
+# Seconds a rejected client is asked to wait before retrying (Retry-After header)
+RETRY_AFTER_SECONDS = "1"
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the requests in flight, shared by the threads and the event loop of a worker."""
+
+    def __init__(self, initial: int = CONCURRENCY_LIMIT_INITIAL, minimum: int = CONCURRENCY_LIMIT_MIN,
+                 maximum: int = CONCURRENCY_LIMIT_MAX, backoff: float = CONCURRENCY_BACKOFF,
+                 latency_threshold: float = CONCURRENCY_LATENCY_THRESHOLD):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_threshold = latency_threshold
+        self.inflight = 0
+        self.lock = threading.Lock()
+        self.counts = {"admitted": 0, "rejected": 0, "overloaded": 0}
+
+    def try_acquire(self) -> bool:
+        """Admits a request if the limit allows it; every admitted request must be released."""
+        with self.lock:
+            if self.inflight >= int(self.limit):
+                self.counts["rejected"] += 1
+                return False
+            self.inflight += 1
+            self.counts["admitted"] += 1
+            return True
+
+    def release(self, latency: float, deadline_exceeded: bool = False):
+        """
+        Releases an admitted request and adapts the limit to how it went.
+
+        Args:
+            latency (float): Seconds the request took.
+            deadline_exceeded (bool): Whether it ran out of its budget.
+        """
+        with self.lock:
+            inflight = self.inflight
+            self.inflight -= 1
+            if deadline_exceeded or latency > self.latency_threshold:
+                self.counts["overloaded"] += 1
+                previous = int(self.limit)
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                if int(self.limit) < previous:
+                    logging.warning(f"Concurrency limit lowered to {int(self.limit)} after a {latency:.1f} s request")
+            elif inflight * 2 >= self.limit:
+                self.limit = min(self.maximum, self.limit + 1)
+
+    def stats(self) -> dict:
+        """Returns the current limit, the requests in flight and the admission counters."""
+        with self.lock:
+            return {"limit": int(self.limit), "inflight": self.inflight, **self.counts}
+
+
+concurrency_limiter = AdaptiveConcurrencyLimiter() if CONCURRENCY_LIMIT else None
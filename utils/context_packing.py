@@ -0,0 +1,188 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from utils.cache import normalize_text
+
+# Packs the web search results into the answer prompt: near-duplicate removal, BM25 ranking of
+# passage chunks against the user query, and a token budget
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", "120"))
+# Word-shingle Jaccard similarity above which two chunks are considered the same text
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or that the this to was "
+    "what when where which who why will with you your".split()
+)
+
+# Input tokens of the snippet prompts before and after packing, over the process lifetime
+packing_stats = {"requests": 0, "tokens_before": 0, "tokens_after": 0, "duplicates": 0}
+_stats_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximates the model token count (about four characters per token for English text)."""
+    return math.ceil(len(text) / 4)
+
+
+def tokenize(text: str) -> list:
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+def split_chunks(text: str, max_tokens: int, seen_sentences: Counter = None) -> list:
+    """
+    Splits a passage into chunks of whole sentences of up to max_tokens (longer sentences are cut).
+    Sentences already counted in seen_sentences (normalized) are skipped; every sentence is counted.
+    """
+    chunks, current = [], ""
+    for sentence in SENTENCE_PATTERN.split(" ".join(text.split())):
+        if seen_sentences is not None:
+            key = normalize_text(sentence)
+            seen_sentences[key] += 1
+            if seen_sentences[key] > 1:
+                continue
+        while estimate_tokens(sentence) > max_tokens:
+            head, sentence = sentence[:max_tokens * 4], sentence[max_tokens * 4:]
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(head)
+        if current and estimate_tokens(current + " " + sentence) > max_tokens:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def shingles(text: str, size: int = 3) -> set:
+    words = normalize_text(text).split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def deduplicate(chunks: list, threshold: float) -> tuple:
+    """
+    Drops chunks whose word shingles overlap an earlier chunk above the threshold (Jaccard similarity).
+
+    Returns:
+        tuple: (kept chunks, number of chunks dropped)
+    """
+    kept, kept_shingles = [], []
+    for chunk in chunks:
+        chunk_shingles = shingles(chunk["text"])
+        if any(len(chunk_shingles & other) / len(chunk_shingles | other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(chunk_shingles)
+    return kept, len(chunks) - len(kept)
+
+
+def bm25_scores(query: str, documents: list) -> list:
+    """Scores each document against the query with Okapi BM25."""
+    query_terms = set(tokenize(query))
+    tokenized = [tokenize(document) for document in documents]
+    if not tokenized or not query_terms:
+        return [0.0] * len(documents)
+
+    average_length = sum(len(terms) for terms in tokenized) / len(tokenized) or 1.0
+    document_frequency = Counter(term for terms in tokenized for term in set(terms) & query_terms)
+
+    scores = []
+    for terms in tokenized:
+        frequencies = Counter(terms)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / average_length)
+        score = 0.0
+        for term in query_terms:
+            frequency = frequencies.get(term, 0)
+            if frequency:
+                idf = math.log(1 + (len(tokenized) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+        scores.append(score)
+    return scores
+
+
+def pack_context(query: str, snippets: list, token_budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    """
+    Builds the web context of the answer prompt from the search results.
+
+    The snippets are split into chunks, near-duplicates are removed, the chunks are ranked with BM25
+    against the query and the best ones are packed within the token budget. Every chunk keeps a
+    numbered reference to its source url.
+
+    Args:
+        query (str): The user's question.
+        snippets (list): Search results, dicts with the page url and content.
+        token_budget (int): Approximate number of tokens the packed chunks may use.
+
+    Returns:
+        dict: The packed `context` text, the `sources` it cites, and token and chunk counts.
+    """
+    raw_tokens = estimate_tokens(str([snippet.get("content", "") for snippet in snippets]))
+
+    # Repeated sentences are dropped while chunking, then near-duplicate chunks
+    chunks, seen_sentences = [], Counter()
+    for snippet in snippets:
+        for text in split_chunks(snippet.get("content", ""), CONTEXT_CHUNK_TOKENS, seen_sentences):
+            chunks.append({"url": snippet.get("url", ""), "text": text})
+    total_chunks = len(chunks)
+    chunks, duplicates = deduplicate(chunks, CONTEXT_DEDUP_THRESHOLD)
+    duplicates += sum(count - 1 for count in seen_sentences.values())
+
+    scores = bm25_scores(query, [chunk["text"] for chunk in chunks])
+    ranked = sorted(zip(scores, range(len(chunks))), key=lambda pair: (-pair[0], pair[1]))
+
+    selected, used_tokens = [], 0
+    for _, index in ranked:
+        chunk_tokens = estimate_tokens(chunks[index]["text"])
+        if selected and used_tokens + chunk_tokens > token_budget:
+            continue
+        selected.append(chunks[index])
+        used_tokens += chunk_tokens
+
+    if not selected:
+        return {"context": "", "sources": [], "tokens_before": raw_tokens, "tokens_after": 0,
+                "chunks_total": total_chunks, "chunks_used": 0, "duplicates": duplicates}
+
+    # Number the sources in order of first use, and cite them next to each passage
+    sources = []
+    for chunk in selected:
+        if chunk["url"] not in sources:
+            sources.append(chunk["url"])
+    passages = [f"[{sources.index(chunk['url']) + 1}] {chunk['text']}" for chunk in selected]
+    source_list = [f"[{number}] {url}" for number, url in enumerate(sources, start=1)]
+    context = "\n\n".join(passages) + "\n\nSources:\n" + "\n".join(source_list)
+
+    packed_tokens = estimate_tokens(context)
+    with _stats_lock:
+        packing_stats["requests"] += 1
+        packing_stats["tokens_before"] += raw_tokens
+        packing_stats["tokens_after"] += packed_tokens
+        packing_stats["duplicates"] += duplicates
+
+    logging.info(
+        f"Packed {len(selected)}/{total_chunks} snippet chunks ({duplicates} duplicate passages dropped) from {len(sources)} sources: "
+        f"~{raw_tokens} -> ~{packed_tokens} input tokens ({raw_tokens - packed_tokens} saved)"
+    )
+    return {
+        "context": context,
+        "sources": sources,
+        "tokens_before": raw_tokens,
+        "tokens_after": packed_tokens,
+        "chunks_total": total_chunks,
+        "chunks_used": len(selected),
+        "duplicates": duplicates,
+    }
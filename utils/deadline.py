@@ -0,0 +1,61 @@
+import logging
+import math
+import os
+import time
+
+# Latency budget of a chat request, in seconds, from the moment /chat accepts it; 0 disables the deadline.
+# The deadline is carried in the graph state and every node checks the budget left before a slow call.
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))
+# Budget a web search needs to be started: the search itself and the answer written from its snippets
+DEADLINE_SEARCH_RESERVE = float(os.getenv("DEADLINE_SEARCH_RESERVE", "10"))
+# Budget an optional model call needs: the uncertainty check, the history summary, the answer from the snippets
+DEADLINE_LLM_RESERVE = float(os.getenv("DEADLINE_LLM_RESERVE", "4"))
+
+# Optional steps skipped for lack of budget, and steps or model calls cut short by the deadline
+deadline_stats = {"exceeded": 0, "skipped_search": 0, "skipped_uncertainty_check": 0, "skipped_compaction": 0, "skipped_snippet_answer": 0}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of its latency budget before it has an answer."""
+
+
+def request_deadline(timeout: float = REQUEST_TIMEOUT) -> float:
+    """Deadline (epoch seconds) of a request starting now, or 0 when requests have no deadline."""
+    return time.time() + timeout if timeout > 0 else 0.0
+
+
+def remaining(deadline: float) -> float:
+    """Seconds left before the deadline (negative once it passed), infinite without a deadline."""
+    return deadline - time.time() if deadline else math.inf
+
+
+def timeout_for(deadline: float):
+    """Timeout of a blocking wait bounded by the deadline, or None (no limit) without a deadline."""
+    return max(0.0, remaining(deadline)) if deadline else None
+
+
+def has_budget(deadline: float, needed: float, step: str) -> bool:
+    """
+    Whether enough of the budget is left for an optional step; the skipped steps are counted.
+
+    Args:
+        deadline (float): The request deadline, 0 for none.
+        needed (float): Seconds the step is expected to need.
+        step (str): Name of the step, e.g. "search".
+
+    Returns:
+        bool: True when the step can run.
+    """
+    left = remaining(deadline)
+    if left >= needed:
+        return True
+    deadline_stats[f"skipped_{step}"] += 1
+    logging.warning(f"Skipping the {step.replace('_', ' ')}: {max(0.0, left):.1f} s left of the request budget, {needed:.1f} s needed")
+    return False
+
+
+def check_deadline(deadline: float, step: str):
+    """Raises DeadlineExceeded when the deadline has passed before a required step."""
+    if remaining(deadline) <= 0:
+        deadline_stats["exceeded"] += 1
+        raise DeadlineExceeded(f"Request deadline exceeded before {step}")
@@ -0,0 +1,37 @@
+import os
+from utils.AgentState import AgentState
+from utils.context_packing import estimate_tokens
+
+# Once the session history exceeds this many (estimated) tokens, the older turns are summarized
+HISTORY_TOKEN_WINDOW = int(os.getenv("HISTORY_TOKEN_WINDOW", "2000"))
+# Most recent messages always kept verbatim, including the current user message
+HISTORY_KEEP_MESSAGES = max(1, int(os.getenv("HISTORY_KEEP_MESSAGES", "4")))
+
+ROLE_NAMES = {"user": "User", "assistant": "Assistant", "system": "System"}
+
+
+def format_messages(messages: list) -> str:
+    return "\n".join(f"{ROLE_NAMES.get(msg['role'], msg['role'])}: {msg['content']}" for msg in messages)
+
+
+def history_tokens(state: AgentState) -> int:
+    """Estimated tokens of the session history: the summary and every message."""
+    return estimate_tokens(state.summary) + sum(estimate_tokens(msg["content"]) for msg in state.messages)
+
+
+def needs_compaction(state: AgentState) -> bool:
+    return len(state.messages) > HISTORY_KEEP_MESSAGES and history_tokens(state) > HISTORY_TOKEN_WINDOW
+
+
+def conversation_context(state: AgentState) -> str:
+    """
+    The conversation before the current user message, as prompt context: the summary of the
+    compacted turns followed by the recent messages. Empty on the first turn.
+    """
+    last_user = max((i for i, msg in enumerate(state.messages) if msg["role"] == "user"), default=0)
+    parts = []
+    if state.summary:
+        parts.append(f"Summary of the earlier conversation: {state.summary}")
+    if last_user > 0:
+        parts.append(format_messages(state.messages[:last_user]))
+    return "\n".join(parts)
@@ -0,0 +1,103 @@
+import os
+import torch
+from transformers import DynamicCache
+
+
+class TorchBackend:
+    """
+    Runs the moderation model with PyTorch, eagerly or through torch.compile.
+    Supports reusing a precomputed key/value cache for the static prompt prefix.
+    """
+
+    supports_prefix_cache = True
+
+    def __init__(self, model, compile: bool = False):
+        self.name = "compile" if compile else "eager"
+        self.model = torch.compile(model) if compile else model
+        self.device = model.device
+
+    def generate(self, input_ids, attention_mask, past_key_values=None, **generate_kwargs):
+        """Generates continuations of a left-padded batch."""
+        return self.model.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+            **generate_kwargs,
+        )
+
+    def logits(self, input_ids, attention_mask, position_ids, past_key_values=None, logits_to_keep: int = 0):
+        """
+        Runs one forward pass and returns the logits of the last `logits_to_keep` positions.
+        With a prefix cache, `input_ids` and `position_ids` only cover the uncached suffix.
+        """
+        return self.model(
+            input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=past_key_values,
+            use_cache=past_key_values is not None,
+            logits_to_keep=logits_to_keep,
+        ).logits
+
+    def prefill(self, input_ids):
+        """Encodes a prompt prefix and returns its key/value cache."""
+        return self.model(input_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+
+
+class OnnxBackend:
+    """
+    Runs an exported ONNX version of the moderation model with ONNX Runtime on CPU.
+    The ONNX graph manages its own key/value cache, so prefix caching is not available.
+    """
+
+    name = "onnx"
+    supports_prefix_cache = False
+
+    def __init__(self, model):
+        self.model = model
+        self.device = torch.device("cpu")
+
+    def generate(self, input_ids, attention_mask, past_key_values=None, **generate_kwargs):
+        return self.model.generate(input_ids, attention_mask=attention_mask, **generate_kwargs)
+
+    def logits(self, input_ids, attention_mask, position_ids, past_key_values=None, logits_to_keep: int = 0):
+        logits = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids).logits
+        return logits[:, -logits_to_keep:] if logits_to_keep else logits
+
+    def prefill(self, input_ids):
+        raise NotImplementedError("The ONNX backend does not support prefix caching.")
+
+
+def load_onnx_model(model_path: str, export_dir: str, token: str = None):
+    """
+    Loads the ONNX export of the model from `export_dir`, exporting it there first if it does not exist yet.
+    The export is made from `model_path` (the local snapshot or the hub id) and keeps a copy of the
+    tokenizer, so later starts need neither. Requires the optional `optimum[onnxruntime]` package.
+    """
+    from optimum.onnxruntime import ORTModelForCausalLM
+    from transformers import AutoTokenizer
+
+    if os.path.isdir(export_dir):
+        return ORTModelForCausalLM.from_pretrained(export_dir, provider="CPUExecutionProvider")
+
+    model = ORTModelForCausalLM.from_pretrained(model_path, export=True, provider="CPUExecutionProvider", token=token)
+    model.save_pretrained(export_dir)
+    AutoTokenizer.from_pretrained(model_path, token=token).save_pretrained(export_dir)
+    return model
+
+
+def create_backend(name: str, model):
+    """
+    Wraps a loaded model in the inference backend named by MODEL_BACKEND.
+
+    Args:
+        name (str): "eager", "compile" or "onnx".
+        model: A transformers model for the PyTorch backends, an ORT model for "onnx".
+    """
+    if name == "onnx":
+        return OnnxBackend(model)
+    if name == "compile":
+        return TorchBackend(model, compile=True)
+    if name == "eager":
+        return TorchBackend(model)
+    raise ValueError(f"Unknown model backend: {name}")
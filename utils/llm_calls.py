@@ -0,0 +1,217 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from langgraph.constants import TAG_NOSTREAM
+from utils.concurrency_limit import CONCURRENCY_LIMIT_MAX, concurrency_limiter
+from utils.deadline import DeadlineExceeded, check_deadline, deadline_stats, remaining, timeout_for
+
+# Hedged model calls: a call still running past the LLM_HEDGE_PERCENTILE of the recent latencies of its kind
+# gets a second, identical request, and the first answer wins. Off by default, since hedges cost tokens.
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+# Calls of a kind observed before its percentile is trusted, and a floor on the delay before hedging
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "50"))
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "1000"))
+# Cap on the share of calls that are hedged, so a uniformly slow Bedrock is not sent twice the load
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+# Threads running the hedged calls (the first attempt and its hedge); the other calls run in the request thread.
+# At most a call and its hedge per request the concurrency limit currently admits run there, and never more
+# than LLM_CALL_WORKERS; past that a call runs unhedged in the request thread.
+LLM_CALLS_PER_REQUEST = 2
+LLM_CALL_WORKERS = int(os.getenv("LLM_CALL_WORKERS", str(CONCURRENCY_LIMIT_MAX * LLM_CALLS_PER_REQUEST)))
+LLM_LATENCY_WINDOW = 500
+
+# "abandoned" counts the hedged calls still running when their request gave up on them at the deadline,
+# "pool_full" the calls not hedged because the pool was at capacity
+hedge_stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "abandoned": 0, "pool_full": 0}
+
+_executor = ThreadPoolExecutor(max_workers=LLM_CALL_WORKERS, thread_name_prefix="llm")
+_pool_inflight = 0
+_windows = {}
+_lock = threading.Lock()
+
+
+class LatencyWindow:
+    """The latencies of the last successful calls of one kind."""
+
+    def __init__(self, size: int = LLM_LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction: float):
+        """Nearest-rank percentile in seconds, or None until LLM_HEDGE_MIN_SAMPLES calls were observed."""
+        with self.lock:
+            if len(self.samples) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_window(name: str) -> LatencyWindow:
+    with _lock:
+        if name not in _windows:
+            _windows[name] = LatencyWindow()
+        return _windows[name]
+
+
+def hedge_delay(window: LatencyWindow):
+    """Seconds after which a call is hedged, or None when it is not."""
+    if not LLM_HEDGING:
+        return None
+    latency = window.percentile(LLM_HEDGE_PERCENTILE)
+    if latency is None:
+        return None
+    return max(latency, LLM_HEDGE_MIN_DELAY_MS / 1000)
+
+
+def _may_hedge() -> bool:
+    with _lock:
+        if hedge_stats["hedged"] + 1 > LLM_HEDGE_MAX_RATE * hedge_stats["calls"]:
+            return False
+        hedge_stats["hedged"] += 1
+        return True
+
+
+def _hedge_config(config: dict) -> dict:
+    # Only the original request streams its tokens, so a hedge never interleaves a second copy of the answer
+    config = dict(config or {})
+    config["tags"] = list(dict.fromkeys([*config.get("tags", []), TAG_NOSTREAM]))
+    return config
+
+
+def _timed_invoke(window: LatencyWindow, llm, prompt, config):
+    start = time.perf_counter()
+    response = llm.invoke(prompt, config=config)
+    window.record(time.perf_counter() - start)
+    return response
+
+
+def pool_capacity() -> int:
+    """Calls the pool may run at once: a call and its hedge per request the concurrency limit admits now."""
+    if concurrency_limiter is None:
+        return LLM_CALL_WORKERS
+    return min(LLM_CALL_WORKERS, LLM_CALLS_PER_REQUEST * int(concurrency_limiter.limit))
+
+
+def _pool_done(_future):
+    global _pool_inflight
+    with _lock:
+        _pool_inflight -= 1
+
+
+def _submit(window: LatencyWindow, llm, prompt, config):
+    """Runs the call on the pool, or returns None when the pool is at capacity."""
+    global _pool_inflight
+    with _lock:
+        if _pool_inflight >= pool_capacity():
+            hedge_stats["pool_full"] += 1
+            return None
+        _pool_inflight += 1
+    # The run configuration and the request trace live in context variables, which the call thread inherits
+    future = _executor.submit(contextvars.copy_context().run, _timed_invoke, window, llm, prompt, config)
+    future.add_done_callback(_pool_done)
+    return future
+
+
+def _invoke_inline(window: LatencyWindow, llm, prompt, config, deadline: float, name: str):
+    # The deadline cannot interrupt a call in progress; the Bedrock read timeout bounds it instead
+    try:
+        return _timed_invoke(window, llm, prompt, config)
+    except Exception as e:
+        if deadline and remaining(deadline) <= 0:
+            deadline_stats["exceeded"] += 1
+            raise DeadlineExceeded(f"Request deadline exceeded during the {name} call") from e
+        raise
+
+
+def invoke_llm(llm, prompt, config: dict = None, deadline: float = 0.0, name: str = "llm"):
+    """
+    Invokes the language model within the request deadline, hedging the call when it runs unusually long.
+    Without hedging this is a plain llm.invoke in the calling thread, started only while budget is left and
+    bounded by the Bedrock read timeout; a hedged call and its hedge run on the pool, waited for until the deadline.
+
+    When a hedge wins in a streamed request, the tokens streamed so far came from the slower call, and the
+    final answer event is the one to use.
+
+    Args:
+        llm: The language model.
+        prompt: The prompt, as accepted by llm.invoke.
+        config (dict): The run configuration of the call, e.g. its tags.
+        deadline (float): The request deadline (epoch seconds), 0 for none.
+        name (str): Kind of call (e.g. "draft"), whose recent latencies decide when it is hedged.
+
+    Returns:
+        The model response.
+
+    Raises:
+        DeadlineExceeded: When the deadline passed before the call, or before a hedged call answered.
+    """
+    window = latency_window(name)
+    hedge_after = hedge_delay(window)
+    with _lock:
+        hedge_stats["calls"] += 1
+
+    check_deadline(deadline, f"the {name} call")
+    first = _submit(window, llm, prompt, config) if hedge_after is not None else None
+    if first is None:
+        return _invoke_inline(window, llm, prompt, config, deadline, name)
+
+    start = time.perf_counter()
+    pending = {first}
+    hedge = None
+    error = None
+    while pending:
+        wait_seconds = timeout_for(deadline)
+        if hedge_after is not None:
+            until_hedge = max(0.0, hedge_after - (time.perf_counter() - start))
+            wait_seconds = until_hedge if wait_seconds is None else min(wait_seconds, until_hedge)
+
+        done, pending = wait(pending, timeout=wait_seconds, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    with _lock:
+                        hedge_stats["hedge_wins"] += 1
+                return future.result()
+            error = error or future.exception()
+
+        if not pending:
+            break
+        if remaining(deadline) <= 0:
+            deadline_stats["exceeded"] += 1
+            with _lock:
+                hedge_stats["abandoned"] += len(pending)
+            raise DeadlineExceeded(f"Request deadline exceeded during the {name} call")
+        if hedge_after is not None and time.perf_counter() - start >= hedge_after:
+            # One hedge at most per call; past the rate cap the call just keeps waiting
+            if _may_hedge():
+                hedge = _submit(window, llm, prompt, _hedge_config(config))
+                if hedge is not None:
+                    logging.info(f"Hedging the {name} call after {hedge_after * 1000:.0f} ms")
+                    pending.add(hedge)
+                else:
+                    with _lock:
+                        hedge_stats["hedged"] -= 1
+            hedge_after = None
+
+    raise error
+
+
+def report() -> dict:
+    """Returns the hedging counters and the current hedge delay of each kind of call, in milliseconds."""
+    with _lock:
+        stats = dict(hedge_stats)
+        windows = dict(_windows)
+    for name, window in windows.items():
+        delay = hedge_delay(window)
+        if delay is not None:
+            stats[f"hedge_delay_ms_{name}"] = round(delay * 1000, 1)
+    return stats
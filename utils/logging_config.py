@@ -0,0 +1,193 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from utils import metrics
+
+# Log records are queued by the request threads and written by a background listener thread
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Rotated log file; empty to log to stderr only. Forked workers each write their own file, named after
+# their pid (agent.<pid>.log), since processes rotating one shared file lose and interleave records.
+LOG_FILE = os.getenv("LOG_FILE", "agent.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Records beyond this many queued are dropped instead of blocking the request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Messages are cut to this many characters (prompts, answers, search results...)
+LOG_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "500"))
+# Share of the requests whose verbose events are logged
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+# Requests sending this token in the X-Debug-Log header are logged in full (no sampling or payload cap)
+LOG_DEBUG_TOKEN = os.getenv("LOG_DEBUG_TOKEN", "")
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - [%(trace_id)s] %(message)s"
+
+# Marks the events logged only for sampled requests, e.g. logging.info("...: %s", payload, extra=VERBOSE)
+VERBOSE = {"verbose": True}
+
+log_stats = {"queued": 0, "dropped": 0, "sampled_out": 0, "truncated": 0}
+
+_traceback_formatter = logging.Formatter()
+_debug_request = contextvars.ContextVar("debug_request", default=False)
+_listener = None
+_queue_handler = None
+_configured = False
+_lock = threading.Lock()
+
+
+def is_debug_request(header_value) -> bool:
+    """Whether the X-Debug-Log header of a request enables full-payload logging."""
+    return bool(LOG_DEBUG_TOKEN) and header_value == LOG_DEBUG_TOKEN
+
+
+@contextmanager
+def request_logging(debug: bool = False):
+    """Runs the block with full-payload logging enabled or not for the current request."""
+    token = _debug_request.set(debug)
+    try:
+        yield
+    finally:
+        _debug_request.reset(token)
+
+
+def sampled(trace_id) -> bool:
+    """Verbose events are kept or dropped for a whole request, picked from its trace id."""
+    if LOG_SAMPLE_RATE >= 1.0:
+        return True
+    if trace_id is None or LOG_SAMPLE_RATE <= 0.0:
+        return False
+    return zlib.crc32(trace_id.encode("utf-8")) / 0xFFFFFFFF < LOG_SAMPLE_RATE
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Runs in the thread that logs, before the record is queued: tags it with the request trace id,
+    drops verbose events of requests that are not sampled, and caps the message size.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace_id = metrics.current_trace_id()
+        debug = _debug_request.get()
+        record.trace_id = trace_id or "-"
+
+        if getattr(record, "verbose", False) and not debug and not sampled(trace_id):
+            log_stats["sampled_out"] += 1
+            return False
+
+        message = record.getMessage()
+        if not debug and len(message) > LOG_PAYLOAD_CHARS:
+            message = f"{message[:LOG_PAYLOAD_CHARS]}... [{len(message)} chars]"
+            log_stats["truncated"] += 1
+        record.msg, record.args = message, None
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queue handler that drops records when the writer falls behind, instead of blocking or growing memory."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message was already formatted by the filter; the traceback is rendered here since it cannot be queued
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            log_stats["queued"] += 1
+        except queue.Full:
+            log_stats["dropped"] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", "-"),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def worker_log_file(path: str, pid: int) -> str:
+    """The log file of a forked worker: the pid inserted before the extension (agent.log -> agent.1234.log)."""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{pid}{extension}"
+
+
+def _build_handlers(forked: bool = False) -> list:
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        path = worker_log_file(LOG_FILE, os.getpid()) if forked else LOG_FILE
+        handlers.append(RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _start_listener(forked: bool = False):
+    """Starts the background writer on a new queue; called again in forked workers, where the thread does not survive."""
+    global _listener
+    _queue_handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = QueueListener(_queue_handler.queue, *_build_handlers(forked), respect_handler_level=False)
+    _listener.start()
+
+
+def _restart_listener_after_fork():
+    # The handlers inherited from the parent still hold its log file open; the worker writes its own
+    for handler in _listener.handlers:
+        handler.close()
+    _start_listener(forked=True)
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging():
+    """Routes every log record through the request filter and the bounded queue, once per process."""
+    global _configured, _queue_handler
+    if _configured:
+        return
+
+    with _lock:
+        if _configured:
+            return
+        _queue_handler = BoundedQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(RequestContextFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(LOG_LEVEL)
+
+        _start_listener()
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+        atexit.register(_stop_listener)
+        metrics.register_stats("agent_logging", lambda: dict(log_stats))
+        _configured = True
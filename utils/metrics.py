@@ -0,0 +1,480 @@
+import atexit
+import bisect
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from utils import worker_state
+
+# Latency, token and cost instrumentation of the graph nodes and external calls, served in the
+# Prometheus text format on /metrics. Metrics are kept per process; under the pre-fork server each worker
+# also writes them to WORKER_STATE_DIR, so whichever worker is scraped serves the counters and histograms
+# summed over the workers of the pod (exited ones included) and the component gauges of each worker.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Seconds between two writes of the metrics of a worker; the other workers' values are this old at most
+METRICS_SNAPSHOT_SECONDS = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "5"))
+
+# Bedrock price per 1000 tokens, used to estimate the cost of each call (Claude 3 Haiku on-demand pricing)
+BEDROCK_INPUT_COST_PER_1K = float(os.getenv("BEDROCK_INPUT_COST_PER_1K", "0.00025"))
+BEDROCK_OUTPUT_COST_PER_1K = float(os.getenv("BEDROCK_OUTPUT_COST_PER_1K", "0.00125"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384)
+STEP_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 25)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+# Trace ids accepted from the X-Trace-Id request header
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9_.:-]{1,64}")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dump(self, values: dict = None) -> list:
+        """The values (by default the current ones) as JSON: [labels, value] pairs."""
+        if values is None:
+            with self.lock:
+                values = dict(self.values)
+        return [[list(key), value] for key, value in values.items()]
+
+    @staticmethod
+    def merge(values: dict, dumped: list):
+        """Adds dumped values to `values`."""
+        for key, value in dumped:
+            key = tuple(key)
+            values[key] = values.get(key, 0.0) + value
+
+    def render(self, values: dict = None) -> list:
+        if values is None:
+            with self.lock:
+                values = dict(self.values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogram with fixed buckets and labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def dump(self, values: dict = None) -> list:
+        """The values (by default the current ones) as JSON: [labels, bucket counts, sum] triples."""
+        if values is None:
+            with self.lock:
+                values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+        return [[list(key), list(counts), total] for key, (counts, total) in values.items()]
+
+    @staticmethod
+    def merge(values: dict, dumped: list):
+        """Adds dumped values to `values`; the bucket bounds are the same in every process."""
+        for key, counts, total in dumped:
+            key = tuple(key)
+            merged = values.setdefault(key, ([0] * len(counts), 0.0))
+            values[key] = ([a + b for a, b in zip(merged[0], counts)], merged[1] + total)
+
+    def render(self, values: dict = None) -> list:
+        if values is None:
+            with self.lock:
+                values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+graph_requests = Counter("agent_graph_requests_total", "Workflow runs by mode and outcome.", ("mode", "outcome"))
+graph_duration = Histogram("agent_graph_duration_seconds", "Workflow run latency.", ("mode",))
+graph_steps = Histogram("agent_graph_steps", "Graph node runs per workflow run (loops included).", buckets=STEP_BUCKETS)
+node_duration = Histogram("agent_node_duration_seconds", "Graph node latency.", ("node",))
+node_errors = Counter("agent_node_errors_total", "Graph node failures.", ("node",))
+external_duration = Histogram("agent_external_call_duration_seconds", "Latency of the Llama Guard, Bedrock and search calls.", ("service",))
+external_errors = Counter("agent_external_call_errors_total", "Failed external calls.", ("service",))
+llm_tokens = Counter("agent_llm_tokens_total", "Bedrock tokens by direction and graph node.", ("direction", "node"))
+llm_call_tokens = Histogram("agent_llm_call_tokens", "Bedrock tokens per call.", ("direction",), buckets=TOKEN_BUCKETS)
+llm_cost = Counter("agent_llm_cost_usd_total", "Estimated Bedrock cost, in US dollars.", ("node",))
+moderation_batch_size = Histogram("agent_llama_guard_batch_size", "Inputs per Llama Guard batch.", buckets=BATCH_BUCKETS)
+
+REGISTRY = [
+    graph_requests, graph_duration, graph_steps, node_duration, node_errors, external_duration,
+    external_errors, llm_tokens, llm_call_tokens, llm_cost, moderation_batch_size,
+]
+
+# Counters kept by the components themselves (caches, prefetcher, session store...), read at scrape time
+_stats_sources = {}
+
+
+def register_stats(prefix: str, source: Callable[[], dict]):
+    """Exports the numeric values of a component stats dict as `<prefix>_<key>` gauges."""
+    _stats_sources[prefix] = source
+
+
+def collect_stats() -> dict:
+    """The numeric values of the registered component stats, by gauge name."""
+    gauges = {}
+    for prefix, source in sorted(_stats_sources.items()):
+        try:
+            stats = source() or {}
+        except Exception as e:
+            logging.error(f"Failed to collect the {prefix} stats: {e}")
+            continue
+        for key, value in sorted(stats.items()):
+            if isinstance(value, (int, float)):
+                gauges[f"{prefix}_{key}"] = value
+    return gauges
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format; those of every worker under the pre-fork server."""
+    if worker_state.WORKER_STATE_DIR:
+        return _render_workers()
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, value in collect_stats().items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Metrics snapshots of the workers in WORKER_STATE_DIR: one per running worker, and the sum of the exited ones
+SNAPSHOT_PREFIX = "metrics."
+EXITED_SNAPSHOT = "metrics.exited.json"
+
+
+def _snapshot_path(name: str) -> str:
+    return os.path.join(worker_state.WORKER_STATE_DIR, name)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to read the metrics snapshot {path}: {e}")
+        return None
+
+
+def _write_json(path: str, data: dict):
+    # Written aside and renamed, so readers never see a partial snapshot
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def write_snapshot():
+    """Writes the metrics and the component stats of this worker to the worker state directory."""
+    _write_json(_snapshot_path(f"{SNAPSHOT_PREFIX}{os.getpid()}.json"), {
+        "worker": os.getpid(),
+        "metrics": {metric.name: metric.dump() for metric in REGISTRY},
+        "stats": collect_stats(),
+    })
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(METRICS_SNAPSHOT_SECONDS)
+        try:
+            write_snapshot()
+        except Exception as e:
+            logging.error(f"Failed to write the metrics snapshot: {e}")
+
+
+def start_snapshots():
+    """
+    Starts writing the metrics of this worker to the worker state directory, every METRICS_SNAPSHOT_SECONDS
+    and at exit; called in each worker after the fork. Values inherited from the master are dropped, so
+    they are not counted once per worker.
+    """
+    if not worker_state.WORKER_STATE_DIR:
+        return
+    for metric in REGISTRY:
+        with metric.lock:
+            metric.values.clear()
+    threading.Thread(target=_snapshot_loop, name="metrics-snapshot", daemon=True).start()
+    atexit.register(write_snapshot)
+
+
+def retire_worker(pid: int):
+    """Adds the counts of an exited worker to those of the earlier exited workers; called by the master."""
+    path = _snapshot_path(f"{SNAPSHOT_PREFIX}{pid}.json")
+    snapshot = _read_json(path)
+    if snapshot is None:
+        return
+    exited = _read_json(_snapshot_path(EXITED_SNAPSHOT)) or {"worker": None, "metrics": {}}
+    for metric in REGISTRY:
+        values = {}
+        metric.merge(values, exited["metrics"].get(metric.name, []))
+        metric.merge(values, snapshot["metrics"].get(metric.name, []))
+        exited["metrics"][metric.name] = metric.dump(values)
+    _write_json(_snapshot_path(EXITED_SNAPSHOT), exited)
+    os.remove(path)
+
+
+def _render_workers() -> str:
+    # This worker's snapshot is written first, so its own values are current
+    write_snapshot()
+    snapshots = []
+    for name in sorted(os.listdir(worker_state.WORKER_STATE_DIR)):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(".json"):
+            snapshot = _read_json(_snapshot_path(name))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+
+    lines = []
+    for metric in REGISTRY:
+        values = {}
+        for snapshot in snapshots:
+            metric.merge(values, snapshot["metrics"].get(metric.name, []))
+        lines.extend(metric.render(values))
+
+    # Gauges such as a limit or a hit rate do not add up across workers: each one is labeled with its pid
+    gauges = {}
+    for snapshot in snapshots:
+        for name, value in snapshot.get("stats", {}).items():
+            gauges.setdefault(name, []).append((snapshot["worker"], value))
+    for name, values in sorted(gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for worker, value in sorted(values):
+            lines.append(f'{name}{{worker="{worker}"}} {_format_value(value)}')
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Timings of one request, tied together by its trace id."""
+
+    def __init__(self, trace_id: str):
+        self.id = trace_id
+        self.start = time.perf_counter()
+        self.spans = []
+        self.steps = 0
+
+    def summary(self) -> str:
+        summary = f"{(time.perf_counter() - self.start) * 1000:.1f} ms, {self.steps} graph steps"
+        if self.spans:
+            summary += " | " + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.spans)
+        return summary
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+def valid_trace_id(trace_id) -> bool:
+    return isinstance(trace_id, str) and TRACE_ID_PATTERN.fullmatch(trace_id) is not None
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.id if trace is not None else None
+
+
+@contextmanager
+def trace_request(trace_id: str = None):
+    """
+    Runs the block under a request trace, logging its timings at the end. Inside an active
+    trace without an explicit id, the block joins it.
+
+    Args:
+        trace_id (str): The id of the trace, generated when not given.
+
+    Yields:
+        Trace: The active trace.
+    """
+    active = _current_trace.get()
+    if active is not None and trace_id is None:
+        yield active
+        return
+
+    trace = Trace(trace_id or uuid.uuid4().hex)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if METRICS_ENABLED:
+            logging.info(f"Trace {trace.id}: {trace.summary()}")
+
+
+@contextmanager
+def timed(name: str, histogram: Histogram, errors: Counter = None, **labels):
+    """Observes the latency of the block, adding it to the current trace, and counts its failures."""
+    if not METRICS_ENABLED:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if errors is not None:
+            errors.inc(**labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, elapsed))
+
+
+def external_call(service: str):
+    """Times a call to an external service (llama_guard, bedrock, tavily...)."""
+    return timed(service, external_duration, external_errors, service=service)
+
+
+def instrument_node(name: str, node: Callable) -> Callable:
+    """
+    Wraps a graph node to time each run and count it as a step of the request trace.
+    The node is called with the state and the run config.
+    """
+    def instrumented(state, config):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.steps += 1
+        with timed(name, node_duration, node_errors, node=name):
+            return node(state, config)
+
+    return instrumented
+
+
+@contextmanager
+def observe_run(mode: str):
+    """Counts and times a workflow run, and records its number of graph steps."""
+    with trace_request() as trace:
+        steps_before = trace.steps
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            yield trace
+            outcome = "ok"
+        finally:
+            if METRICS_ENABLED:
+                graph_requests.inc(mode=mode, outcome=outcome)
+                graph_duration.observe(time.perf_counter() - start, mode=mode)
+                graph_steps.observe(trace.steps - steps_before)
+
+
+class BedrockMetricsHandler(BaseCallbackHandler):
+    """LangChain callback timing every Bedrock call and counting its tokens and estimated cost per graph node."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self.started[run_id] = (time.perf_counter(), (metadata or {}).get("langgraph_node", "none"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, metadata=metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self.started.pop(run_id, None)
+        if started is None or not METRICS_ENABLED:
+            return
+        start, node = started
+        elapsed = time.perf_counter() - start
+        external_duration.observe(elapsed, service="bedrock")
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(("bedrock", elapsed))
+
+        input_tokens, output_tokens = _token_usage(response)
+        llm_tokens.inc(input_tokens, direction="input", node=node)
+        llm_tokens.inc(output_tokens, direction="output", node=node)
+        llm_call_tokens.observe(input_tokens, direction="input")
+        llm_call_tokens.observe(output_tokens, direction="output")
+        llm_cost.inc(
+            input_tokens / 1000 * BEDROCK_INPUT_COST_PER_1K + output_tokens / 1000 * BEDROCK_OUTPUT_COST_PER_1K,
+            node=node,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if self.started.pop(run_id, None) is not None and METRICS_ENABLED:
+            external_errors.inc(service="bedrock")
+
+
+def _token_usage(response) -> tuple:
+    """Input and output tokens of an LLM result, from the message usage metadata or the provider usage."""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not (input_tokens or output_tokens):
+        usage = (response.llm_output or {}).get("usage") or {}
+        input_tokens = usage.get("prompt_tokens", usage.get("input_tokens", 0))
+        output_tokens = usage.get("completion_tokens", usage.get("output_tokens", 0))
+    return input_tokens, output_tokens
+
+
+bedrock_metrics = BedrockMetricsHandler()
@@ -1,74 +1,143 @@
-from utils.model_loader import model, tokenizer  
+from utils import model_loader
+from utils.moderation_prompt import categories, category_prompt, build_moderation_conversation
+from utils.batching import MicroBatcher
+from utils.deadline import DeadlineExceeded, check_deadline, deadline_stats, timeout_for
+from utils.topic_classifier import TOPIC_CLASSIFIER, TOPIC_CONFIDENCE_THRESHOLD, classify_civil_engineering
+from utils.logging_config import VERBOSE
+from utils.metrics import external_call, moderation_batch_size
+from utils.moderation_cache import (
+    MODERATION_CACHE, MODERATION_CACHE_SIZE, MODERATION_CACHE_TTL, MODERATION_CACHE_LLM_TTL, MODERATION_CACHE_BACKEND,
+    VerdictCache, create_shared_backend,
+)
+from transformers import DynamicCache
+from typing import List
+from concurrent.futures import Executor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import contextvars
+import hashlib
+import json
+import logging
+import os
 import re
+import torch
 
-categories = {
-    "S1": "Violent Crimes",
-    "S2": "Non-Violent Crimes",
-    "S3": "Sex-Related Crimes",
-    "S4": "Child Sexual Exploitation",
-    "S5": "Defamation",
-    "S6": "Specialized Advice",
-    "S7": "Privacy",
-    "S8": "Intellectual Property",
-    "S9": "Indiscriminate Weapons",
-    "S10": "Hate",
-    "S11": "Suicide & Self-Harm",
-    "S12": "Sexual Content",
-    "S13": "Elections"
-}
+# Dynamic micro-batching of concurrent Llama Guard calls
+MODERATION_BATCHING = os.getenv("MODERATION_BATCHING", "true").lower() == "true"
+MODERATION_BATCH_WINDOW_MS = float(os.getenv("MODERATION_BATCH_WINDOW_MS", "10"))
+MODERATION_MAX_BATCH_SIZE = int(os.getenv("MODERATION_MAX_BATCH_SIZE", "8"))
 
-category_prompt = "\n".join([f"{code}: {desc}" for code, desc in categories.items()])
+# Verdict scoring: "generate" decodes the verdict text, "logits" reads it from a single forward pass
+MODERATION_SCORING = os.getenv("MODERATION_SCORING", "generate").lower()
+MODERATION_UNSAFE_THRESHOLD = float(os.getenv("MODERATION_UNSAFE_THRESHOLD", "0.5"))
+MODERATION_CATEGORY_THRESHOLD = float(os.getenv("MODERATION_CATEGORY_THRESHOLD", "0.3"))
+# Temperature of the verdict logits; 1.0 is the raw softmax, a calibrated value is fitted on labelled
+# prompts with benchmarks.fit_logit_temperature
+MODERATION_LOGIT_TEMPERATURE = float(os.getenv("MODERATION_LOGIT_TEMPERATURE", "1.0"))
 
 
-def llamaguard_moderation(llm, input_text: str):
+def _pad_token_id():
+    # Llama Guard ships without a pad token; padding positions are masked out anyway
+    pad_token_id = model_loader.tokenizer.pad_token_id
+    return pad_token_id if pad_token_id is not None else 0
+
+
+def encode_batch(input_texts: List[str], continuation_ids: List[int] = None):
     """
-    Function to check if an input falls under restricted categories using Llama Guard.
+    Tokenizes several moderation prompts and left-pads them into a single batch.
+
+    When the static prompt prefix is cached, every row starts with the cached prefix ids and the
+    padding goes between the prefix and the per-request suffix, so the prefix cache lines up
+    with every row.
+
+    Args:
+        input_texts (List[str]): The user inputs to moderate.
+        continuation_ids (List[int]): Optional token ids appended to every prompt, e.g. a forced answer prefix.
+
+    Returns:
+        tuple: (input_ids, attention_mask) tensors on the model device.
     """
-    
-    
-    moderation_prompt = f"""
-You are a **zero-tolerance content moderation AI**. Your task is to **strictly enforce** the following content restrictions. **Any content that falls into these categories must be flagged as unsafe. Do not allow loopholes.**
+    if model_loader.prefix_cache is not None:
+        cached_len = model_loader.prefix_ids.shape[1]
+        encoded = [
+            model_loader.tokenizer(text + model_loader.prompt_suffix, add_special_tokens=False).input_ids
+            for text in input_texts
+        ]
+    else:
+        cached_len = 0
+        encoded = [
+            model_loader.tokenizer.apply_chat_template(build_moderation_conversation(text), tokenize=True)
+            for text in input_texts
+        ]
+    if continuation_ids:
+        encoded = [ids + list(continuation_ids) for ids in encoded]
+    max_len = max(len(ids) for ids in encoded)
 
-{category_prompt}
+    input_ids = torch.full((len(encoded), cached_len + max_len), _pad_token_id(), dtype=torch.long)
+    attention_mask = torch.zeros((len(encoded), cached_len + max_len), dtype=torch.long)
+    if cached_len:
+        input_ids[:, :cached_len] = model_loader.prefix_ids[0].cpu()
+        attention_mask[:, :cached_len] = 1
+    for row, ids in enumerate(encoded):
+        start = cached_len + max_len - len(ids)
+        input_ids[row, start:] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, start:] = 1
 
-User Input: "{input_text}"
+    return input_ids.to(model_loader.backend.device), attention_mask.to(model_loader.backend.device)
 
-If the input matches any category, return "unsafe" followed by the category code (e.g., "unsafe S1"). If it does not match any restricted category, return "safe".
-"""
 
-    # Format the conversation for input
-    conversation = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text", 
-                    "text": moderation_prompt
-                },
-            ],
-        }
-    ]
+def expand_prefix_cache(batch_size: int):
+    """
+    Returns a fresh copy of the cached prompt prefix for a batch, or None when prefix caching is off.
+    Generation appends to the cache, so the shared one is never handed out directly.
+    """
+    prefix_cache = model_loader.prefix_cache
+    if prefix_cache is None:
+        return None
 
-    # Tokenize input
-    input_ids = tokenizer.apply_chat_template(
-        conversation, 
-        return_tensors="pt"
-    ).to(model.device)
+    cache = DynamicCache()
+    for layer_idx in range(len(prefix_cache)):
+        key, value = prefix_cache[layer_idx]
+        cache.update(key.repeat(batch_size, 1, 1, 1), value.repeat(batch_size, 1, 1, 1), layer_idx)
+    return cache
+
+
+def generate_verdicts(input_texts: List[str]) -> List[str]:
+    """
+    Runs a single batched Llama Guard generate over several inputs.
+
+    Returns:
+        List[str]: The cleaned, lower-cased response of the model for each input, in order.
+    """
+    model_loader.ensure_model_loaded()
+    input_ids, attention_mask = encode_batch(input_texts)
 
     # Get response from the model
     prompt_len = input_ids.shape[1]
-    output = model.generate(
-        input_ids,
-        max_new_tokens=10,
-        pad_token_id=0,
-    )
+    with torch.inference_mode():
+        output = model_loader.backend.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            past_key_values=expand_prefix_cache(input_ids.shape[0]),
+            max_new_tokens=10,
+            pad_token_id=_pad_token_id(),
+        )
     generated_tokens = output[:, prompt_len:]
 
-    # Decode and clean the response
-    response_text = tokenizer.decode(generated_tokens[0]).strip().lower()
-    response_text = response_text.replace("<|eot_id|>", "").strip()  # Remove special tokens
+    # Decode and clean the responses, dropping anything after the end of turn (padding of finished rows)
+    responses = []
+    for tokens in generated_tokens:
+        response_text = model_loader.tokenizer.decode(tokens).strip().lower()
+        responses.append(response_text.split("<|eot_id|>")[0].strip())
+    return responses
+
+
+def parse_verdict(response_text: str):
+    """
+    Extracts the verdict and the flagged categories from a Llama Guard response.
 
-    # Extract flagged categories
+    Returns:
+        dict: "allowed" ("SAFE" or "UNSAFE") and "flagged_categories".
+    """
     flagged_categories = []
     if "unsafe" in response_text:
         match = re.findall(r"s\d+", response_text)  # Extract category codes like S1, S2, etc.
@@ -77,31 +146,255 @@ If the input matches any category, return "unsafe" followed by the category code
     # Determine if content is allowed
     allowed = "SAFE" if not flagged_categories else "UNSAFE"
 
-    # Civil Engineering Check (Same as before)
-    is_civil_engineer_response = llm.invoke(f"""
-        You are an AI that determines whether the given input is related to civil engineering. 
-        Civil engineering includes topics such as structural engineering, transportation, geotechnics, 
-        construction materials, water resources, infrastructure development, surveying, and urban planning.
+    return {"allowed": allowed, "flagged_categories": flagged_categories}
+
+
+_scoring_tokens = None
+
+
+def _get_scoring_tokens():
+    """
+    Works out, once, which token ids carry the verdict and the category in a Llama Guard answer.
+
+    The answer looks like "unsafe\nS1": the verdict is read from the first answer token, and the
+    category from the token where the category codes diverge once the shared "unsafe\nS" is forced.
+
+    Returns:
+        dict: "safe" and "unsafe" token ids, the forced continuation ids and the token id of each category code.
+    """
+    global _scoring_tokens
+    if _scoring_tokens is None:
+        encode = lambda text: model_loader.tokenizer(text, add_special_tokens=False).input_ids
+        sequences = {code: encode(f"unsafe\n{code}") for code in categories}
+
+        # Longest token prefix shared by every "unsafe\n<code>" answer
+        shared = []
+        for tokens in zip(*sequences.values()):
+            if len(set(tokens)) > 1:
+                break
+            shared.append(tokens[0])
+
+        category_ids = {code: ids[len(shared)] for code, ids in sequences.items()}
+        if len(set(category_ids.values())) < len(category_ids):
+            logging.warning("Some moderation category codes share a token; their scores will be identical.")
+
+        _scoring_tokens = {
+            "safe": encode("safe")[0],
+            "unsafe": shared[0],
+            "continuation": shared,
+            "categories": category_ids,
+        }
+    return _scoring_tokens
+
+
+def score_verdicts(input_texts: List[str]):
+    """
+    Scores several inputs with a single Llama Guard forward pass instead of decoding an answer.
+
+    The verdict probability comes from the "safe" vs "unsafe" logits of the first answer token;
+    the category probabilities come from the category code logits after forcing "unsafe\nS".
+    Both are a softmax over those tokens, divided by MODERATION_LOGIT_TEMPERATURE first: the raw
+    softmax at the default of 1.0, calibrated once a temperature is fitted (benchmarks.fit_logit_temperature).
+
+    Returns:
+        List[dict]: For each input, "allowed", "flagged_categories", "unsafe_probability" and
+        "category_scores" (probability of unsafe content in each category).
+    """
+    model_loader.ensure_model_loaded()
+    scoring = _get_scoring_tokens()
+    continuation = scoring["continuation"]
+    input_ids, attention_mask = encode_batch(input_texts, continuation_ids=continuation)
+
+    cache = expand_prefix_cache(input_ids.shape[0])
+    cached_len = cache.get_seq_length() if cache is not None else 0
+    position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+    # Only the logits of the last prompt token and of the forced continuation are needed
+    with torch.inference_mode():
+        logits = model_loader.backend.logits(
+            input_ids[:, cached_len:],
+            attention_mask=attention_mask,
+            position_ids=position_ids[:, cached_len:],
+            past_key_values=cache,
+            logits_to_keep=len(continuation) + 1,
+        ).float() / MODERATION_LOGIT_TEMPERATURE
+
+    verdict_logits = logits[:, 0, [scoring["safe"], scoring["unsafe"]]]
+    unsafe_probabilities = torch.softmax(verdict_logits, dim=-1)[:, 1]
+
+    codes = list(scoring["categories"])
+    category_logits = logits[:, -1, list(scoring["categories"].values())]
+    category_probabilities = torch.softmax(category_logits, dim=-1) * unsafe_probabilities[:, None]
+
+    verdicts = []
+    for unsafe_probability, probabilities in zip(unsafe_probabilities.tolist(), category_probabilities.tolist()):
+        category_scores = {categories[code]: probability for code, probability in zip(codes, probabilities)}
 
-        Evaluate the following input:
-        "{input_text}"
+        flagged_categories = []
+        if unsafe_probability >= MODERATION_UNSAFE_THRESHOLD:
+            flagged_categories = [
+                name for name, probability in category_scores.items()
+                if probability / unsafe_probability >= MODERATION_CATEGORY_THRESHOLD
+            ] or [max(category_scores, key=category_scores.get)]
 
-        If the input is related to civil engineering in any way, respond strictly with "True".  
-        If it is not related, respond strictly with "False".  
-        Provide no explanations, additional text, or variations in formatting.
-    """) 
-    
-    is_civil_engineer = is_civil_engineer_response.content.strip().lower() == "true"
+        verdicts.append({
+            "allowed": "SAFE" if not flagged_categories else "UNSAFE",
+            "flagged_categories": flagged_categories,
+            "unsafe_probability": unsafe_probability,
+            "category_scores": category_scores,
+        })
+    return verdicts
+
+
+def moderate_batch(input_texts: List[str]):
+    """Classifies a batch of inputs with the configured scoring mode."""
+    moderation_batch_size.observe(len(input_texts))
+    if model_loader.MODEL_BACKEND == "stub":
+        model_loader.ensure_model_loaded()
+        return model_loader.backend.moderate(input_texts, unsafe_category=categories["S1"])
+
+    if MODERATION_SCORING == "logits":
+        return score_verdicts(input_texts)
+
+    verdicts = []
+    for response_text in generate_verdicts(input_texts):
+        logging.debug("Llama Guard response: %s", response_text, extra=VERBOSE)
+        verdicts.append(parse_verdict(response_text))
+    return verdicts
+
+
+moderation_batcher = MicroBatcher(
+    moderate_batch,
+    max_batch_size=MODERATION_MAX_BATCH_SIZE,
+    window_ms=MODERATION_BATCH_WINDOW_MS,
+    name="llamaguard-batcher",
+) if MODERATION_BATCHING else None
+
+
+def _moderation_timed_out():
+    deadline_stats["exceeded"] += 1
+    return DeadlineExceeded("Request deadline exceeded during moderation")
+
+
+def llamaguard_verdict(input_text: str, deadline: float = 0.0):
+    """
+    Classifies a single input with Llama Guard, batching it with concurrent calls when enabled.
+    A batched call is waited for until the request deadline at most; its verdict is then discarded.
+
+    Raises:
+        DeadlineExceeded: When the batched verdict did not arrive before the deadline.
+    """
+    with external_call("llama_guard"):
+        if moderation_batcher is not None:
+            try:
+                verdict = moderation_batcher(input_text, timeout_for(deadline))
+            except FutureTimeoutError:
+                raise _moderation_timed_out() from None
+        else:
+            verdict = moderate_batch([input_text])[0]
+
+    if "unsafe_probability" in verdict:
+        logging.info(f"Llama Guard unsafe probability: {verdict['unsafe_probability']:.3f}")
+    return verdict
+
+
+def moderation_fingerprint() -> str:
+    """
+    Digest of everything besides the input that can change a verdict; cached verdicts are keyed on it.
+    Only configuration is included, never load state (such as the prefix KV cache, which leaves the verdicts
+    unchanged), so the key is the same before and after startup and in every worker sharing the backend.
+    """
+    config = {
+        "categories": categories,
+        "model_id": model_loader.model_id,
+        "model": [model_loader.MODEL_BACKEND, model_loader.MODEL_QUANTIZATION],
+        "scoring": MODERATION_SCORING,
+        "thresholds": [MODERATION_UNSAFE_THRESHOLD, MODERATION_CATEGORY_THRESHOLD, MODERATION_LOGIT_TEMPERATURE],
+        "topic_classifier": [TOPIC_CLASSIFIER, TOPIC_CONFIDENCE_THRESHOLD],
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+verdict_cache = VerdictCache(
+    moderation_fingerprint,
+    max_entries=MODERATION_CACHE_SIZE,
+    ttl_seconds=MODERATION_CACHE_TTL,
+    backend=create_shared_backend(MODERATION_CACHE_BACKEND),
+) if MODERATION_CACHE else None
+
+
+def llamaguard_moderation(llm, input_text: str, executor: Executor = None, deadline: float = 0.0):
+    """
+    Function to check if an input falls under restricted categories using Llama Guard.
+
+    Verdicts are cached on the normalized input when MODERATION_CACHE is enabled; those whose topic check
+    was answered by the LLM only for MODERATION_CACHE_LLM_TTL seconds.
+
+    Raises:
+        DeadlineExceeded: When the checks did not complete before the request deadline.
+    """
+    if verdict_cache is not None:
+        cached = verdict_cache.get(input_text)
+        if cached is not None:
+            logging.info("Moderation verdict served from cache.")
+            return {"input": input_text, **cached}
+
+    result, answered_by_llm = _moderate(llm, input_text, executor, deadline)
+
+    if verdict_cache is not None and not (answered_by_llm and MODERATION_CACHE_LLM_TTL <= 0):
+        verdict = {key: value for key, value in result.items() if key != "input"}
+        verdict_cache.set(input_text, verdict, MODERATION_CACHE_LLM_TTL if answered_by_llm else None)
+    return result
+
+
+def _moderate(llm, input_text: str, executor: Executor = None, deadline: float = 0.0):
+    """
+    Runs the Llama Guard verdict and the civil engineering check for an input.
+
+    When an executor is given, the Llama Guard verdict and the civil engineering check run
+    concurrently and the first definitive UNSAFE verdict is returned without waiting for the other.
+    Both checks are required, so the request fails once its deadline passes before they complete.
+
+    Returns:
+        tuple: (result, answered_by_llm), where answered_by_llm tells whether the topic check fell back to the LLM.
+    """
+    if executor is None:
+        verdict = llamaguard_verdict(input_text, deadline)
+        check_deadline(deadline, "the civil engineering check")
+
+        # Civil Engineering Check, answered by the local classifier when it is confident
+        is_civil_engineer, answered_by_llm = classify_civil_engineering(llm, input_text, deadline)
+    else:
+        # The checks run in the request context, so their calls are timed under the request trace
+        checks = {
+            executor.submit(contextvars.copy_context().run, llamaguard_verdict, input_text, deadline): "llamaguard",
+            executor.submit(contextvars.copy_context().run, classify_civil_engineering, llm, input_text, deadline): "civil_engineering",
+        }
+        results = {}
+        try:
+            for future in as_completed(checks, timeout=timeout_for(deadline)):
+                results[checks[future]] = future.result()
+                if results.get("llamaguard", {}).get("allowed") == "UNSAFE" or results.get("civil_engineering", (False,))[0]:
+                    logging.info(f"Early moderation exit on the {checks[future]} check.")
+                    break
+        except FutureTimeoutError:
+            raise _moderation_timed_out() from None
+        finally:
+            for pending in checks:
+                pending.cancel()
+
+        verdict = results.get("llamaguard", {"allowed": "SAFE", "flagged_categories": []})
+        is_civil_engineer, answered_by_llm = results.get("civil_engineering", (False, False))
 
     if is_civil_engineer: 
         return {
             "input": input_text,
             "allowed": "UNSAFE",
             "flagged_categories": "Civil Engineering"
-        }
+        }, answered_by_llm
 
     return {
         "input": input_text,
-        "allowed": allowed,
-        "flagged_categories": flagged_categories
-    }
+        "allowed": verdict["allowed"],
+        "flagged_categories": verdict["flagged_categories"]
+    }, answered_by_llm
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+from utils.cache import TTLCache, normalize_text
+
+# Cache of moderation verdicts keyed on the normalized input
+MODERATION_CACHE = os.getenv("MODERATION_CACHE", "true").lower() == "true"
+MODERATION_CACHE_SIZE = int(os.getenv("MODERATION_CACHE_SIZE", "10000"))
+MODERATION_CACHE_TTL = float(os.getenv("MODERATION_CACHE_TTL", "3600"))
+# Time to live of the verdicts whose topic check was answered by the LLM, which may answer differently next time;
+# 0 to not cache them
+MODERATION_CACHE_LLM_TTL = float(os.getenv("MODERATION_CACHE_LLM_TTL", "300"))
+
+# Optional shared backend so pods reuse each other's verdicts: "" (none), "redis" or "memory" (in-process fake)
+MODERATION_CACHE_BACKEND = os.getenv("MODERATION_CACHE_BACKEND", "").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class SharedCacheBackend(ABC):
+    """Interface of a cache shared between pods. Values are JSON strings."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Returns the value stored under the key, or None."""
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl_seconds: float):
+        """Stores the value under the key for ttl_seconds (no expiry when zero or less)."""
+
+
+class InProcessSharedBackend(SharedCacheBackend):
+    """In-process stand-in for a shared backend, for tests and local runs."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value, expires_at = self._values.get(key, (None, None))
+            if expires_at is not None and time.time() >= expires_at:
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl_seconds if ttl_seconds > 0 else None)
+
+
+class RedisCacheBackend(SharedCacheBackend):
+    """Redis-backed shared cache. Connection errors are logged and treated as cache misses."""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("MODERATION_CACHE_BACKEND=redis requires the redis package (pip install redis)") from e
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self._client.get(key)
+        except Exception as e:
+            logging.warning(f"Shared cache read failed: {e}")
+            return None
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        try:
+            self._client.set(key, value, ex=int(ttl_seconds) if ttl_seconds > 0 else None)
+        except Exception as e:
+            logging.warning(f"Shared cache write failed: {e}")
+
+
+def create_shared_backend(name: str) -> Optional[SharedCacheBackend]:
+    """Builds the shared backend named by MODERATION_CACHE_BACKEND, or None when it is empty."""
+    if name == "redis":
+        return RedisCacheBackend(REDIS_URL)
+    if name == "memory":
+        return InProcessSharedBackend()
+    if name:
+        raise ValueError(f"Unknown moderation cache backend: {name} (expected redis or memory)")
+    return None
+
+
+class VerdictCache:
+    """
+    Two-level cache of moderation verdicts: an in-process LRU/TTL cache, optionally backed by a
+    shared store. Keys carry a fingerprint of the moderation configuration (categories, model id,
+    scoring mode), so verdicts are invalidated automatically whenever it changes.
+    """
+
+    def __init__(self, fingerprint: Callable[[], str], max_entries: int = 10000, ttl_seconds: float = 3600.0,
+                 backend: Optional[SharedCacheBackend] = None, namespace: str = "moderation"):
+        """
+        Args:
+            fingerprint: Returns a digest of everything that can change a verdict besides the input.
+            max_entries (int): Capacity of the in-process cache.
+            ttl_seconds (float): Time to live of a verdict, in both levels.
+            backend (SharedCacheBackend): Optional cache shared between pods.
+            namespace (str): Key prefix in the shared backend.
+        """
+        self.fingerprint = fingerprint
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.namespace = namespace
+        self.local = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.shared_hits = 0
+        self._current_fingerprint = None
+
+    def _key(self, input_text: str) -> str:
+        fingerprint = self.fingerprint()
+        if fingerprint != self._current_fingerprint:
+            if self._current_fingerprint is not None:
+                logging.info("Moderation configuration changed. Invalidating cached verdicts.")
+            self.local.clear()
+            self._current_fingerprint = fingerprint
+
+        digest = hashlib.sha256(normalize_text(input_text).encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{fingerprint}:{digest}"
+
+    def get(self, input_text: str) -> Optional[dict]:
+        """Returns the cached verdict for an input, or None."""
+        key = self._key(input_text)
+        verdict = self.local.get(key)
+        if verdict is not None or self.backend is None:
+            return verdict
+
+        value = self.backend.get(key)
+        if value is None:
+            return None
+
+        verdict = json.loads(value)
+        self.shared_hits += 1
+        self.local.set(key, verdict)
+        return verdict
+
+    def set(self, input_text: str, verdict: dict, ttl_seconds: Optional[float] = None):
+        """Caches the verdict of an input, for ttl_seconds when given instead of the cache's time to live."""
+        key = self._key(input_text)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.local.set(key, verdict, ttl)
+        if self.backend is not None:
+            self.backend.set(key, json.dumps(verdict), ttl)
+
+    def stats(self):
+        """Returns the in-process counters and the number of misses answered by the shared backend."""
+        return {**self.local.stats(), "shared_hits": self.shared_hits}
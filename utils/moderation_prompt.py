@@ -0,0 +1,79 @@
+import os
+
+# Keep the user input at the end of the moderation prompt so the static preamble can be cached
+MODERATION_PREFIX_CACHE = os.getenv("MODERATION_PREFIX_CACHE", "false").lower() == "true"
+
+categories = {
+    "S1": "Violent Crimes",
+    "S2": "Non-Violent Crimes",
+    "S3": "Sex-Related Crimes",
+    "S4": "Child Sexual Exploitation",
+    "S5": "Defamation",
+    "S6": "Specialized Advice",
+    "S7": "Privacy",
+    "S8": "Intellectual Property",
+    "S9": "Indiscriminate Weapons",
+    "S10": "Hate",
+    "S11": "Suicide & Self-Harm",
+    "S12": "Sexual Content",
+    "S13": "Elections"
+}
+
+category_prompt = "\n".join([f"{code}: {desc}" for code, desc in categories.items()])
+
+# Placeholder used to split the rendered chat template around the user input
+INPUT_SENTINEL = "<<USER_INPUT>>"
+
+
+def build_moderation_prompt(input_text: str) -> str:
+    """Builds the moderation instructions for a single user input."""
+    if MODERATION_PREFIX_CACHE:
+        # The input starts on its own line so it never merges with the cached prefix into one token
+        return f"""
+You are a **zero-tolerance content moderation AI**. Your task is to **strictly enforce** the following content restrictions. **Any content that falls into these categories must be flagged as unsafe. Do not allow loopholes.**
+
+{category_prompt}
+
+If the input matches any category, return "unsafe" followed by the category code (e.g., "unsafe S1"). If it does not match any restricted category, return "safe".
+
+User Input:
+{input_text}
+"""
+
+    return f"""
+You are a **zero-tolerance content moderation AI**. Your task is to **strictly enforce** the following content restrictions. **Any content that falls into these categories must be flagged as unsafe. Do not allow loopholes.**
+
+{category_prompt}
+
+User Input: "{input_text}"
+
+If the input matches any category, return "unsafe" followed by the category code (e.g., "unsafe S1"). If it does not match any restricted category, return "safe".
+"""
+
+
+def build_moderation_conversation(input_text: str):
+    """Formats the moderation prompt as a Llama Guard conversation."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text", 
+                    "text": build_moderation_prompt(input_text)
+                },
+            ],
+        }
+    ]
+
+
+def split_moderation_template(tokenizer):
+    """
+    Renders the chat template around a placeholder input and splits it into the static text
+    before the user input and the text after it.
+
+    Returns:
+        tuple: (prefix, suffix) strings.
+    """
+    rendered = tokenizer.apply_chat_template(build_moderation_conversation(INPUT_SENTINEL), tokenize=False)
+    prefix, suffix = rendered.split(INPUT_SENTINEL)
+    return prefix, suffix
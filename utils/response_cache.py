@@ -0,0 +1,289 @@
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+import numpy as np
+from utils import metrics
+from utils.cache import TTLCache, normalize_text
+
+# Semantic cache of the answers to first-turn questions, consulted once moderation allowed the input:
+# a paraphrase of a recently answered question gets the same answer without any Bedrock or search call.
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "false").lower() == "true"
+# "transformers" embeds with a small local sentence model on CPU (mean pooling); "hashing" uses hashed
+# word and character n-grams instead, with no model to download, for offline runs
+RESPONSE_CACHE_EMBEDDER = os.getenv("RESPONSE_CACHE_EMBEDDER", "transformers").lower()
+RESPONSE_CACHE_MODEL = os.getenv("RESPONSE_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Optional local snapshot of the embedding model (e.g. baked into the image or on a volume), downloaded on first use
+RESPONSE_CACHE_SNAPSHOT_DIR = os.getenv("RESPONSE_CACHE_SNAPSHOT_DIR", "")
+# Cosine similarity above which a cached question counts as the same question. A false hit serves the answer
+# of another question, so the default is conservative; lower it only after benchmarks.bench_response_cache
+# shows the precision holds on your questions with your embedding model.
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Cap on the memory of the cache (embedding matrix and cached texts); the least recently used answers go first
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+HASHING_DIMENSIONS = 1024
+EMBEDDING_MAX_TOKENS = 128
+
+
+def resolve_embedder_path(model_name: str, snapshot_dir: str) -> str:
+    """
+    Returns where to load the embedding model from: the local snapshot directory when one is set
+    (downloading the weights, config and tokenizer there if they are missing), the model name otherwise.
+    """
+    if not snapshot_dir:
+        return model_name
+
+    if not os.path.isfile(os.path.join(snapshot_dir, "config.json")):
+        from huggingface_hub import snapshot_download
+
+        logging.info(f"Downloading {model_name} snapshot to {snapshot_dir}")
+        snapshot_download(
+            model_name,
+            local_dir=snapshot_dir,
+            allow_patterns=["*.json", "*.safetensors", "*.txt", "tokenizer*"],
+        )
+    return snapshot_dir
+
+
+class TransformerEmbedder:
+    """Sentence embeddings from a local transformers encoder: token states mean-pooled over the attention mask."""
+
+    def __init__(self, model_name: str = RESPONSE_CACHE_MODEL, snapshot_dir: str = RESPONSE_CACHE_SNAPSHOT_DIR):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        model_path = resolve_embedder_path(model_name, snapshot_dir)
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModel.from_pretrained(model_path).eval()
+        self.dimensions = self.model.config.hidden_size
+
+    def embed(self, text: str) -> np.ndarray:
+        inputs = self.tokenizer(text, truncation=True, max_length=EMBEDDING_MAX_TOKENS, return_tensors="pt")
+        with self.torch.inference_mode():
+            states = self.model(**inputs).last_hidden_state[0]
+        mask = inputs["attention_mask"][0].unsqueeze(-1).to(states.dtype)
+        vector = ((states * mask).sum(dim=0) / mask.sum().clamp(min=1.0)).numpy().astype(np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of the words, word pairs and character trigrams of the normalized text."""
+
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def embed(self, text: str) -> np.ndarray:
+        words = normalize_text(text).split()
+        padded = f" {' '.join(words)} "
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])] + [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in features:
+            digest = zlib.crc32(feature.encode("utf-8"))
+            vector[digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def request_elapsed() -> float:
+    """Seconds the current request has run, from its trace; 0 outside a request."""
+    trace = metrics.current_trace()
+    return time.perf_counter() - trace.start if trace is not None else 0.0
+
+
+def cache_bypassed(cache_control) -> bool:
+    """Whether the Cache-Control header of a request asks for a fresh answer (no-cache or no-store)."""
+    directives = (cache_control or "").lower()
+    return "no-cache" in directives or "no-store" in directives
+
+
+def create_embedder(kind: str = RESPONSE_CACHE_EMBEDDER):
+    if kind == "hashing":
+        return HashingEmbedder()
+    if kind != "transformers":
+        raise ValueError(f"Unknown response cache embedder: {kind}")
+    return TransformerEmbedder()
+
+
+class SemanticResponseCache:
+    """
+    Answers indexed by the embedding of their question in a preallocated matrix; a lookup is one
+    matrix-vector product over the live entries. Thread-safe, with a time to live per entry and least
+    recently used eviction beyond the entry count or the memory cap.
+
+    The embedder is loaded on first use (or by `load` at startup), so importing the module is cheap.
+    """
+
+    def __init__(self, embedder_kind: str = RESPONSE_CACHE_EMBEDDER, threshold: float = RESPONSE_CACHE_THRESHOLD,
+                 max_entries: int = RESPONSE_CACHE_SIZE, ttl_seconds: float = RESPONSE_CACHE_TTL,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.embedder_kind = embedder_kind
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.embedder = None
+        self.matrix = None
+        self.entries = [None] * self.max_entries
+        self.expires_at = np.full(self.max_entries, -math.inf)
+        self.last_used = np.zeros(self.max_entries)
+        self.text_bytes = 0
+        # The question of a miss is embedded again when its answer is stored, often a few seconds later
+        self.recent_embeddings = TTLCache(max_entries=1024, ttl_seconds=300)
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0, "expirations": 0,
+                       "lookup_ms": 0.0, "latency_saved_ms": 0.0}
+
+    def load(self):
+        """Loads the embedder and allocates the index, once."""
+        if self.embedder is not None:
+            return
+        with self.load_lock:
+            if self.embedder is None:
+                start = time.perf_counter()
+                embedder = create_embedder(self.embedder_kind)
+                self.matrix = np.zeros((self.max_entries, embedder.dimensions), dtype=np.float32)
+                self.embedder = embedder
+                if self.matrix.nbytes >= self.max_bytes:
+                    logging.warning(f"The response cache index ({self.matrix.nbytes} bytes) exceeds RESPONSE_CACHE_MAX_BYTES; "
+                                    f"lower RESPONSE_CACHE_SIZE, only one answer fits")
+                logging.info(f"Response cache embedder ({self.embedder_kind}) loaded in {time.perf_counter() - start:.2f}s")
+
+    def embed(self, query: str) -> np.ndarray:
+        self.load()
+        key = normalize_text(query)
+        vector = self.recent_embeddings.get(key)
+        if vector is None:
+            vector = self.embedder.embed(query)
+            self.recent_embeddings.set(key, vector)
+        return vector
+
+    def _live(self, now: float) -> np.ndarray:
+        return self.expires_at > now
+
+    def lookup(self, query: str, bypass: bool = False):
+        """
+        Returns the cached answer of the most similar question above the threshold. The latency saved
+        by a hit is the time the cached answer took, less the time this request has run so far.
+
+        Args:
+            query (str): The user's question.
+            bypass (bool): Whether the request asked not to use the cache; it is only counted.
+
+        Returns:
+            tuple: (answer, similarity), or None on a miss or a bypass.
+        """
+        if bypass:
+            with self.lock:
+                self.counts["bypassed"] += 1
+            return None
+
+        elapsed = request_elapsed()
+        start = time.perf_counter()
+        vector = self.embed(query)
+        with self.lock:
+            now = time.monotonic()
+            live = self._live(now)
+            if not live.any():
+                return self._miss(start)
+
+            scores = self.matrix @ vector
+            scores[~live] = -1.0
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                return self._miss(start)
+
+            self.last_used[slot] = now
+            cached_query, answer, seconds = self.entries[slot]
+            self.counts["hits"] += 1
+            self.counts["lookup_ms"] += (time.perf_counter() - start) * 1000
+            self.counts["latency_saved_ms"] += max(0.0, seconds - elapsed - (time.perf_counter() - start)) * 1000
+        logging.info(f"Response cache hit ({scores[slot]:.3f}) for: {query} (cached question: {cached_query})")
+        return answer, float(scores[slot])
+
+    def _miss(self, start: float):
+        self.counts["misses"] += 1
+        self.counts["lookup_ms"] += (time.perf_counter() - start) * 1000
+        return None
+
+    def store(self, query: str, answer: str):
+        """
+        Caches the answer to a question, with the time the request took to produce it.
+        A question similar to a cached one replaces its entry.
+
+        Args:
+            query (str): The user's question.
+            answer (str): The final answer.
+        """
+        seconds = request_elapsed()
+        vector = self.embed(query)
+        size = len(query.encode("utf-8")) + len(answer.encode("utf-8"))
+        with self.lock:
+            now = time.monotonic()
+            self._expire(now)
+            live = self._live(now)
+
+            scores = self.matrix @ vector
+            scores[~live] = -1.0
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                # The first free slot, or the least recently used entry
+                free = np.flatnonzero(~live)
+                slot = int(free[0]) if len(free) else self._evict_lru()
+            else:
+                self._drop(slot)
+
+            while self.text_bytes + size + self.matrix.nbytes > self.max_bytes and self._live(now).any():
+                self._evict_lru()
+
+            self.matrix[slot] = vector
+            self.entries[slot] = (query, answer, seconds)
+            self.expires_at[slot] = now + self.ttl_seconds if self.ttl_seconds > 0 else math.inf
+            self.last_used[slot] = now
+            self.text_bytes += size
+            self.counts["stores"] += 1
+
+    def _drop(self, slot: int):
+        query, answer, _ = self.entries[slot]
+        self.text_bytes -= len(query.encode("utf-8")) + len(answer.encode("utf-8"))
+        self.entries[slot] = None
+        self.expires_at[slot] = -math.inf
+
+    def _evict_lru(self) -> int:
+        live = np.flatnonzero(self._live(time.monotonic()))
+        slot = int(live[np.argmin(self.last_used[live])])
+        self._drop(slot)
+        self.counts["evictions"] += 1
+        return slot
+
+    def _expire(self, now: float):
+        for slot in np.flatnonzero((self.expires_at <= now) & (self.expires_at > -math.inf)):
+            self._drop(int(slot))
+            self.counts["expirations"] += 1
+
+    def clear(self):
+        """Drops every cached answer and the embeddings kept for the recent questions."""
+        with self.lock:
+            for slot in np.flatnonzero(self.expires_at > -math.inf):
+                self._drop(int(slot))
+        self.recent_embeddings.clear()
+
+    def stats(self) -> dict:
+        """Returns the entry count, the memory used, the hit rate and the lookup time and latency saved in total."""
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return {
+                "entries": int(self._live(time.monotonic()).sum()),
+                "bytes": self.text_bytes + (self.matrix.nbytes if self.matrix is not None else 0),
+                "hit_rate": round(self.counts["hits"] / lookups, 4) if lookups else 0.0,
+                **{name: round(value, 1) if isinstance(value, float) else value for name, value in self.counts.items()},
+            }
+
+
+response_cache = SemanticResponseCache() if RESPONSE_CACHE else None
@@ -0,0 +1,157 @@
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from utils.web_search import search_web
+
+# Speculative web search started alongside the draft answer: "off", "heuristic" (queries that look like
+# they need fresh information) or "always"
+SEARCH_PREFETCH = os.getenv("SEARCH_PREFETCH", "off").lower()
+# Maximum number of speculative searches in flight per process; further requests are not speculated on
+SEARCH_PREFETCH_BUDGET = int(os.getenv("SEARCH_PREFETCH_BUDGET", "4"))
+
+# Queries about recent or changing facts, which the model usually cannot answer on its own
+FRESHNESS_PATTERN = re.compile(
+    r"\b(today|tonight|yesterday|tomorrow|this (week|weekend|month|year)|latest|current(ly)?|recent(ly)?|now|"
+    r"news|headlines?|price|stocks?|weather|forecast|scores?|who won|results?|release date|20[2-9]\d)\b",
+    re.IGNORECASE,
+)
+
+
+def request_id_of(config: dict):
+    """
+    Returns the id of the graph run of a node's run configuration, if any. Concurrent requests of one session
+    share its thread id, so each run gets its own request id; the thread id is the fallback without one.
+    """
+    configurable = (config or {}).get("configurable") or {}
+    return configurable.get("request_id") or configurable.get("thread_id")
+
+
+def should_prefetch(query: str) -> bool:
+    """Tells whether a search is worth starting before knowing if the draft answer needs one."""
+    if SEARCH_PREFETCH == "always":
+        return True
+    if SEARCH_PREFETCH == "heuristic":
+        return bool(FRESHNESS_PATTERN.search(query))
+    return False
+
+
+class SearchPrefetcher:
+    """
+    Runs speculative web searches keyed by the graph run, so the search agent can pick up
+    results that were fetched while the draft answer was being written.
+    """
+
+    def __init__(self, budget: int):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, budget), thread_name_prefix="search-prefetch")
+        self.slots = threading.BoundedSemaphore(max(1, budget))
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            "started": 0,
+            "skipped_budget": 0,
+            "hits": 0,
+            "wasted": 0,
+            "misses": 0,
+            "latency_saved_ms": 0.0,
+        }
+
+    def _count(self, name: str, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def _search(self, query: str, timeout: float = None):
+        start = time.perf_counter()
+        try:
+            return search_web(query, timeout), time.perf_counter() - start
+        finally:
+            self.slots.release()
+
+    def start(self, key: str, query: str, timeout: float = None) -> bool:
+        """
+        Starts a speculative search for the query when the heuristic and the budget allow it.
+
+        Args:
+            key (str): The id of the graph run the search is for.
+            query (str): The search query.
+            timeout (float): Seconds the search may take within the request budget; None without a deadline.
+                The search holds a budget slot until it ends, even once its request gave up on it.
+
+        Returns:
+            bool: Whether a search was started.
+        """
+        if not key or not should_prefetch(query) or (timeout is not None and timeout <= 0):
+            return False
+        if not self.slots.acquire(blocking=False):
+            self._count("skipped_budget")
+            return False
+
+        future = self.executor.submit(self._search, query, timeout)
+        with self.lock:
+            replaced = self.pending.get(key)
+            self.pending[key] = (query, future)
+            self.stats["started"] += 1
+            if replaced is not None:
+                self.stats["wasted"] += 1
+        logging.info(f"Prefetching web search for: {query}")
+        return True
+
+    def take(self, key: str, query: str, timeout: float = None):
+        """
+        Returns the prefetched results for the graph run, waiting for the search if it is still running,
+        at most `timeout` seconds (no limit when None).
+
+        Returns:
+            list: The search results, or None when nothing usable was prefetched.
+        """
+        with self.lock:
+            query_and_future = self.pending.pop(key, None) if key else None
+
+        if query_and_future is None or query_and_future[0] != query:
+            self._count("misses")
+            return None
+
+        waited = time.perf_counter()
+        try:
+            search_results, duration = query_and_future[1].result(timeout)
+        except FutureTimeoutError:
+            logging.warning(f"Prefetched web search still running after {timeout:.1f} s")
+            self._count("misses")
+            return None
+        except Exception as e:
+            logging.error(f"Prefetched web search failed: {e}")
+            self._count("misses")
+            return None
+        waited = time.perf_counter() - waited
+
+        # The part of the search that overlapped with the draft answer
+        saved_ms = max(0.0, duration - waited) * 1000
+        self._count("hits")
+        self._count("latency_saved_ms", saved_ms)
+        logging.info(f"Using prefetched web search results, {saved_ms:.0f} ms saved")
+        return search_results
+
+    def discard(self, key: str):
+        """Drops the prefetched search of a graph run that did not need it. A running search completes in the background."""
+        with self.lock:
+            query_and_future = self.pending.pop(key, None) if key else None
+        if query_and_future is not None:
+            self._count("wasted")
+
+    def report(self) -> dict:
+        """Hit rate (searches served from a prefetch), precision (prefetches that were used) and mean latency saved."""
+        with self.lock:
+            stats = dict(self.stats)
+        needed = stats["hits"] + stats["misses"]
+        used_or_wasted = stats["hits"] + stats["wasted"]
+        return {
+            **stats,
+            "hit_rate": stats["hits"] / needed if needed else 0.0,
+            "precision": stats["hits"] / used_or_wasted if used_or_wasted else 0.0,
+            "latency_saved_ms_per_hit": stats["latency_saved_ms"] / stats["hits"] if stats["hits"] else 0.0,
+        }
+
+
+search_prefetcher = SearchPrefetcher(SEARCH_PREFETCH_BUDGET) if SEARCH_PREFETCH != "off" else None
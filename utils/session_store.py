@@ -0,0 +1,372 @@
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.types import TASKS
+
+# Checkpointer of the chat sessions: "memory" (per worker) or "sqlite" (on disk, shared by the workers)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_MAX_MEMORY_MB = float(os.getenv("SESSION_MAX_MEMORY_MB", "256"))
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+
+# Expired sessions are purged from SQLite at most this often
+SQLITE_PURGE_INTERVAL = 60.0
+
+# Session ids sent by the clients
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_.:-]{1,128}")
+
+
+def valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer for chat sessions. Only the latest checkpoint of each thread (and its parent,
+    which LangGraph reads pending sends from) is kept, instead of one per graph step, and whole threads
+    are evicted least recently used first beyond the session count or memory cap, or once idle past the TTL.
+    """
+
+    def __init__(self, max_sessions: int, ttl_seconds: float, max_bytes: int):
+        super().__init__()
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # thread_id -> (last access, serialized bytes), least recently used first
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def _touch(self, thread_id: str, size: int = None):
+        previous = self.sessions.pop(thread_id, (0.0, 0))
+        size = previous[1] if size is None else size
+        self.sessions[thread_id] = (time.monotonic(), size)
+        self.total_bytes += size - previous[1]
+
+    def _write_keys(self, thread_id: str) -> list:
+        return [
+            (thread_id, checkpoint_ns, checkpoint_id)
+            for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items()
+            for checkpoint_id in checkpoints
+        ]
+
+    def _thread_bytes(self, thread_id: str) -> int:
+        size = 0
+        for checkpoints in self.storage.get(thread_id, {}).values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+        for key in self._write_keys(thread_id):
+            size += sum(len(write[2][1]) for write in self.writes.get(key, {}).values())
+        return size
+
+    def _expired(self, thread_id: str) -> bool:
+        return self.ttl_seconds > 0 and time.monotonic() - self.sessions[thread_id][0] > self.ttl_seconds
+
+    def _evict(self, keep: str):
+        expired = [thread_id for thread_id in self.sessions if thread_id != keep and self._expired(thread_id)]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+            self.evictions += 1
+
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            thread_id = next(iter(self.sessions))
+            if thread_id == keep:
+                break
+            self.delete_thread(thread_id)
+            self.evictions += 1
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        with self.lock:
+            # Avoids creating empty entries for unknown threads
+            if thread_id not in self.storage:
+                return None
+            if thread_id in self.sessions and self._expired(thread_id):
+                self.delete_thread(thread_id)
+                self.evictions += 1
+                return None
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self.lock:
+            if config and config["configurable"]["thread_id"] not in self.storage:
+                return iter(())
+            return iter(list(super().list(config, filter=filter, before=before, limit=limit)))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self.lock:
+            saved_config = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+
+            # Keep the new checkpoint and its parent only, with their writes
+            keep = {checkpoint["id"], config["configurable"].get("checkpoint_id")}
+            checkpoints = self.storage[thread_id][checkpoint_ns]
+            for checkpoint_id in [checkpoint_id for checkpoint_id in checkpoints if checkpoint_id not in keep]:
+                del checkpoints[checkpoint_id]
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+            self._touch(thread_id, self._thread_bytes(thread_id))
+            self._evict(keep=thread_id)
+            return saved_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self.lock:
+            super().put_writes(config, writes, task_id, task_path)
+            thread_id = config["configurable"]["thread_id"]
+            self._touch(thread_id, self._thread_bytes(thread_id))
+
+    def delete_thread(self, thread_id: str):
+        """Drops every checkpoint and write of a thread."""
+        with self.lock:
+            for key in self._write_keys(thread_id):
+                self.writes.pop(key, None)
+            self.storage.pop(thread_id, None)
+            _, size = self.sessions.pop(thread_id, (0.0, 0))
+            self.total_bytes -= size
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"sessions": len(self.sessions), "bytes": self.total_bytes, "evictions": self.evictions}
+
+
+class SqliteSaver(BaseCheckpointSaver):
+    """
+    On-disk checkpointer for chat sessions, shared by every worker of the host. Like BoundedMemorySaver
+    it only keeps the latest checkpoint of each thread and its parent, expires threads idle past the TTL
+    and drops the least recently updated ones beyond the session count.
+    """
+
+    def __init__(self, path: str, max_sessions: int, ttl_seconds: float):
+        super().__init__()
+        self.path = path
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.RLock()
+        self._connection = None
+        self._connection_pid = None
+        self._last_purge = 0.0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # One connection per process; connections must not be shared across fork
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_checkpoint_id TEXT,
+                    checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, updated_at REAL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,
+                    channel TEXT, value_type TEXT, value BLOB, task_path TEXT,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                CREATE INDEX IF NOT EXISTS checkpoints_updated_at ON checkpoints (updated_at);
+            """)
+            self._connection, self._connection_pid = connection, os.getpid()
+        return self._connection
+
+    def _writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        return self.connection.execute(
+            "SELECT task_id, channel, value_type, value, task_path, idx FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        writes = self._writes(thread_id, checkpoint_ns, checkpoint_id)
+        sends = []
+        if parent_checkpoint_id:
+            sends = sorted(
+                (w for w in self._writes(thread_id, checkpoint_ns, parent_checkpoint_id) if w[1] == TASKS),
+                key=lambda w: (w[4], w[0], w[5]),
+            )
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **self.serde.loads_typed((checkpoint_type, checkpoint)),
+                "pending_sends": [self.serde.loads_typed((w[2], w[3])) for w in sends],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            pending_writes=[(w[0], w[1], self.serde.loads_typed((w[2], w[3]))) for w in writes],
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id
+                else None
+            ),
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        query = (
+            "SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id:
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        elif self.ttl_seconds > 0:
+            query += " AND updated_at > ?"
+            params.append(time.time() - self.ttl_seconds)
+        query += " ORDER BY checkpoint_id DESC LIMIT 1"
+
+        with self.lock:
+            row = self.connection.execute(query, params).fetchone()
+            return self._to_tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        params = []
+        if config:
+            query += " WHERE thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if config and config["configurable"].get("checkpoint_ns") not in (None, checkpoint_ns):
+                    continue
+                if before and (before_id := get_checkpoint_id(before)) and row[0] >= before_id:
+                    continue
+                item = self._to_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                results.append(item)
+                if limit is not None and len(results) >= limit:
+                    break
+        return iter(results)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        c = checkpoint.copy()
+        c.pop("pending_sends")
+        checkpoint_type, checkpoint_bytes = self.serde.dumps_typed(c)
+        metadata_type, metadata_bytes = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self.lock:
+            connection = self.connection
+            connection.execute("BEGIN")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id,
+                     checkpoint_type, checkpoint_bytes, metadata_type, metadata_bytes, time.time()),
+                )
+                # Keep the new checkpoint and its parent only, with their writes
+                keep = (thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id or "")
+                for table in ("writes", "checkpoints"):
+                    connection.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (?, ?)", keep
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            self._purge()
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self.lock:
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                value_type, value_bytes = self.serde.dumps_typed(value)
+                # Special writes (negative index) replace earlier ones, regular writes are only stored once
+                self.connection.execute(
+                    f"INSERT OR {'REPLACE' if idx < 0 else 'IGNORE'} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, value_type, value_bytes, task_path),
+                )
+
+    def _purge(self):
+        """Deletes the threads idle past the TTL and the least recently updated ones beyond the session count."""
+        now = time.time()
+        if now - self._last_purge < SQLITE_PURGE_INTERVAL:
+            return
+        self._last_purge = now
+
+        stale = "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated_at) < ?"
+        overflow = "SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(updated_at) DESC LIMIT -1 OFFSET ?"
+        threads = set()
+        if self.ttl_seconds > 0:
+            threads.update(row[0] for row in self.connection.execute(stale, (now - self.ttl_seconds,)))
+        threads.update(row[0] for row in self.connection.execute(overflow, (self.max_sessions,)))
+        for thread_id in threads:
+            self.delete_thread(thread_id)
+        if threads:
+            logging.info(f"Purged {len(threads)} expired or overflowing chat sessions")
+
+    def delete_thread(self, thread_id: str):
+        """Drops every checkpoint and write of a thread."""
+        with self.lock:
+            for table in ("writes", "checkpoints"):
+                self.connection.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def stats(self) -> dict:
+        with self.lock:
+            sessions, checkpoint_bytes = self.connection.execute(
+                "SELECT COUNT(DISTINCT thread_id), TOTAL(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints"
+            ).fetchone()
+            write_bytes = self.connection.execute("SELECT TOTAL(LENGTH(value)) FROM writes").fetchone()[0]
+        return {"sessions": sessions, "bytes": int(checkpoint_bytes + write_bytes)}
+
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return self.put_writes(config, writes, task_id, task_path)
+
+    def get_next_version(self, current, channel):
+        # Same scheme as MemorySaver: increasing counter with a random suffix
+        current_v = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+
+def create_checkpointer():
+    """Creates the configured session checkpointer."""
+    if SESSION_STORE == "sqlite":
+        logging.info(f"Storing chat sessions in SQLite at {SESSION_SQLITE_PATH}")
+        return SqliteSaver(SESSION_SQLITE_PATH, SESSION_MAX_SESSIONS, SESSION_TTL)
+    if SESSION_STORE != "memory":
+        raise ValueError(f"Unknown session store: {SESSION_STORE}")
+    return BoundedMemorySaver(SESSION_MAX_SESSIONS, SESSION_TTL, int(SESSION_MAX_MEMORY_MB * 1024 * 1024))
@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+import torch
+from utils import model_loader, worker_state
+
+# Set by gunicorn.conf.py: the model is loaded in the master and shared by the forked workers
+PREFORK = os.getenv("SERVER_MODE", "").lower() == "prefork"
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+
+# Warmup run through the moderation path before the pod reports ready
+WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", "4"))
+WARMUP_ROUNDS = int(os.getenv("WARMUP_ROUNDS", "2"))
+
+WARMUP_PROMPTS = [
+    "What is the capital of France?",
+    "Write a short poem about autumn leaves falling in the park.",
+    "How do I bake bread?",
+    "Explain in a few sentences how the immune system responds to a new virus infection.",
+]
+
+# Startup progress, exposed by the /ready endpoint
+status = {"ready": False, "phase": "pending", "timings": {}, "error": None}
+
+_startup_lock = threading.Lock()
+_startup_thread = None
+
+
+def _run_phase(name: str, fn):
+    status["phase"] = name
+    start = time.perf_counter()
+    fn()
+    status["timings"][name] = round(time.perf_counter() - start, 3)
+    logging.info(f"Startup phase {name} finished in {status['timings'][name]:.2f}s")
+
+
+def warmup_moderation():
+    """
+    Runs a few moderation batches (single inputs and full batches) so that compilation, kernel
+    selection and memory allocation happen before the first real request.
+    """
+    from utils.moderation import moderate_batch
+
+    prompts = [WARMUP_PROMPTS[i % len(WARMUP_PROMPTS)] for i in range(max(1, WARMUP_BATCH_SIZE))]
+    for _ in range(WARMUP_ROUNDS):
+        moderate_batch(prompts[:1])
+        if len(prompts) > 1:
+            moderate_batch(prompts)
+
+
+def run_startup(warmup: bool = True):
+    """
+    Loads everything a request needs, phase by phase, recording how long each phase takes,
+    then marks the service ready. Failures are recorded in `status` instead of raised.
+
+    Args:
+        warmup (bool): Whether to run the warmup batches after loading.
+    """
+    from agents.graph import build_graph_runtime
+    from utils.response_cache import response_cache
+    from utils.topic_classifier import load_topic_classifier
+
+    start = time.perf_counter()
+    try:
+        status["phase"] = "load_model"
+        model_loader.ensure_model_loaded(timings=status["timings"])
+        _run_phase("topic_classifier", load_topic_classifier)
+        if response_cache is not None:
+            _run_phase("response_cache", response_cache.load)
+        _run_phase("graph_runtime", build_graph_runtime)
+        if warmup and WARMUP_ROUNDS > 0:
+            _run_phase("warmup", warmup_moderation)
+    except Exception as e:
+        logging.error(f"Startup failed during {status['phase']}: {e}", exc_info=True)
+        status["error"] = str(e)
+        status["phase"] = "failed"
+        return
+
+    status["timings"]["total"] = round(time.perf_counter() - start, 3)
+    status["phase"] = "ready"
+    status["ready"] = True
+    worker_state.mark_ready()
+    logging.info(f"Service ready. Startup timings: {status['timings']}")
+
+
+def readiness() -> dict:
+    """
+    The startup status of this worker, as reported by /ready. Under the pre-fork server the pod is ready only
+    once every worker is, since the probe and the requests land on any of them; the number ready is included.
+    """
+    ready_workers = worker_state.ready_workers()
+    report = {**status, "ready": status["ready"] and ready_workers >= worker_state.expected_workers}
+    if worker_state.WORKER_STATE_DIR:
+        report["workers"] = {"ready": ready_workers, "expected": worker_state.expected_workers}
+    return report
+
+
+def available_cpus() -> int:
+    """Number of CPUs the container may use, honouring the cgroup CPU quota when there is one."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return os.cpu_count() or 1
+
+
+def preload():
+    """
+    Loads the model weights in the pre-fork master, before any worker exists, so every worker shares
+    the same copy-on-write pages instead of loading its own copy.
+
+    The master keeps torch single-threaded and runs no forward pass: OpenMP thread pools do not
+    survive fork, so threads, the prefix cache and the warmup are all created in the workers.
+    """
+    torch.set_num_threads(1)
+    start = time.perf_counter()
+    model_loader.load_model()
+    status["timings"]["preload_model"] = round(time.perf_counter() - start, 3)
+    logging.info(f"Model weights preloaded in the master in {status['timings']['preload_model']:.2f}s")
+
+
+def configure_worker_threads(workers: int):
+    """Splits the available CPUs between the workers (TORCH_THREADS_PER_WORKER overrides it)."""
+    threads = TORCH_THREADS_PER_WORKER or max(1, available_cpus() // max(1, workers))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already fixed once inter-op work has run
+    logging.info(f"Worker {os.getpid()} using {threads} torch threads")
+
+
+def start_background_startup(warmup: bool = True) -> threading.Thread:
+    """Runs the startup phases in a background thread, once per process, so the server can answer probes meanwhile."""
+    global _startup_thread
+    with _startup_lock:
+        if _startup_thread is None:
+            _startup_thread = threading.Thread(target=run_startup, args=(warmup,), name="startup", daemon=True)
+            _startup_thread.start()
+    return _startup_thread
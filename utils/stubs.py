@@ -0,0 +1,135 @@
+import math
+import os
+import random
+import re
+import time
+import zlib
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Offline stand-ins for Bedrock (LLM_PROVIDER=stub), the search API (SEARCH_PROVIDER=stub) and Llama Guard
+# (MODEL_BACKEND=stub), for load tests and benchmarks without credentials or model weights.
+# Latencies are log-normally distributed around their mean; STUB_LATENCY_JITTER is the spread (0 = fixed).
+STUB_LATENCY_JITTER = float(os.getenv("STUB_LATENCY_JITTER", "0.3"))
+STUB_LLM_FIRST_TOKEN_MS = float(os.getenv("STUB_LLM_FIRST_TOKEN_MS", "300"))
+STUB_LLM_TOKENS_PER_SECOND = float(os.getenv("STUB_LLM_TOKENS_PER_SECOND", "80"))
+STUB_LLM_OUTPUT_TOKENS = int(os.getenv("STUB_LLM_OUTPUT_TOKENS", "60"))
+# Share of the queries whose draft answer asks for a web search
+STUB_LLM_SEARCH_RATE = float(os.getenv("STUB_LLM_SEARCH_RATE", "0.3"))
+STUB_MODERATION_LATENCY_MS = float(os.getenv("STUB_MODERATION_LATENCY_MS", "40"))
+# Share of the inputs the Llama Guard stand-in flags as unsafe
+STUB_MODERATION_UNSAFE_RATE = float(os.getenv("STUB_MODERATION_UNSAFE_RATE", "0"))
+
+FILLER_WORDS = (
+    "the answer depends on several factors including recent data local conditions and the sources "
+    "consulted so it is worth checking an official reference for the latest figures and details"
+).split()
+
+QUERY_PATTERN = re.compile(r"Answer the user: (.*)")
+
+
+def sample_latency(mean_ms: float, jitter: float = STUB_LATENCY_JITTER) -> float:
+    """A latency in seconds, log-normally distributed with the given mean."""
+    if mean_ms <= 0:
+        return 0.0
+    if jitter <= 0:
+        return mean_ms / 1000
+    return mean_ms / 1000 * math.exp(random.gauss(-jitter ** 2 / 2, jitter))
+
+
+def stable_fraction(text: str) -> float:
+    """A number in [0, 1) derived from the text, so the same input always gets the same outcome."""
+    return zlib.crc32(text.encode("utf-8")) / 2 ** 32
+
+
+def filler_text(tokens: int, seed: str) -> str:
+    """Deterministic text of about the given number of tokens."""
+    rng = random.Random(seed)
+    words = [rng.choice(FILLER_WORDS) for _ in range(max(1, int(tokens * 0.75)))]
+    return " ".join(words).capitalize() + "."
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Stand-in for ChatBedrock with Bedrock-like timing: a time to first token, then a generation rate.
+    It answers each prompt of the workflow in the expected format: the combined draft JSON (asking for
+    a web search for STUB_LLM_SEARCH_RATE of the queries), the uncertainty and topic checks, the history
+    summary and the answers.
+    """
+
+    first_token_ms: float = STUB_LLM_FIRST_TOKEN_MS
+    tokens_per_second: float = STUB_LLM_TOKENS_PER_SECOND
+    output_tokens: int = STUB_LLM_OUTPUT_TOKENS
+    search_rate: float = STUB_LLM_SEARCH_RATE
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-bedrock"
+
+    def respond(self, prompt: str) -> str:
+        match = QUERY_PATTERN.search(prompt)
+        query = match.group(1) if match else prompt
+        needs_search = stable_fraction(query) < self.search_rate
+        answer = filler_text(self.output_tokens, query)
+
+        if '"needs_search"' in prompt:
+            return f'{{"answer": "{answer}", "needs_search": {"true" if needs_search else "false"}}}'
+        if 'respond strictly with "True"' in prompt:
+            return "False"
+        if "true or false" in prompt:
+            return "true" if needs_search else "false"
+        if "Summarize the following" in prompt:
+            return filler_text(self.output_tokens // 2, prompt)
+        return answer
+
+    def _usage(self, prompt: str, text: str) -> dict:
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        prompt = messages[-1].content
+        text = self.respond(prompt)
+        time.sleep(sample_latency(self.first_token_ms) + estimate_tokens(text) / self.tokens_per_second)
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt = messages[-1].content
+        text = self.respond(prompt)
+        time.sleep(sample_latency(self.first_token_ms))
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            content = word if i == 0 else " " + word
+            time.sleep(estimate_tokens(content) / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=content))
+            if run_manager:
+                run_manager.on_llm_new_token(content, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text)))
+
+
+class StubModerationBackend:
+    """Stand-in for the Llama Guard model: one batch takes STUB_MODERATION_LATENCY_MS, whatever its size."""
+
+    device = "cpu"
+
+    def __init__(self, latency_ms: float = STUB_MODERATION_LATENCY_MS, unsafe_rate: float = STUB_MODERATION_UNSAFE_RATE):
+        self.latency_ms = latency_ms
+        self.unsafe_rate = unsafe_rate
+
+    def moderate(self, input_texts: List[str], unsafe_category: str) -> List[dict]:
+        time.sleep(sample_latency(self.latency_ms))
+        verdicts = []
+        for input_text in input_texts:
+            unsafe = stable_fraction(input_text) < self.unsafe_rate
+            verdicts.append({"allowed": "UNSAFE" if unsafe else "SAFE", "flagged_categories": [unsafe_category] if unsafe else []})
+        return verdicts
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from langgraph.constants import TAG_NOSTREAM
+from utils.llm_calls import invoke_llm
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import FeatureUnion, make_pipeline
+
+# Local civil engineering classifier; the LLM is only asked when the local model is not confident
+TOPIC_CLASSIFIER = os.getenv("TOPIC_CLASSIFIER", "local").lower()
+TOPIC_CONFIDENCE_THRESHOLD = float(os.getenv("TOPIC_CONFIDENCE_THRESHOLD", "0.7"))
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+TRAIN_PATH = DATA_DIR / "civil_engineering_train.jsonl"
+TEST_PATH = DATA_DIR / "civil_engineering_test.jsonl"
+
+classifier = None
+_classifier_lock = threading.Lock()
+
+# How many topic checks were answered locally and how many fell back to the LLM
+stats = {"local": 0, "fallback": 0}
+
+
+def load_examples(path: Path):
+    """Reads a labelled JSONL file of {"text": ..., "label": 0|1} rows."""
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [row["text"] for row in rows], [int(row["label"]) for row in rows]
+
+
+def load_topic_classifier():
+    """
+    Trains the TF-IDF + logistic regression topic classifier on the bundled labelled set, once per process.
+    Training takes a few milliseconds, so no serialized model is shipped.
+    """
+    global classifier
+    if classifier is not None:
+        return classifier
+
+    with _classifier_lock:
+        if classifier is None:
+            texts, labels = load_examples(TRAIN_PATH)
+            pipeline = make_pipeline(
+                FeatureUnion([
+                    ("words", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, stop_words="english")),
+                    ("chars", TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True)),
+                ]),
+                LogisticRegression(C=10.0, class_weight="balanced", max_iter=1000),
+            )
+            pipeline.fit(texts, labels)
+            classifier = pipeline
+            logging.info(f"Topic classifier trained on {len(texts)} examples")
+
+    return classifier
+
+
+def predict_civil_engineering(input_text: str):
+    """
+    Classifies an input with the local model.
+
+    Returns:
+        tuple: (is_civil_engineering, confidence) where confidence is the probability of the predicted class.
+    """
+    probability = load_topic_classifier().predict_proba([input_text])[0][1]
+    is_civil_engineering = probability >= 0.5
+    return is_civil_engineering, probability if is_civil_engineering else 1 - probability
+
+
+def llm_is_civil_engineering(llm, input_text: str, deadline: float = 0.0) -> bool:
+    """Asks the LLM whether the input is related to civil engineering, within the request deadline."""
+    is_civil_engineer_response = invoke_llm(llm, f"""
+        You are an AI that determines whether the given input is related to civil engineering. 
+        Civil engineering includes topics such as structural engineering, transportation, geotechnics, 
+        construction materials, water resources, infrastructure development, surveying, and urban planning.
+
+        Evaluate the following input:
+        "{input_text}"
+
+        If the input is related to civil engineering in any way, respond strictly with "True".  
+        If it is not related, respond strictly with "False".  
+        Provide no explanations, additional text, or variations in formatting.
+    """, config={"tags": [TAG_NOSTREAM]}, deadline=deadline, name="topic_check")  # Internal check, never streamed to the client
+    
+    return is_civil_engineer_response.content.strip().lower() == "true"
+
+
+def classify_civil_engineering(llm, input_text: str, deadline: float = 0.0):
+    """
+    Determines whether the input is about civil engineering, locally when the classifier is
+    confident enough (TOPIC_CONFIDENCE_THRESHOLD) and with the LLM, within the request deadline, otherwise.
+
+    Returns:
+        tuple: (is_civil_engineering, answered_by_llm). The LLM answer is not deterministic, unlike the local one.
+    """
+    if TOPIC_CLASSIFIER == "llm":
+        return llm_is_civil_engineering(llm, input_text, deadline), True
+
+    prediction, confidence = predict_civil_engineering(input_text)
+    if confidence >= TOPIC_CONFIDENCE_THRESHOLD:
+        stats["local"] += 1
+        logging.info(f"Topic classifier: civil_engineering={prediction} (confidence={confidence:.2f})")
+        return prediction, False
+
+    stats["fallback"] += 1
+    logging.info(f"Topic classifier not confident ({confidence:.2f}). Falling back to the LLM.")
+    return llm_is_civil_engineering(llm, input_text, deadline), True
+
+
+def is_civil_engineering(llm, input_text: str, deadline: float = 0.0) -> bool:
+    """Determines whether the input is about civil engineering (see classify_civil_engineering)."""
+    return classify_civil_engineering(llm, input_text, deadline)[0]
@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import requests
+from requests.adapters import HTTPAdapter
+from utils.cache import TTLCache, normalize_text
+from utils.logging_config import VERBOSE
+from utils.metrics import external_call
+from utils.stubs import filler_text, sample_latency
+
+# Load API key from environment variable
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+TAVILY_API_URL = "https://api.tavily.com"
+
+# Search provider: "tavily", or "stub" for offline runs (deterministic results, no network)
+SEARCH_PROVIDER = os.getenv("SEARCH_PROVIDER", "tavily").lower()
+# Simulated network latency of the stub provider, and approximate tokens of each of its results
+SEARCH_STUB_LATENCY_MS = float(os.getenv("SEARCH_STUB_LATENCY_MS", "0"))
+SEARCH_STUB_RESULT_TOKENS = int(os.getenv("SEARCH_STUB_RESULT_TOKENS", "150"))
+
+# Number of results requested per search
+SEARCH_MAX_RESULTS = 10
+
+# Long-lived HTTP client: pooled keep-alive connections shared by every request of the process
+SEARCH_POOL_SIZE = int(os.getenv("SEARCH_POOL_SIZE", "16"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "20"))
+
+# Cache of search results keyed on the normalized query
+SEARCH_CACHE = os.getenv("SEARCH_CACHE", "true").lower() == "true"
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+
+
+class TavilySearchClient:
+    """Tavily search API client reusing pooled connections (the LangChain tool opens a new one per call)."""
+
+    name = "tavily"
+
+    def __init__(self, api_key: str, pool_size: int = SEARCH_POOL_SIZE, timeout: float = SEARCH_TIMEOUT):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+
+    def search(self, query: str, max_results: int = SEARCH_MAX_RESULTS, timeout: float = None) -> list:
+        """Returns the results as dicts with the page url and content, like TavilySearchResults."""
+        response = self.session.post(
+            f"{TAVILY_API_URL}/search",
+            json={
+                "api_key": self.api_key,
+                "query": query,
+                "max_results": max_results,
+                "search_depth": "advanced",
+                "include_answer": False,
+                "include_raw_content": False,
+                "include_images": False,
+            },
+            timeout=min(self.timeout, timeout) if timeout is not None else self.timeout,
+        )
+        response.raise_for_status()
+        return [{"url": result["url"], "content": result["content"]} for result in response.json()["results"]]
+
+
+class StubSearchClient:
+    """Offline search provider returning deterministic results built from the query, after a simulated latency."""
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = SEARCH_STUB_LATENCY_MS, result_tokens: int = SEARCH_STUB_RESULT_TOKENS):
+        self.latency_ms = latency_ms
+        self.result_tokens = result_tokens
+
+    def search(self, query: str, max_results: int = SEARCH_MAX_RESULTS, timeout: float = None) -> list:
+        latency = sample_latency(self.latency_ms)
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub search timed out after {timeout:.1f} s")
+        time.sleep(latency)
+        slug = "-".join(normalize_text(query).split())[:60]
+        return [
+            {"url": f"https://example.com/{slug}/{i}",
+             "content": f"Stub result {i} about: {query}. {filler_text(self.result_tokens, f'{query}/{i}')}"}
+            for i in range(1, max_results + 1)
+        ]
+
+
+class SearchService:
+    """
+    Search layer shared by every request: results are cached per normalized query, and concurrent
+    identical queries are coalesced onto a single in-flight provider call.
+    """
+
+    def __init__(self, client, cache: TTLCache = None):
+        self.client = client
+        self.cache = cache
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.provider_calls = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def search(self, query: str, timeout: float = None):
+        """
+        Args:
+            query (str): The search query.
+            timeout (float): Seconds to wait for the results, within the request budget; None for the client timeout.
+
+        Returns:
+            list: The search results, or None when the search failed. Failures are not cached.
+        """
+        key = normalize_text(query)
+        # The cache is read under the lock: a leader stores its results before leaving the in-flight map,
+        # so a query that finds no in-flight search finds its results cached instead of searching again
+        with self.lock:
+            if self.cache is not None:
+                search_results = self.cache.get(key)
+                if search_results is not None:
+                    logging.info(f"Search cache hit for: {query}")
+                    return search_results
+
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+                self.provider_calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logging.info(f"Joining in-flight search for: {query}")
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                logging.warning(f"In-flight search still running after {timeout:.1f} s")
+                return None
+
+        search_results = None
+        try:
+            with external_call(self.client.name):
+                search_results = self.client.search(query, timeout=timeout)
+            logging.info("Raw Search Results: %s", search_results, extra=VERBOSE)
+            if self.cache is not None:
+                self.cache.set(key, search_results)
+        except Exception as e:
+            logging.error(f"Web search failed: {e}")
+            with self.lock:
+                self.errors += 1
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            future.set_result(search_results)
+
+        return search_results
+
+    def stats(self) -> dict:
+        """Returns the cache counters and the provider call, coalescing and error counts."""
+        cache_stats = self.cache.stats() if self.cache is not None else {}
+        with self.lock:
+            return {
+                **{f"cache_{name}": value for name, value in cache_stats.items()},
+                "provider_calls": self.provider_calls,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+            }
+
+
+def create_search_client():
+    """Creates the configured search provider client."""
+    if SEARCH_PROVIDER == "stub":
+        return StubSearchClient()
+    if SEARCH_PROVIDER != "tavily":
+        raise ValueError(f"Unknown search provider: {SEARCH_PROVIDER}")
+    return TavilySearchClient(TAVILY_API_KEY)
+
+
+search_service = SearchService(
+    create_search_client(),
+    TTLCache(max_entries=SEARCH_CACHE_SIZE, ttl_seconds=SEARCH_CACHE_TTL) if SEARCH_CACHE else None,
+)
+
+
+def search_web(query: str, timeout: float = None):
+    """
+    Runs a web search through the shared search service.
+
+    Args:
+        query (str): The search query.
+        timeout (float): Seconds to wait for the results, within the request budget; None for the client timeout.
+
+    Returns:
+        list: The search results (dicts with the page url and content), or None when the search failed.
+    """
+    return search_service.search(query, timeout)
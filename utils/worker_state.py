@@ -0,0 +1,52 @@
+import logging
+import os
+
+# Directory shared by the workers of one pre-forking server, set up by the gunicorn master (gunicorn.conf.py).
+# Each worker leaves a marker there once its startup finished, so any worker can tell whether all of them
+# did. Empty outside the pre-fork server, where the process is the only worker.
+WORKER_STATE_DIR = os.getenv("WORKER_STATE_DIR", "")
+
+READY_PREFIX = "ready."
+
+# Number of workers the master runs, set in each worker after the fork
+expected_workers = 1
+
+
+def _path(name: str) -> str:
+    return os.path.join(WORKER_STATE_DIR, name)
+
+
+def reset():
+    """Removes the files left by the workers of an earlier server; called by the master before forking."""
+    if not WORKER_STATE_DIR:
+        return
+    os.makedirs(WORKER_STATE_DIR, exist_ok=True)
+    for name in os.listdir(WORKER_STATE_DIR):
+        try:
+            os.remove(_path(name))
+        except OSError as e:
+            logging.warning(f"Could not remove the stale worker state {name}: {e}")
+
+
+def mark_ready():
+    """Records that this worker finished its startup."""
+    if WORKER_STATE_DIR:
+        open(_path(f"{READY_PREFIX}{os.getpid()}"), "w").close()
+
+
+def ready_workers() -> int:
+    """Number of workers that finished their startup and are still running."""
+    if not WORKER_STATE_DIR:
+        return expected_workers
+    try:
+        return sum(name.startswith(READY_PREFIX) for name in os.listdir(WORKER_STATE_DIR))
+    except OSError:
+        return 0
+
+
+def forget_worker(pid: int):
+    """Drops the readiness marker of an exited worker; called by the master, so a replacement has to warm up again."""
+    try:
+        os.remove(_path(f"{READY_PREFIX}{pid}"))
+    except FileNotFoundError:
+        pass